@@ -0,0 +1,241 @@
+# async_kinopoisk_api.py
+
+import asyncio
+import time
+from collections import deque
+
+import httpx
+
+from api.cache import make_cache_key
+from api.pagination import plan_pages, merge_pages
+from api.singleflight import AsyncSingleFlight
+from api.kinopoisk_api import (
+    BaseKinopoiskAPI,
+    SEARCH_PATH,
+    MOVIE_PATH,
+    name_params,
+    rating_params,
+    budget_params,
+    catalog_params,
+)
+from utils.metrics import api_errors, api_latency
+
+
+class AsyncKinopoiskAPI(BaseKinopoiskAPI):
+    def __init__(self, api_key, pool_size=10, **kwargs):
+        """
+        Асинхронный клиент API Кинопоиска. Повторяет методы KinopoiskAPI,
+        но не занимает поток на время ожидания ответа.
+
+        :param api_key: API-ключ Кинопоиска
+        :param pool_size: Максимальное количество соединений в пуле
+        :param kwargs: Остальные параметры BaseKinopoiskAPI
+        """
+        super().__init__(api_key, **kwargs)
+        self.client = httpx.AsyncClient(
+            base_url=self.base_url,
+            headers=self.headers,
+            timeout=httpx.Timeout(self.read_timeout, connect=self.connect_timeout),
+            limits=httpx.Limits(
+                max_connections=pool_size, max_keepalive_connections=pool_size
+            ),
+        )
+        # Одинаковые одновременные запросы выполняются один раз
+        self.flights = AsyncSingleFlight()
+
+    @property
+    def requests_saved(self):
+        """
+        Сколько запросов к API не понадобилось благодаря объединению.
+        """
+        return self.flights.saved
+
+    async def aclose(self):
+        """
+        Закрывает все соединения пула и дисковый кэш.
+        """
+        await self.client.aclose()
+        if self.persistent_cache is not None:
+            # Ждёт завершения фоновой очистки
+            await asyncio.to_thread(self.persistent_cache.close)
+
+    async def _fetch(self, path, params):
+        """
+        Выполняет GET-запрос к API и возвращает список фильмов из поля docs.
+        Повторные запросы с теми же параметрами отдаются из кэша, а
+        одновременные одинаковые запросы объединяются в один.
+        Ошибки запроса пробрасываются вызывающему коду.
+        """
+        key = make_cache_key(path, params)
+        docs = self._memory_lookup(key)
+        if docs is not None:
+            return docs
+        return await self.flights.do(key, lambda: self._request(key, path, params))
+
+    async def _request(self, key, path, params):
+        # Дисковый кэш (SQLite и zlib) работает в отдельном потоке, чтобы не
+        # останавливать цикл событий, в том числе пока идёт его очистка
+        if self.persistent_cache is not None:
+            docs = await asyncio.to_thread(self._disk_lookup, key, path)
+            if docs is not None:
+                return docs
+
+        docs = await self._get_docs(path, params)
+
+        self._memory_store(key, path, docs)
+        if self.persistent_cache is not None:
+            await asyncio.to_thread(self._disk_store, key, path, docs)
+        return docs
+
+    async def fetch_catalog_page(self, page, limit=250):
+        """
+        Загружает страницу каталога для локальной синхронизации.
+        Ответ не кэшируется, ошибки пробрасываются вызывающему коду.
+        """
+        return await self._get_docs(MOVIE_PATH, catalog_params(page, limit))
+
+    async def _get_docs(self, path, params):
+        """
+        Выполняет запрос и возвращает поле docs ответа, записывая время и
+        ошибки запроса в метрики. Ответ не в формате JSON (например,
+        HTML-страница ошибки прокси) считается ошибкой запроса.
+        """
+        started = time.monotonic()
+        try:
+            response = await self.client.get(path, params=params)
+            response.raise_for_status()  # Проверка успешности запроса
+            try:
+                docs = response.json().get("docs", [])
+            except ValueError as e:
+                raise httpx.DecodingError(
+                    f"Некорректный JSON в ответе API: {e}", request=response.request
+                ) from e
+        except httpx.HTTPError:
+            api_errors.labels(path).inc()
+            raise
+        finally:
+            api_latency.labels(path).since(started)
+        return docs
+
+    async def _get(self, path, params):
+        """
+        Возвращает фильмы для params. Если limit больше page_size, выборка
+        загружается параллельно (не более max_concurrency страниц за раз);
+        при ошибке одной из страниц возвращаются результаты остальных.
+        """
+        page, limit = params["page"], params["limit"]
+        if limit <= self.page_size:
+            try:
+                return await self._fetch(path, params)
+            except httpx.HTTPError as e:
+                print(f"Ошибка при запросе к API Кинопоиска: {e}")
+                return []
+
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+
+        async def fetch_page(api_page):
+            async with semaphore:
+                return await self._fetch(path, self._page_params(params, api_page))
+
+        api_pages = plan_pages(page, limit, self.page_size)
+        results = await asyncio.gather(
+            *(fetch_page(api_page) for api_page in api_pages),
+            return_exceptions=True,
+        )
+        for result in results:
+            if isinstance(result, httpx.HTTPError):
+                print(f"Ошибка при запросе к API Кинопоиска: {result}")
+            elif isinstance(result, BaseException):
+                raise result
+        return merge_pages(api_pages, results, page, limit, self.page_size)
+
+    async def _stream(self, path, params, count):
+        """
+        Асинхронно отдаёт до count фильмов по мере загрузки страниц API.
+
+        Сначала запрашивается только первая страница; если она заполнена
+        целиком, следующие страницы загружаются с опережением, но не более
+        max_concurrency одновременно. Фильмы отдаются в исходном порядке,
+        поэтому первые результаты доступны сразу после первой страницы.
+        """
+        api_pages = iter(plan_pages(1, count, self.page_size))
+        in_flight = deque()
+
+        def schedule(window):
+            while len(in_flight) < window:
+                api_page = next(api_pages, None)
+                if api_page is None:
+                    return
+                page_params = self._stream_params(params, api_page, count)
+                in_flight.append(asyncio.create_task(self._fetch(path, page_params)))
+
+        seen_ids = set()
+        emitted = 0
+        schedule(1)
+        try:
+            while in_flight:
+                try:
+                    docs = await in_flight.popleft()
+                except httpx.HTTPError as e:
+                    print(f"Ошибка при запросе к API Кинопоиска: {e}")
+                    schedule(self.max_concurrency)
+                    continue
+                if len(docs) < min(count, self.page_size):
+                    # Результаты закончились, дальше загружать нечего
+                    for task in in_flight:
+                        task.cancel()
+                    in_flight.clear()
+                else:
+                    schedule(self.max_concurrency)
+                for doc in docs:
+                    movie_id = doc.get("id")
+                    if movie_id is not None:
+                        if movie_id in seen_ids:
+                            continue
+                        seen_ids.add(movie_id)
+                    yield doc
+                    emitted += 1
+                    if emitted >= count:
+                        return
+        finally:
+            for task in in_flight:
+                task.cancel()
+
+    def stream_movies_by_name(self, query, count):
+        return self._stream(SEARCH_PATH, name_params(query), count)
+
+    def stream_movies_by_rating(self, min_rating, max_rating, genre, count):
+        return self._stream(
+            MOVIE_PATH, rating_params(min_rating, max_rating, genre), count
+        )
+
+    def stream_movies_by_budget(self, budget_range, genre, count):
+        return self._stream(MOVIE_PATH, budget_params(budget_range, genre), count)
+
+    # Одна страница результатов (limit не больше page_size) для карусели.
+    # В отличие от search_movies_*, ошибки API пробрасываются, чтобы их
+    # можно было отличить от конца результатов.
+
+    async def fetch_movies_by_name(self, query, page, limit):
+        return await self._fetch(SEARCH_PATH, name_params(query, page, limit))
+
+    async def fetch_movies_by_rating(self, min_rating, max_rating, genre, page, limit):
+        params = rating_params(min_rating, max_rating, genre, page, limit)
+        return await self._fetch(MOVIE_PATH, params)
+
+    async def fetch_movies_by_budget(self, budget_range, genre, page, limit):
+        params = budget_params(budget_range, genre, page, limit)
+        return await self._fetch(MOVIE_PATH, params)
+
+    async def search_movies_by_name(self, query, page=1, limit=10):
+        return await self._get(SEARCH_PATH, name_params(query, page, limit))
+
+    async def search_movies_by_rating(
+        self, min_rating, max_rating, genre=None, page=1, limit=10
+    ):
+        params = rating_params(min_rating, max_rating, genre, page, limit)
+        return await self._get(MOVIE_PATH, params)
+
+    async def search_movies_by_budget(self, budget_range, genre=None, page=1, limit=10):
+        params = budget_params(budget_range, genre, page, limit)
+        return await self._get(MOVIE_PATH, params)
@@ -0,0 +1,140 @@
+# cache.py
+
+import json
+import threading
+import time
+from collections import OrderedDict
+
+# Время жизни записей по умолчанию для каждого эндпоинта (секунды).
+# Поиск по названию меняется редко, выборки по рейтингу и бюджету — чаще.
+DEFAULT_TTLS = {
+    "/v1.4/movie/search": 6 * 60 * 60,
+    "/v1.4/movie": 60 * 60,
+}
+
+
+def make_cache_key(path, params):
+    """
+    Строит нормализованный ключ кэша из эндпоинта и параметров запроса.
+
+    Параметры сортируются, строки приводятся к нижнему регистру и
+    очищаются от лишних пробелов, поэтому «Матрица» и « матрица »
+    попадают в одну запись.
+
+    :param path: Путь эндпоинта API (например, '/v1.4/movie')
+    :param params: Словарь параметров запроса
+    :return: Строковый ключ
+    """
+    normalized = {}
+    for name, value in params.items():
+        if value is None:
+            continue
+        if isinstance(value, str):
+            value = " ".join(value.split()).lower()
+        normalized[name] = value
+    return f"{path}?{json.dumps(normalized, sort_keys=True, ensure_ascii=False)}"
+
+
+class ResponseCache:
+    """
+    Потокобезопасный in-memory кэш ответов API с TTL и LRU-вытеснением
+    по количеству записей и приблизительному объёму в байтах.
+    """
+
+    def __init__(
+        self, max_entries=1000, max_bytes=32 * 1024 * 1024, ttls=None, default_ttl=600
+    ):
+        """
+        :param max_entries: Максимальное количество записей
+        :param max_bytes: Максимальный суммарный размер записей (байты)
+        :param ttls: Словарь {эндпоинт: TTL в секундах}
+        :param default_ttl: TTL для эндпоинтов, отсутствующих в ttls
+        """
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttls = dict(DEFAULT_TTLS if ttls is None else ttls)
+        self.default_ttl = default_ttl
+
+        # key -> (expires_at, size, value)
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._bytes = 0
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def ttl_for(self, path):
+        return self.ttls.get(path, self.default_ttl)
+
+    def get(self, key):
+        """
+        Возвращает закэшированное значение или None, если записи нет
+        или её срок жизни истёк.
+        """
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            expires_at, size, value = entry
+            if expires_at <= now:
+                del self._entries[key]
+                self._bytes -= size
+                self.expirations += 1
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key, path, value, ttl=None):
+        """
+        Сохраняет ответ эндпоинта path под ключом key.
+
+        :param ttl: Срок жизни записи, если он меньше TTL эндпоинта
+            (например, остаток срока записи из дискового кэша)
+        """
+        ttl = self.ttl_for(path) if ttl is None else min(ttl, self.ttl_for(path))
+        if ttl <= 0:
+            return
+        size = _approximate_size(value)
+        if size > self.max_bytes:
+            return  # Слишком большой ответ не кэшируем вовсе
+        expires_at = time.monotonic() + ttl
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._bytes -= old[1]
+            self._entries[key] = (expires_at, size, value)
+            self._bytes += size
+            while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                _, (_, evicted_size, _) = self._entries.popitem(last=False)
+                self._bytes -= evicted_size
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self):
+        """
+        Возвращает счётчики кэша для отладки и мониторинга.
+        """
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+            }
+
+
+def _approximate_size(value):
+    # Размер сериализованного JSON — достаточно точная оценка для лимита памяти
+    return len(json.dumps(value, ensure_ascii=False).encode("utf-8"))
@@ -0,0 +1,80 @@
+# catalog_sync.py
+
+import asyncio
+import time
+
+
+class CatalogSync:
+    """
+    Периодическая синхронизация локального каталога (MovieCatalog) с API.
+
+    Страницы загружаются последовательно, чтобы не расходовать лимит
+    запросов к API всплеском. Пока синхронизация идёт, каталог отвечает
+    данными прошлой синхронизации; если она прервалась, каталог остаётся
+    прежним и синхронизация повторяется через retry_interval.
+    """
+
+    def __init__(
+        self, api_client, catalog, pages=40, page_size=250, interval=24 * 60 * 60
+    ):
+        """
+        :param api_client: Асинхронный клиент API (AsyncKinopoiskAPI)
+        :param catalog: Локальный каталог (MovieCatalog)
+        :param pages: Сколько страниц каталога загружать
+        :param page_size: Фильмов на странице (не больше 250)
+        :param interval: Период синхронизации (секунды)
+        """
+        self.api_client = api_client
+        self.catalog = catalog
+        self.pages = pages
+        self.page_size = page_size
+        self.interval = interval
+        self.retry_interval = min(interval, 15 * 60)
+        self._task = None
+
+    async def start(self):
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+    async def sync(self):
+        """
+        Загружает каталог целиком и заменяет им локальную копию.
+
+        :return: Количество загруженных фильмов
+        """
+        synced_at = int(time.time())
+        loaded = 0
+        for page in range(1, self.pages + 1):
+            docs = await self.api_client.fetch_catalog_page(page, self.page_size)
+            await asyncio.to_thread(self.catalog.store_page, docs, synced_at)
+            loaded += len(docs)
+            if len(docs) < self.page_size:
+                break
+        await asyncio.to_thread(self.catalog.finish_sync, synced_at)
+        print(f"Каталог фильмов синхронизирован: {loaded} фильмов")
+        return loaded
+
+    def _next_sync_in(self):
+        if self.catalog.synced_at is None:
+            return 0
+        return max(0, self.catalog.synced_at + self.interval - time.time())
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self._next_sync_in())
+            try:
+                await self.sync()
+            except Exception as e:
+                # Любая ошибка (в том числе в данных API) не должна
+                # останавливать синхронизацию насовсем
+                print(f"Ошибка при синхронизации каталога фильмов: {e}")
+                await asyncio.sleep(self.retry_interval)
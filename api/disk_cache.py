@@ -0,0 +1,174 @@
+# disk_cache.py
+
+import json
+import sqlite3
+import threading
+import time
+import zlib
+
+from api.cache import DEFAULT_TTLS
+
+
+class PersistentResponseCache:
+    """
+    Кэш ответов API в отдельном файле SQLite, переживающий перезапуски бота.
+
+    Ответы хранятся в виде сжатого JSON. Просроченные записи и записи сверх
+    лимита размера удаляются фоновым потоком, который также возвращает
+    освободившееся место на диске.
+    """
+
+    def __init__(
+        self,
+        path="api_cache.db",
+        max_bytes=256 * 1024 * 1024,
+        ttls=None,
+        default_ttl=600,
+        vacuum_interval=600,
+    ):
+        """
+        :param path: Путь к файлу базы кэша
+        :param max_bytes: Максимальный суммарный размер сжатых ответов (байты)
+        :param ttls: Словарь {эндпоинт: TTL в секундах}
+        :param default_ttl: TTL для эндпоинтов, отсутствующих в ttls
+        :param vacuum_interval: Период фоновой очистки (секунды)
+        """
+        self.path = path
+        self.max_bytes = max_bytes
+        self.ttls = dict(DEFAULT_TTLS if ttls is None else ttls)
+        self.default_ttl = default_ttl
+        self.vacuum_interval = vacuum_interval
+
+        self.hits = 0
+        self.misses = 0
+
+        # Одно соединение на процесс; доступ к нему сериализуется блокировкой
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._initialize()
+
+        self._stop_event = threading.Event()
+        self._vacuum_thread = threading.Thread(
+            target=self._vacuum_loop, name="api-cache-vacuum", daemon=True
+        )
+        self._vacuum_thread.start()
+
+    def _initialize(self):
+        with self._lock:
+            # auto_vacuum действует только если задан до создания таблиц
+            self._conn.execute("PRAGMA auto_vacuum = INCREMENTAL")
+            self._conn.execute("PRAGMA journal_mode = WAL")
+            self._conn.execute("PRAGMA synchronous = NORMAL")
+            self._conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS api_cache (
+                    key TEXT PRIMARY KEY,
+                    payload BLOB NOT NULL,
+                    size INTEGER NOT NULL,
+                    expires_at REAL NOT NULL
+                ) WITHOUT ROWID
+            """
+            )
+            self._conn.execute(
+                "CREATE INDEX IF NOT EXISTS idx_api_cache_expires "
+                "ON api_cache (expires_at)"
+            )
+            self._conn.commit()
+
+    def ttl_for(self, path):
+        return self.ttls.get(path, self.default_ttl)
+
+    def get(self, key):
+        """
+        Возвращает закэшированный список docs или None.
+        """
+        entry = self.get_entry(key)
+        return None if entry is None else entry[0]
+
+    def get_entry(self, key):
+        """
+        Возвращает (docs, сколько секунд записи осталось жить) или None.
+        """
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT payload, expires_at FROM api_cache "
+                "WHERE key = ? AND expires_at > ?",
+                (key, now),
+            ).fetchone()
+        if row is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return json.loads(zlib.decompress(row[0])), row[1] - now
+
+    def set(self, key, path, value):
+        """
+        Сохраняет ответ эндпоинта path под ключом key.
+        """
+        ttl = self.ttl_for(path)
+        if ttl <= 0:
+            return
+        payload = zlib.compress(
+            json.dumps(value, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+        )
+        with self._lock:
+            self._conn.execute(
+                """
+                INSERT OR REPLACE INTO api_cache (key, payload, size, expires_at)
+                VALUES (?, ?, ?, ?)
+            """,
+                (key, payload, len(payload), time.time() + ttl),
+            )
+            self._conn.commit()
+
+    def vacuum(self):
+        """
+        Удаляет просроченные записи, ужимает кэш до max_bytes (первыми
+        удаляются записи, которые истекают раньше) и освобождает место в файле.
+        """
+        with self._lock:
+            self._conn.execute(
+                "DELETE FROM api_cache WHERE expires_at <= ?", (time.time(),)
+            )
+            total = self._conn.execute(
+                "SELECT COALESCE(SUM(size), 0) FROM api_cache"
+            ).fetchone()[0]
+            if total > self.max_bytes:
+                excess = total - self.max_bytes
+                keys = []
+                for key, size in self._conn.execute(
+                    "SELECT key, size FROM api_cache ORDER BY expires_at"
+                ):
+                    keys.append((key,))
+                    excess -= size
+                    if excess <= 0:
+                        break
+                self._conn.executemany("DELETE FROM api_cache WHERE key = ?", keys)
+            self._conn.commit()
+            self._conn.execute("PRAGMA incremental_vacuum").fetchall()
+
+    def _vacuum_loop(self):
+        while not self._stop_event.wait(self.vacuum_interval):
+            try:
+                self.vacuum()
+            except sqlite3.Error as e:
+                print(f"Ошибка при очистке кэша API: {e}")
+
+    def stats(self):
+        with self._lock:
+            entries, size = self._conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM api_cache"
+            ).fetchone()
+        return {
+            "entries": entries,
+            "bytes": size,
+            "hits": self.hits,
+            "misses": self.misses,
+        }
+
+    def close(self):
+        self._stop_event.set()
+        self._vacuum_thread.join()
+        with self._lock:
+            self._conn.close()
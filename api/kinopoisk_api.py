@@ -1,67 +1,308 @@
 # kinopoisk_api.py
 
+import time
+from concurrent.futures import ThreadPoolExecutor
+
 import requests
+from requests.adapters import HTTPAdapter
+
+from api.cache import make_cache_key
+from api.pagination import plan_pages, merge_pages
+from api.singleflight import SingleFlight
+from utils.metrics import api_errors, api_latency
+
+BASE_URL = "https://api.kinopoisk.dev"
+SEARCH_PATH = "/v1.4/movie/search"
+MOVIE_PATH = "/v1.4/movie"
+
+
+def name_params(query, page=1, limit=10):
+    return {"query": query, "page": page, "limit": limit}
+
+
+def rating_params(min_rating, max_rating, genre=None, page=1, limit=10):
+    params = {
+        "rating.kp": f"{min_rating}-{max_rating}",
+        "page": page,
+        "limit": limit,
+    }
+    if genre:
+        params["genres.name"] = genre  # Передаём один жанр
+    return params
+
+
+def budget_params(budget_range, genre=None, page=1, limit=10):
+    params = {
+        "budget.value": budget_range,
+        "page": page,
+        "limit": limit,
+    }
+    if genre:
+        params["genres.name"] = genre  # Передаём один жанр
+    return params
+
+
+def catalog_params(page=1, limit=250):
+    # Для локального каталога загружаются самые популярные фильмы
+    return {
+        "page": page,
+        "limit": limit,
+        "sortField": "votes.kp",
+        "sortType": "-1",
+        "notNullFields": "rating.kp",
+    }
+
 
+def _parse_docs(response):
+    # Ответ не в формате JSON (например, HTML-страница ошибки прокси)
+    # считается ошибкой запроса, как и ошибочный HTTP-статус
+    try:
+        return response.json().get("docs", [])
+    except ValueError as e:
+        raise requests.exceptions.InvalidJSONError(
+            f"Некорректный JSON в ответе API: {e}", response=response
+        ) from e
 
-class KinopoiskAPI:
-    def __init__(self, api_key):
+
+class BaseKinopoiskAPI:
+    """
+    Общая часть синхронного и асинхронного клиентов: заголовки,
+    таймауты и двухуровневый кэш ответов (память, затем диск).
+    """
+
+    def __init__(
+        self,
+        api_key,
+        connect_timeout=3.05,
+        read_timeout=10.0,
+        headers=None,
+        cache=None,
+        persistent_cache=None,
+        page_size=50,
+        max_concurrency=4,
+    ):
+        """
+        :param api_key: API-ключ Кинопоиска
+        :param connect_timeout: Таймаут установки соединения (секунды)
+        :param read_timeout: Таймаут чтения ответа (секунды)
+        :param headers: Дополнительные заголовки для всех запросов
+        :param cache: Кэш ответов (ResponseCache) или None, чтобы не кэшировать
+        :param persistent_cache: Дисковый кэш (PersistentResponseCache) или None
+        :param page_size: Размер одной страницы, запрашиваемой у API
+        :param max_concurrency: Сколько страниц одного поиска загружать параллельно
+        """
         self.api_key = api_key
-        self.base_url = "https://api.kinopoisk.dev"
+        self.base_url = BASE_URL
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.cache = cache
+        self.persistent_cache = persistent_cache
+        self.page_size = page_size
+        self.max_concurrency = max_concurrency
 
-    def search_movies_by_name(self, query, page=1, limit=10):
-        url = f"{self.base_url}/v1.4/movie/search"
-        headers = {"X-API-KEY": self.api_key, "accept": "application/json"}
-        params = {"query": query, "page": page, "limit": limit}
+        # Заголовки по умолчанию задаются один раз для всех запросов
+        self.headers = {"X-API-KEY": self.api_key, "accept": "application/json"}
+        if headers:
+            self.headers.update(headers)
+
+    def _cache_lookup(self, key, path):
+        """
+        Ищет ответ сначала в памяти, затем на диске.
+        Найденное на диске поднимается в кэш в памяти.
+        """
+        docs = self._memory_lookup(key)
+        if docs is not None:
+            return docs
+        return self._disk_lookup(key, path)
+
+    def _memory_lookup(self, key):
+        if self.cache is None:
+            return None
+        return self.cache.get(key)
+
+    def _disk_lookup(self, key, path):
+        if self.persistent_cache is None:
+            return None
+        entry = self.persistent_cache.get_entry(key)
+        if entry is None:
+            return None
+        docs, ttl = entry
+        if self.cache is not None:
+            # В памяти запись живёт не дольше, чем осталось на диске
+            self.cache.set(key, path, docs, ttl=ttl)
+        return docs
+
+    def _cache_store(self, key, path, docs):
+        self._memory_store(key, path, docs)
+        self._disk_store(key, path, docs)
+
+    def _memory_store(self, key, path, docs):
+        if self.cache is not None:
+            self.cache.set(key, path, docs)
+
+    def _disk_store(self, key, path, docs):
+        if self.persistent_cache is not None:
+            self.persistent_cache.set(key, path, docs)
+
+    def _page_params(self, params, api_page):
+        return {**params, "page": api_page, "limit": self.page_size}
+
+    def _stream_params(self, params, api_page, count):
+        # Небольшие выборки запрашиваются одной страницей ровно нужного размера
+        if count <= self.page_size:
+            return {**params, "page": 1, "limit": count}
+        return self._page_params(params, api_page)
+
+
+class KinopoiskAPI(BaseKinopoiskAPI):
+    def __init__(self, api_key, pool_size=10, **kwargs):
+        """
+        Синхронный клиент API Кинопоиска с общим пулом keep-alive соединений.
+
+        :param api_key: API-ключ Кинопоиска
+        :param pool_size: Максимальное количество соединений в пуле
+        :param kwargs: Остальные параметры BaseKinopoiskAPI
+        """
+        super().__init__(api_key, **kwargs)
+        self.timeout = (self.connect_timeout, self.read_timeout)
+
+        # Сессия переиспользует TCP/TLS-соединения между запросами.
+        # pool_block=True не даёт потокам открывать соединения сверх пула.
+        self.session = requests.Session()
+        self.session.headers.update(self.headers)
+        adapter = HTTPAdapter(
+            pool_connections=1, pool_maxsize=pool_size, pool_block=True
+        )
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+        # Одинаковые одновременные запросы выполняются один раз
+        self.flights = SingleFlight()
+
+        # Потоки для параллельной загрузки страниц больших выборок
+        self.executor = ThreadPoolExecutor(
+            max_workers=self.max_concurrency, thread_name_prefix="kinopoisk-page"
+        )
+
+    def close(self):
+        """
+        Закрывает все соединения пула и дисковый кэш.
+        """
+        self.executor.shutdown(wait=True)
+        self.session.close()
+        if self.persistent_cache is not None:
+            self.persistent_cache.close()
+
+    @property
+    def requests_saved(self):
+        """
+        Сколько запросов к API не понадобилось благодаря объединению.
+        """
+        return self.flights.saved
+
+    def _fetch(self, path, params):
+        """
+        Выполняет GET-запрос к API и возвращает список фильмов из поля docs.
+        Повторные запросы с теми же параметрами отдаются из кэша, а
+        одновременные одинаковые запросы объединяются в один.
+        Ошибки запроса пробрасываются вызывающему коду.
+        """
+        key = make_cache_key(path, params)
+        docs = self._cache_lookup(key, path)
+        if docs is not None:
+            return docs
+        return self.flights.do(key, lambda: self._request(key, path, params))
+
+    def _request(self, key, path, params):
+        url = f"{self.base_url}{path}"
+        started = time.monotonic()
         try:
-            response = requests.get(url, headers=headers, params=params)
+            response = self.session.get(url, params=params, timeout=self.timeout)
             response.raise_for_status()  # Проверка успешности запроса
-            print(f"Запрос к API: {response.url}")
-            data = response.json()
-            return data.get("docs", [])
-        except requests.exceptions.RequestException as e:
-            print(f"Ошибка при запросе к API Кинопоиска: {e}")
-            return []
+            docs = _parse_docs(response)
+        except requests.exceptions.RequestException:
+            api_errors.labels(path).inc()
+            raise
+        finally:
+            api_latency.labels(path).since(started)
+
+        self._cache_store(key, path, docs)
+        return docs
+
+    def _get(self, path, params):
+        """
+        Возвращает фильмы для params. Если limit больше page_size, выборка
+        загружается параллельно страницами по page_size; при ошибке одной из
+        страниц возвращаются результаты остальных.
+        """
+        page, limit = params["page"], params["limit"]
+        if limit <= self.page_size:
+            try:
+                return self._fetch(path, params)
+            except requests.exceptions.RequestException as e:
+                print(f"Ошибка при запросе к API Кинопоиска: {e}")
+                return []
+
+        api_pages = plan_pages(page, limit, self.page_size)
+        futures = [
+            self.executor.submit(self._fetch, path, self._page_params(params, api_page))
+            for api_page in api_pages
+        ]
+        results = []
+        for future in futures:
+            try:
+                results.append(future.result())
+            except requests.exceptions.RequestException as e:
+                print(f"Ошибка при запросе к API Кинопоиска: {e}")
+                results.append(e)
+        return merge_pages(api_pages, results, page, limit, self.page_size)
+
+    def _stream(self, path, params, count):
+        """
+        Лениво отдаёт до count фильмов, загружая страницы API по одной,
+        только когда предыдущая уже обработана.
+        """
+        seen_ids = set()
+        emitted = 0
+        for api_page in plan_pages(1, count, self.page_size):
+            try:
+                docs = self._fetch(path, self._stream_params(params, api_page, count))
+            except requests.exceptions.RequestException as e:
+                print(f"Ошибка при запросе к API Кинопоиска: {e}")
+                continue
+            for doc in docs:
+                movie_id = doc.get("id")
+                if movie_id is not None:
+                    if movie_id in seen_ids:
+                        continue
+                    seen_ids.add(movie_id)
+                yield doc
+                emitted += 1
+                if emitted >= count:
+                    return
+            if len(docs) < min(count, self.page_size):
+                return  # Результаты закончились
+
+    def stream_movies_by_name(self, query, count):
+        return self._stream(SEARCH_PATH, name_params(query), count)
+
+    def stream_movies_by_rating(self, min_rating, max_rating, genre, count):
+        return self._stream(
+            MOVIE_PATH, rating_params(min_rating, max_rating, genre), count
+        )
+
+    def stream_movies_by_budget(self, budget_range, genre, count):
+        return self._stream(MOVIE_PATH, budget_params(budget_range, genre), count)
+
+    def search_movies_by_name(self, query, page=1, limit=10):
+        return self._get(SEARCH_PATH, name_params(query, page, limit))
 
     def search_movies_by_rating(
         self, min_rating, max_rating, genre=None, page=1, limit=10
     ):
-        url = f"{self.base_url}/v1.4/movie"
-        headers = {"X-API-KEY": self.api_key, "accept": "application/json"}
-        params = {
-            "rating.kp": f"{min_rating}-{max_rating}",
-            "page": page,
-            "limit": limit,
-        }
-        if genre:
-            params["genres.name"] = genre  # Передаём один жанр
-        try:
-            response = requests.get(url, headers=headers, params=params)
-            response.raise_for_status()
-            # Для отладки, вывести полный URL запроса
-            print(f"Запрос к API: {response.url}")
-            data = response.json()
-            return data.get("docs", [])
-        except requests.exceptions.RequestException as e:
-            print(f"Ошибка при запросе к API Кинопоиска: {e}")
-            return []
+        params = rating_params(min_rating, max_rating, genre, page, limit)
+        return self._get(MOVIE_PATH, params)
 
     def search_movies_by_budget(self, budget_range, genre=None, page=1, limit=10):
-        url = f"{self.base_url}/v1.4/movie"
-        headers = {"X-API-KEY": self.api_key, "accept": "application/json"}
-        params = {
-            "budget.value": budget_range,
-            "page": page,
-            "limit": limit,
-        }
-        if genre:
-            params["genres.name"] = genre  # Передаём один жанр
-        try:
-            response = requests.get(url, headers=headers, params=params)
-            response.raise_for_status()
-            # Для отладки, вывести полный URL запроса
-            print(f"Запрос к API: {response.url}")
-            data = response.json()
-            return data.get("docs", [])
-        except requests.exceptions.RequestException as e:
-            print(f"Ошибка при запросе к API Кинопоиска: {e}")
-            return []
+        params = budget_params(budget_range, genre, page, limit)
+        return self._get(MOVIE_PATH, params)
@@ -0,0 +1,50 @@
+# pagination.py
+
+
+def plan_pages(page, limit, page_size):
+    """
+    Разбивает логическую страницу (page, limit) на страницы API фиксированного
+    размера page_size.
+
+    :param page: Номер логической страницы (с 1)
+    :param limit: Размер логической страницы
+    :param page_size: Размер страницы, запрашиваемой у API
+    :return: Список номеров страниц API, покрывающих нужный диапазон
+    """
+    start = (page - 1) * limit
+    first = start // page_size + 1
+    last = (start + limit - 1) // page_size + 1
+    return list(range(first, last + 1))
+
+
+def merge_pages(api_pages, results, page, limit, page_size):
+    """
+    Склеивает ответы страниц API в один список, сохраняя порядок,
+    отбрасывая дубликаты по id и пропуская страницы, которые не удалось
+    получить (для них в results передаётся исключение).
+
+    :param api_pages: Номера запрошенных страниц API
+    :param results: Списки docs (или исключения) в том же порядке
+    :param page: Номер логической страницы
+    :param limit: Размер логической страницы
+    :param page_size: Размер страницы API
+    :return: Список фильмов логической страницы
+    """
+    start = (page - 1) * limit
+    end = start + limit
+    merged = []
+    seen_ids = set()
+    for api_page, docs in zip(api_pages, results):
+        if isinstance(docs, BaseException):
+            continue
+        offset = (api_page - 1) * page_size
+        for position, doc in enumerate(docs, start=offset):
+            if position < start or position >= end:
+                continue
+            movie_id = doc.get("id")
+            if movie_id is not None:
+                if movie_id in seen_ids:
+                    continue
+                seen_ids.add(movie_id)
+            merged.append(doc)
+    return merged
@@ -0,0 +1,93 @@
+# singleflight.py
+
+import asyncio
+import threading
+
+
+class _Call:
+    __slots__ = ("event", "result", "error")
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """
+    Объединяет одновременные одинаковые вызовы из разных потоков: функция
+    выполняется один раз, а все ожидающие получают её результат (или её
+    исключение).
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+        # Сколько вызовов не понадобилось выполнять благодаря объединению
+        self.saved = 0
+
+    def do(self, key, fn):
+        """
+        :param key: Ключ, по которому вызовы считаются одинаковыми
+        :param fn: Функция без аргументов
+        :return: Результат fn()
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            if call is not None:
+                self.saved += 1
+                leader = False
+            else:
+                call = _Call()
+                self._calls[key] = call
+                leader = True
+
+        if not leader:
+            call.event.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = fn()
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.event.set()
+        return call.result
+
+
+class AsyncSingleFlight:
+    """
+    Асинхронный вариант SingleFlight для одного цикла событий.
+    """
+
+    def __init__(self):
+        self._calls = {}
+        self.saved = 0
+
+    async def do(self, key, factory):
+        """
+        :param key: Ключ, по которому вызовы считаются одинаковыми
+        :param factory: Функция без аргументов, возвращающая корутину
+        :return: Результат корутины
+        """
+        task = self._calls.get(key)
+        if task is not None:
+            self.saved += 1
+        else:
+            task = asyncio.ensure_future(factory())
+            self._calls[key] = task
+            task.add_done_callback(lambda done: self._finish(key, done))
+        # shield: отмена одного ожидающего не отменяет общий запрос
+        return await asyncio.shield(task)
+
+    def _finish(self, key, task):
+        if self._calls.get(key) is task:
+            del self._calls[key]
+        if not task.cancelled():
+            # Помечаем исключение полученным, даже если все ожидающие отменены
+            task.exception()
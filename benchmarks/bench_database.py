@@ -0,0 +1,121 @@
+# bench_database.py
+#
+# Сравнение пропускной способности истории поиска: прежняя схема
+# (новое соединение на каждый вызов под общей блокировкой) и
+# ConnectionManager (постоянные соединения, WAL, чтения без блокировки).
+#
+# Запуск из корня проекта:
+#     python -m benchmarks.bench_database
+
+import json
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from database.connection import ConnectionManager
+
+THREADS = 8
+INSERTS_PER_THREAD = 500
+READS_PER_THREAD = 2000
+USERS = 100
+
+SCHEMA = """
+    CREATE TABLE IF NOT EXISTS search_history (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        user_id INTEGER NOT NULL,
+        search_type TEXT NOT NULL,
+        search_params TEXT NOT NULL,
+        timestamp TEXT NOT NULL
+    )
+"""
+INSERT = """
+    INSERT INTO search_history (user_id, search_type, search_params, timestamp)
+    VALUES (?, ?, ?, ?)
+"""
+SELECT = """
+    SELECT search_type, search_params, timestamp
+    FROM search_history
+    WHERE user_id = ?
+    ORDER BY id DESC
+    LIMIT 20
+"""
+
+
+def row(i):
+    params = json.dumps({"name": f"фильм {i}", "count": 10})
+    return (i % USERS, "name", params, "2024-01-01T00:00:00")
+
+
+class LegacyStore:
+    """Прежняя реализация: sqlite3.connect на каждый вызов под общим Lock."""
+
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        conn = sqlite3.connect(path)
+        conn.execute(SCHEMA)
+        conn.commit()
+        conn.close()
+
+    def insert(self, i):
+        with self.lock:
+            conn = sqlite3.connect(self.path)
+            conn.execute(INSERT, row(i))
+            conn.commit()
+            conn.close()
+
+    def read(self, i):
+        with self.lock:
+            conn = sqlite3.connect(self.path)
+            rows = conn.execute(SELECT, (i % USERS,)).fetchall()
+            conn.close()
+        return rows
+
+
+class ManagedStore:
+    """Новая реализация на ConnectionManager."""
+
+    def __init__(self, path):
+        self.db = ConnectionManager(path)
+        with self.db.write() as conn:
+            conn.execute(SCHEMA)
+
+    def insert(self, i):
+        with self.db.write() as conn:
+            conn.execute(INSERT, row(i))
+
+    def read(self, i):
+        with self.db.read() as conn:
+            return conn.execute(SELECT, (i % USERS,)).fetchall()
+
+
+def run(store, method, per_thread):
+    def worker(offset):
+        for i in range(per_thread):
+            method(offset * per_thread + i)
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(THREADS) as executor:
+        list(executor.map(worker, range(THREADS)))
+    elapsed = time.perf_counter() - started
+    return THREADS * per_thread / elapsed
+
+
+def main():
+    print(f"Потоков: {THREADS}")
+    print(f"{'Реализация':<12}{'Вставок/с':>14}{'Чтений/с':>14}")
+    for name, cls in (("legacy", LegacyStore), ("managed", ManagedStore)):
+        with tempfile.TemporaryDirectory() as tmp:
+            store = cls(os.path.join(tmp, "bench.db"))
+            inserts = run(store, store.insert, INSERTS_PER_THREAD)
+            reads = run(store, store.read, READS_PER_THREAD)
+            if isinstance(store, ManagedStore):
+                store.db.close_all()
+        print(f"{name:<12}{inserts:>14.0f}{reads:>14.0f}")
+
+
+if __name__ == "__main__":
+    main()
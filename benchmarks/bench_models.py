@@ -0,0 +1,124 @@
+# bench_models.py
+#
+# Сравнение прежнего Movie (dataclass) и текущего (слоты, жанры кортежем
+# интернированных строк): память, которую фильмы удерживают после того, как
+# ответ API освобождён, и скорость преобразования ответа.
+#
+# Запуск из корня проекта:
+#     python -m benchmarks.bench_models
+
+import gc
+import time
+import tracemalloc
+from dataclasses import dataclass
+from typing import List, Optional
+
+from utils.models import Movie
+
+MOVIES = 10000
+ROUNDS = 5
+
+
+@dataclass
+class LegacyMovie:
+    """Прежняя реализация из utils/models.py."""
+
+    title: str
+    description: str
+    rating: Optional[float]
+    year: Optional[int]
+    genres: List[str]
+    age_rating: Optional[int]
+    poster_url: Optional[str]
+    budget: Optional[int]
+    movie_id: Optional[int] = None
+
+    @classmethod
+    def from_api_data(cls, data):
+        title = data.get("name") or data.get("alternativeName") or "Без названия"
+        description = data.get("description") or "Описание отсутствует."
+        rating = data.get("rating", {}).get("kp") or data.get("rating", {}).get("imdb")
+        year = data.get("year") or "Неизвестно"
+        genres = [
+            genre.get("name") for genre in data.get("genres", []) if genre.get("name")
+        ]
+        age_rating = data.get("ageRating")
+        poster_url = data.get("poster", {}).get("url")
+        budget = data.get("budget", {}).get("value")
+        movie_id = data.get("id")
+        return cls(
+            title,
+            description,
+            rating,
+            year,
+            genres,
+            age_rating,
+            poster_url,
+            budget,
+            movie_id,
+        )
+
+
+def make_docs(count):
+    return [
+        {
+            "id": i,
+            "name": f"Фильм {i}",
+            "alternativeName": f"Movie {i}",
+            "description": "Описание фильма. " * 40,
+            "rating": {"kp": 7.5, "imdb": 7.8},
+            "year": 2000 + i % 25,
+            "genres": [{"name": "драма"}, {"name": "комедия"}, {"name": "мелодрама"}],
+            "ageRating": 16,
+            "poster": {"url": f"https://image.example/{i}.jpg"},
+            "budget": {"value": 1000000 + i},
+        }
+        for i in range(count)
+    ]
+
+
+def convert(cls, docs):
+    if hasattr(cls, "from_api_docs"):
+        return cls.from_api_docs(docs)
+    return [cls.from_api_data(data) for data in docs]
+
+
+def memory_per_movie(cls):
+    """
+    Память на фильм, которая остаётся занятой после освобождения docs:
+    строки и словари ответа, на которые фильмы не ссылаются, не считаются.
+    """
+    gc.collect()
+    tracemalloc.start()
+    docs = make_docs(MOVIES)
+    movies = convert(cls, docs)
+    del docs
+    gc.collect()
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del movies
+    return size / MOVIES
+
+
+def throughput(cls, docs):
+    best = None
+    for _ in range(ROUNDS):
+        started = time.perf_counter()
+        convert(cls, docs)
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    return len(docs) / best
+
+
+def main():
+    docs = make_docs(MOVIES)
+    print(f"Фильмов: {MOVIES}")
+    print(f"{'Реализация':<12}{'Байт/фильм':>12}{'Фильмов/с':>14}")
+    for name, cls in (("legacy", LegacyMovie), ("slotted", Movie)):
+        memory = memory_per_movie(cls)
+        converted = throughput(cls, docs)
+        print(f"{name:<12}{memory:>12.0f}{converted:>14.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,171 @@
+# config.py
+
+import os
+from dataclasses import dataclass
+
+
+def _env_int(name, default):
+    value = os.getenv(name)
+    return int(value) if value else default
+
+
+def _env_float(name, default):
+    value = os.getenv(name)
+    return float(value) if value else default
+
+
+@dataclass
+class Settings:
+    """
+    Настройки бота, которые можно переопределить через файл .env.
+    """
+
+    # Количество одновременно обрабатываемых обновлений
+    concurrent_updates: int = 256
+
+    # Способ получения обновлений: polling или webhook
+    bot_mode: str = "polling"
+    # Локальный HTTP-сервер для webhook и публичный адрес, который
+    # регистрируется в Telegram (пустой — webhook уже настроен снаружи)
+    webhook_listen: str = "127.0.0.1"
+    webhook_port: int = 8443
+    webhook_path: str = "/telegram"
+    webhook_url: str = ""
+    # Секретный токен webhook (пустой — сгенерировать при запуске)
+    webhook_secret: str = ""
+    webhook_workers: int = 8
+    webhook_queue_size: int = 1000
+
+    # Количество процессов-обработчиков (0 или 1 — один процесс без
+    # распределения), размер очереди обновлений каждого из них и как часто
+    # выводить размер очередей (0 — не выводить)
+    shard_workers: int = 0
+    shard_queue_size: int = 1000
+    shard_report_interval: int = 60
+
+    # Сохранение состояния разговоров: как часто записывать изменения и
+    # через сколько секунд неактивности удалять состояние пользователя
+    # (0 — не удалять)
+    state_flush_interval: float = 10.0
+    state_ttl: int = 24 * 60 * 60
+
+    # Порт HTTP-сервера метрик в формате Prometheus (0 — не запускать)
+    metrics_port: int = 0
+    metrics_listen: str = "127.0.0.1"
+
+    # Способ отправки результатов поиска: single, album или carousel
+    delivery_mode: str = "single"
+
+    # Сессии карусели: время жизни после последнего действия и максимум
+    carousel_ttl: int = 30 * 60
+    carousel_max_sessions: int = 10000
+    # Сколько следующих страниц карусели загружать заранее на пользователя
+    prefetch_pages_per_user: int = 2
+
+    # Лимиты отправки сообщений в Telegram
+    send_global_rate: float = 30.0
+    send_per_chat_rate: float = 1.0
+    send_per_chat_burst: int = 3
+
+    # Сколько file_id постеров хранить
+    poster_cache_size: int = 10000
+
+    # Сколько готовых подписей к фильмам хранить
+    caption_cache_size: int = 10000
+
+    # Пакетная запись истории поиска
+    history_batch_size: int = 100
+    history_flush_interval: float = 1.0
+
+    # Пул HTTP-соединений к API Кинопоиска
+    api_pool_size: int = 10
+    api_connect_timeout: float = 3.05
+    api_read_timeout: float = 10.0
+
+    # Постраничная загрузка больших выборок
+    api_page_size: int = 50
+    api_max_concurrency: int = 4
+
+    # In-memory кэш ответов API
+    cache_max_entries: int = 1000
+    cache_max_bytes: int = 32 * 1024 * 1024
+    cache_ttl_search: int = 6 * 60 * 60
+    cache_ttl_filter: int = 60 * 60
+
+    # Дисковый кэш ответов API (пустой путь отключает его)
+    api_cache_db: str = "api_cache.db"
+    api_cache_max_bytes: int = 256 * 1024 * 1024
+
+    # Локальный каталог фильмов для поиска по рейтингу и бюджету
+    # (пустой путь отключает его)
+    catalog_db: str = "catalog.db"
+    catalog_sync_pages: int = 40
+    catalog_sync_interval: int = 24 * 60 * 60
+    catalog_max_age: int = 48 * 60 * 60
+
+    @classmethod
+    def from_env(cls):
+        return cls(
+            concurrent_updates=_env_int("CONCURRENT_UPDATES", cls.concurrent_updates),
+            bot_mode=os.getenv("BOT_MODE", cls.bot_mode),
+            webhook_listen=os.getenv("WEBHOOK_LISTEN", cls.webhook_listen),
+            webhook_port=_env_int("WEBHOOK_PORT", cls.webhook_port),
+            webhook_path=os.getenv("WEBHOOK_PATH", cls.webhook_path),
+            webhook_url=os.getenv("WEBHOOK_URL", cls.webhook_url),
+            webhook_secret=os.getenv("WEBHOOK_SECRET", cls.webhook_secret),
+            webhook_workers=_env_int("WEBHOOK_WORKERS", cls.webhook_workers),
+            webhook_queue_size=_env_int("WEBHOOK_QUEUE_SIZE", cls.webhook_queue_size),
+            shard_workers=_env_int("SHARD_WORKERS", cls.shard_workers),
+            shard_queue_size=_env_int("SHARD_QUEUE_SIZE", cls.shard_queue_size),
+            shard_report_interval=_env_int(
+                "SHARD_REPORT_INTERVAL", cls.shard_report_interval
+            ),
+            state_flush_interval=_env_float(
+                "STATE_FLUSH_INTERVAL", cls.state_flush_interval
+            ),
+            state_ttl=_env_int("STATE_TTL", cls.state_ttl),
+            metrics_port=_env_int("METRICS_PORT", cls.metrics_port),
+            metrics_listen=os.getenv("METRICS_LISTEN", cls.metrics_listen),
+            delivery_mode=os.getenv("DELIVERY_MODE", cls.delivery_mode),
+            carousel_ttl=_env_int("CAROUSEL_TTL", cls.carousel_ttl),
+            carousel_max_sessions=_env_int(
+                "CAROUSEL_MAX_SESSIONS", cls.carousel_max_sessions
+            ),
+            prefetch_pages_per_user=_env_int(
+                "PREFETCH_PAGES_PER_USER", cls.prefetch_pages_per_user
+            ),
+            poster_cache_size=_env_int("POSTER_CACHE_SIZE", cls.poster_cache_size),
+            caption_cache_size=_env_int("CAPTION_CACHE_SIZE", cls.caption_cache_size),
+            history_batch_size=_env_int("HISTORY_BATCH_SIZE", cls.history_batch_size),
+            history_flush_interval=_env_float(
+                "HISTORY_FLUSH_INTERVAL", cls.history_flush_interval
+            ),
+            send_global_rate=_env_float("SEND_GLOBAL_RATE", cls.send_global_rate),
+            send_per_chat_rate=_env_float("SEND_PER_CHAT_RATE", cls.send_per_chat_rate),
+            send_per_chat_burst=_env_int(
+                "SEND_PER_CHAT_BURST", cls.send_per_chat_burst
+            ),
+            api_pool_size=_env_int("API_POOL_SIZE", cls.api_pool_size),
+            api_connect_timeout=_env_float(
+                "API_CONNECT_TIMEOUT", cls.api_connect_timeout
+            ),
+            api_read_timeout=_env_float("API_READ_TIMEOUT", cls.api_read_timeout),
+            api_page_size=_env_int("API_PAGE_SIZE", cls.api_page_size),
+            api_max_concurrency=_env_int(
+                "API_MAX_CONCURRENCY", cls.api_max_concurrency
+            ),
+            cache_max_entries=_env_int("CACHE_MAX_ENTRIES", cls.cache_max_entries),
+            cache_max_bytes=_env_int("CACHE_MAX_BYTES", cls.cache_max_bytes),
+            cache_ttl_search=_env_int("CACHE_TTL_SEARCH", cls.cache_ttl_search),
+            cache_ttl_filter=_env_int("CACHE_TTL_FILTER", cls.cache_ttl_filter),
+            api_cache_db=os.getenv("API_CACHE_DB", cls.api_cache_db),
+            api_cache_max_bytes=_env_int(
+                "API_CACHE_MAX_BYTES", cls.api_cache_max_bytes
+            ),
+            catalog_db=os.getenv("CATALOG_DB", cls.catalog_db),
+            catalog_sync_pages=_env_int("CATALOG_SYNC_PAGES", cls.catalog_sync_pages),
+            catalog_sync_interval=_env_int(
+                "CATALOG_SYNC_INTERVAL", cls.catalog_sync_interval
+            ),
+            catalog_max_age=_env_int("CATALOG_MAX_AGE", cls.catalog_max_age),
+        )
@@ -0,0 +1,399 @@
+# catalog.py
+
+import json
+import sqlite3
+import time
+import zlib
+
+from database.connection import ConnectionManager
+
+# Путь к базе локального каталога фильмов
+CATALOG_DB_PATH = "catalog.db"
+
+
+def _pack(doc):
+    return zlib.compress(
+        json.dumps(doc, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+    )
+
+
+def _unpack(payload):
+    return json.loads(zlib.decompress(payload))
+
+
+# Сколько кандидатов из полнотекстового индекса пересчитывать по схожести
+# и какая доля триграмм запроса должна найтись в названии с опечаткой
+TITLE_CANDIDATES = 200
+TITLE_MIN_SIMILARITY = 0.5
+
+# Как часто перечитывать время синхронизации, выполненной другим процессом
+SYNCED_AT_REFRESH = 5.0
+
+
+def normalize_title(text):
+    """
+    Приводит название к виду для поиска: нижний регистр, «ё» → «е»,
+    одинарные пробелы.
+    """
+    return " ".join(text.casefold().replace("ё", "е").split())
+
+
+def _trigrams(text):
+    return {text[i : i + 3] for i in range(len(text) - 2)}
+
+
+def _title_score(query, title):
+    """
+    Схожесть названия с запросом: больше 1 — запрос входит в название
+    целиком (тем больше, чем короче название), иначе — доля триграмм
+    запроса, найденных в названии.
+    """
+    if query in title:
+        return 1 + len(query) / len(title)
+    query_trigrams = _trigrams(query)
+    return len(query_trigrams & _trigrams(title)) / len(query_trigrams)
+
+
+def title_contains(doc, query):
+    """
+    Входит ли запрос целиком в одно из названий фильма (а не только похож
+    на него).
+    """
+    query = normalize_title(query)
+    return any(query in title for title in _doc_titles(doc))
+
+
+def _fts_phrase(text):
+    return '"' + text.replace('"', '""') + '"'
+
+
+def _doc_titles(doc):
+    titles = [doc.get("name"), doc.get("alternativeName"), doc.get("enName")]
+    titles += [name.get("name") for name in doc.get("names") or []]
+    normalized = []
+    for title in titles:
+        if title:
+            title = normalize_title(title)
+            if title and title not in normalized:
+                normalized.append(title)
+    return normalized
+
+
+def _parse_range(value):
+    """
+    Разбирает диапазон вида '0-1500000' в пару чисел.
+    """
+    low, _, high = str(value).partition("-")
+    return int(low), int(high or low)
+
+
+class MovieCatalog:
+    """
+    Локальная копия популярной части каталога Кинопоиска.
+
+    Поиск по рейтингу и бюджету — это фильтры по атрибутам, поэтому, пока
+    каталог свежий, на них можно отвечать из индексированной таблицы SQLite
+    без запроса к API. Для поиска по названию ведётся триграммный индекс
+    FTS5, устойчивый к регистру, «ё»/«е» и опечаткам. Каталог заполняется
+    периодической синхронизацией (см. api/catalog_sync.py). Фильмы хранятся
+    в формате ответа API, поэтому вызывающий код обрабатывает их так же,
+    как результаты API.
+    """
+
+    def __init__(self, path=CATALOG_DB_PATH, max_age=48 * 60 * 60):
+        """
+        :param path: Путь к файлу базы каталога
+        :param max_age: Сколько секунд после синхронизации каталог считается
+            свежим
+        """
+        self.max_age = max_age
+        self.db = ConnectionManager(path)
+        self._synced_at = None
+        self._synced_at_checked = 0.0
+        # False, если SQLite собран без FTS5 с триграммным токенизатором
+        self.has_title_index = False
+
+    def initialize(self):
+        with self.db.write() as conn:
+            cursor = conn.cursor()
+            cursor.execute(
+                """
+                CREATE TABLE IF NOT EXISTS movies (
+                    id INTEGER PRIMARY KEY,
+                    rating REAL,
+                    budget INTEGER,
+                    year INTEGER,
+                    votes INTEGER NOT NULL DEFAULT 0,
+                    payload BLOB NOT NULL,
+                    synced_at INTEGER NOT NULL
+                )
+            """
+            )
+            cursor.execute(
+                """
+                CREATE TABLE IF NOT EXISTS movie_genres (
+                    genre TEXT NOT NULL,
+                    movie_id INTEGER NOT NULL,
+                    PRIMARY KEY (genre, movie_id)
+                ) WITHOUT ROWID
+            """
+            )
+            cursor.execute(
+                "CREATE INDEX IF NOT EXISTS idx_movies_rating ON movies (rating)"
+            )
+            cursor.execute(
+                "CREATE INDEX IF NOT EXISTS idx_movies_budget ON movies (budget)"
+            )
+            cursor.execute(
+                "CREATE INDEX IF NOT EXISTS idx_movies_year ON movies (year)"
+            )
+            cursor.execute(
+                "CREATE INDEX IF NOT EXISTS idx_movie_genres_movie "
+                "ON movie_genres (movie_id)"
+            )
+            cursor.execute(
+                """
+                CREATE TABLE IF NOT EXISTS catalog_meta (
+                    key TEXT PRIMARY KEY,
+                    value TEXT NOT NULL
+                )
+            """
+            )
+        self._read_synced_at()
+        self._initialize_title_index()
+
+    def _initialize_title_index(self):
+        try:
+            with self.db.write() as conn:
+                cursor = conn.cursor()
+                # rowid строки индекса совпадает с id фильма, а все названия
+                # фильма хранятся в одной строке через перевод строки
+                cursor.execute(
+                    "CREATE VIRTUAL TABLE IF NOT EXISTS movie_titles "
+                    "USING fts5(titles, tokenize = 'trigram')"
+                )
+                cursor.execute("SELECT COUNT(*) FROM movie_titles")
+                if cursor.fetchone()[0] == 0:
+                    # Каталог, заполненный до появления индекса
+                    cursor.execute("SELECT id, payload FROM movies")
+                    cursor.executemany(
+                        "INSERT INTO movie_titles (rowid, titles) VALUES (?, ?)",
+                        [
+                            (movie_id, "\n".join(_doc_titles(_unpack(payload))))
+                            for movie_id, payload in cursor.fetchall()
+                        ],
+                    )
+        except sqlite3.OperationalError as e:
+            print(f"Поиск по названию в локальном каталоге недоступен: {e}")
+            return
+        self.has_title_index = True
+
+    def _read_synced_at(self):
+        with self.db.read() as conn:
+            row = conn.execute(
+                "SELECT value FROM catalog_meta WHERE key = 'synced_at'"
+            ).fetchone()
+        self._synced_at = int(row[0]) if row else None
+        self._synced_at_checked = time.monotonic()
+
+    @property
+    def synced_at(self):
+        """
+        Время последней завершённой синхронизации (unix-время) или None.
+
+        Синхронизацию может выполнять другой процесс, поэтому значение
+        перечитывается из базы, если с прошлого чтения прошло
+        SYNCED_AT_REFRESH секунд.
+        """
+        if time.monotonic() - self._synced_at_checked >= SYNCED_AT_REFRESH:
+            self._read_synced_at()
+        return self._synced_at
+
+    def is_fresh(self):
+        return (
+            self.synced_at is not None and time.time() - self._synced_at < self.max_age
+        )
+
+    def store_page(self, docs, synced_at):
+        """
+        Добавляет или обновляет фильмы одной страницы синхронизации.
+
+        :param docs: Список фильмов в формате ответа API
+        :param synced_at: Время начала текущей синхронизации
+        """
+        movies = []
+        genres = []
+        titles = []
+        for doc in docs:
+            movie_id = doc.get("id")
+            if movie_id is None:
+                continue
+            movies.append(
+                (
+                    movie_id,
+                    (doc.get("rating") or {}).get("kp"),
+                    (doc.get("budget") or {}).get("value"),
+                    doc.get("year"),
+                    (doc.get("votes") or {}).get("kp") or 0,
+                    _pack(doc),
+                    synced_at,
+                )
+            )
+            for genre in doc.get("genres") or []:
+                if genre.get("name"):
+                    genres.append((genre["name"].lower(), movie_id))
+            titles.append((movie_id, "\n".join(_doc_titles(doc))))
+
+        with self.db.write() as conn:
+            cursor = conn.cursor()
+            cursor.executemany(
+                "INSERT OR REPLACE INTO movies VALUES (?, ?, ?, ?, ?, ?, ?)", movies
+            )
+            cursor.executemany(
+                "DELETE FROM movie_genres WHERE movie_id = ?",
+                [(movie[0],) for movie in movies],
+            )
+            cursor.executemany(
+                "INSERT OR IGNORE INTO movie_genres (genre, movie_id) VALUES (?, ?)",
+                genres,
+            )
+            if self.has_title_index:
+                cursor.executemany(
+                    "DELETE FROM movie_titles WHERE rowid = ?",
+                    [(movie[0],) for movie in movies],
+                )
+                cursor.executemany(
+                    "INSERT INTO movie_titles (rowid, titles) VALUES (?, ?)", titles
+                )
+
+    def finish_sync(self, synced_at):
+        """
+        Завершает синхронизацию: удаляет фильмы, которых в ней не было, и
+        отмечает каталог свежим.
+        """
+        with self.db.write() as conn:
+            cursor = conn.cursor()
+            cursor.execute(
+                """
+                DELETE FROM movie_genres WHERE movie_id IN (
+                    SELECT id FROM movies WHERE synced_at < ?
+                )
+            """,
+                (synced_at,),
+            )
+            if self.has_title_index:
+                cursor.execute(
+                    """
+                    DELETE FROM movie_titles WHERE rowid IN (
+                        SELECT id FROM movies WHERE synced_at < ?
+                    )
+                """,
+                    (synced_at,),
+                )
+            cursor.execute("DELETE FROM movies WHERE synced_at < ?", (synced_at,))
+            cursor.execute(
+                "INSERT OR REPLACE INTO catalog_meta (key, value) "
+                "VALUES ('synced_at', ?)",
+                (str(synced_at),),
+            )
+        self._synced_at = synced_at
+        self._synced_at_checked = time.monotonic()
+
+    def count(self):
+        with self.db.read() as conn:
+            return conn.execute("SELECT COUNT(*) FROM movies").fetchone()[0]
+
+    def _select(self, column, low, high, genre, limit):
+        query = "SELECT payload FROM movies"
+        params = []
+        if genre:
+            query += " JOIN movie_genres ON movie_genres.movie_id = movies.id"
+        query += f" WHERE {column} BETWEEN ? AND ?"
+        params += [low, high]
+        if genre:
+            query += " AND movie_genres.genre = ?"
+            params.append(genre.lower())
+        query += " ORDER BY votes DESC, id LIMIT ?"
+        params.append(limit)
+        with self.db.read() as conn:
+            rows = conn.execute(query, params).fetchall()
+        return [_unpack(row[0]) for row in rows]
+
+    def search_by_rating(self, min_rating, max_rating, genre=None, limit=10):
+        """
+        Фильмы с рейтингом Кинопоиска в диапазоне, от самых популярных.
+
+        :param min_rating: Минимальный рейтинг
+        :param max_rating: Максимальный рейтинг
+        :param genre: Жанр или None
+        :param limit: Максимальное количество фильмов
+        :return: Список фильмов в формате ответа API
+        """
+        return self._select("rating", min_rating, max_rating, genre, limit)
+
+    def search_by_budget(self, budget_range, genre=None, limit=10):
+        """
+        Фильмы с бюджетом в диапазоне, от самых популярных.
+
+        :param budget_range: Диапазон бюджета в формате 'min-max'
+        :param genre: Жанр или None
+        :param limit: Максимальное количество фильмов
+        :return: Список фильмов в формате ответа API
+        """
+        low, high = _parse_range(budget_range)
+        return self._select("budget", low, high, genre, limit)
+
+    def search_by_title(self, query, limit=10):
+        """
+        Фильмы, название которых содержит запрос или похоже на него.
+
+        Сначала ищутся названия, содержащие запрос целиком; если их меньше
+        limit, кандидаты добираются по отдельным триграммам запроса, поэтому
+        находятся и названия с опечатками. Кандидаты ранжируются по схожести
+        с запросом и популярности, полные совпадения (title_contains) идут
+        первыми. Запросы короче трёх символов локально не обрабатываются.
+
+        :param query: Текст запроса
+        :param limit: Максимальное количество фильмов
+        :return: Список фильмов в формате ответа API
+        """
+        query = normalize_title(query)
+        trigrams = _trigrams(query)
+        if not self.has_title_index or not trigrams:
+            return []
+
+        with self.db.read() as conn:
+            rows = self._title_candidates(conn, _fts_phrase(query))
+            if len(rows) < limit:
+                # Каждая триграмма — отдельная фраза, любое совпадение годится
+                match = " OR ".join(
+                    _fts_phrase(trigram) for trigram in sorted(trigrams)
+                )
+                rows += self._title_candidates(conn, match)
+
+        scored = {}
+        for movie_id, payload, votes, titles in rows:
+            if movie_id in scored:
+                continue
+            score = max(_title_score(query, title) for title in titles.split("\n"))
+            if score >= TITLE_MIN_SIMILARITY:
+                scored[movie_id] = (score, votes, payload)
+        best = sorted(scored.values(), key=lambda item: item[:2], reverse=True)
+        return [_unpack(payload) for _, _, payload in best[:limit]]
+
+    @staticmethod
+    def _title_candidates(conn, match):
+        return conn.execute(
+            """
+            SELECT movies.id, movies.payload, movies.votes, movie_titles.titles
+            FROM movie_titles
+            JOIN movies ON movies.id = movie_titles.rowid
+            WHERE movie_titles MATCH ?
+            ORDER BY rank
+            LIMIT ?
+        """,
+            (match, TITLE_CANDIDATES),
+        ).fetchall()
+
+    def close(self):
+        self.db.close_all()
@@ -0,0 +1,84 @@
+# connection.py
+
+import sqlite3
+import threading
+from contextlib import contextmanager
+
+
+class ConnectionManager:
+    """
+    Постоянные соединения с SQLite, по одному на поток.
+
+    База переводится в режим WAL, поэтому чтения идут параллельно друг с другом
+    и с записью без общей блокировки. Записи сериализуются внутри процесса
+    отдельной блокировкой, чтобы не ловить SQLITE_BUSY от самих себя.
+    """
+
+    def __init__(self, path, cache_size_kib=8192, busy_timeout_ms=5000):
+        """
+        :param path: Путь к файлу базы данных
+        :param cache_size_kib: Размер страничного кэша каждого соединения (КиБ)
+        :param busy_timeout_ms: Сколько ждать освобождения базы другим процессом
+        """
+        self.path = path
+        self.cache_size_kib = cache_size_kib
+        self.busy_timeout_ms = busy_timeout_ms
+        self._local = threading.local()
+        self._write_lock = threading.Lock()
+        self._connections = []
+        self._connections_lock = threading.Lock()
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, check_same_thread=False)
+        conn.execute("PRAGMA journal_mode = WAL")
+        # В режиме WAL NORMAL не теряет целостность, но не делает fsync
+        # на каждый коммит
+        conn.execute("PRAGMA synchronous = NORMAL")
+        conn.execute(f"PRAGMA cache_size = -{self.cache_size_kib}")
+        conn.execute("PRAGMA temp_store = MEMORY")
+        conn.execute(f"PRAGMA busy_timeout = {self.busy_timeout_ms}")
+        with self._connections_lock:
+            self._connections.append(conn)
+        return conn
+
+    def connection(self):
+        """
+        Возвращает соединение текущего потока, создавая его при первом вызове.
+        """
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = self._connect()
+            self._local.conn = conn
+        return conn
+
+    @contextmanager
+    def read(self):
+        """
+        Соединение для чтения. Блокировка не берётся.
+        """
+        yield self.connection()
+
+    @contextmanager
+    def write(self):
+        """
+        Соединение для записи в транзакции: коммит при успехе,
+        откат при исключении.
+        """
+        with self._write_lock:
+            conn = self.connection()
+            try:
+                yield conn
+                conn.commit()
+            except BaseException:
+                conn.rollback()
+                raise
+
+    def close_all(self):
+        """
+        Закрывает соединения всех потоков (при остановке бота).
+        """
+        with self._connections_lock:
+            connections, self._connections = self._connections, []
+        for conn in connections:
+            conn.close()
+        self._local = threading.local()
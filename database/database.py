@@ -1,35 +1,101 @@
 # database/database.py
 
-import sqlite3
 from datetime import datetime
-import json
-import threading
+import time
 
-# Используем Lock для обеспечения потокобезопасности при работе с SQLite
-db_lock = threading.Lock()
+from database.connection import ConnectionManager
+from database.migrations import apply_migrations
 
 # Путь к базе данных
 DB_PATH = "history.db"
 
+# Постоянные соединения по одному на поток; чтения идут без общей блокировки
+db = ConnectionManager(DB_PATH)
+
 
 def initialize_database():
-    with db_lock:
-        conn = sqlite3.connect(DB_PATH)
-        cursor = conn.cursor()
-        # Создаём таблицу, если она ещё не существует
-        cursor.execute(
-            """
-            CREATE TABLE IF NOT EXISTS search_history (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                user_id INTEGER NOT NULL,
-                search_type TEXT NOT NULL,
-                search_params TEXT NOT NULL,
-                timestamp TEXT NOT NULL
-            )
-        """
-        )
-        conn.commit()
-        conn.close()
+    """
+    Создаёт или обновляет схему базы данных до последней версии.
+    """
+    with db.write() as conn:
+        apply_migrations(conn)
+
+
+# Коды типов поиска в колонке search_type
+SEARCH_TYPES = {"name": 1, "rating": 2, "budget": 3}
+SEARCH_TYPE_NAMES = {code: name for name, code in SEARCH_TYPES.items()}
+
+_INSERT_HISTORY = """
+    INSERT INTO search_history (
+        user_id, search_type, query, min_rating, max_rating,
+        genre, budget_min, budget_max, result_count, created_at
+    )
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+"""
+
+
+def _history_row(user_id, search_type, search_params, created_at):
+    """
+    Раскладывает словарь параметров поиска по колонкам таблицы.
+    """
+    budget_min = budget_max = None
+    budget_range = search_params.get("budget_range")
+    if budget_range:
+        low, _, high = str(budget_range).partition("-")
+        budget_min = int(low) if low.isdigit() else None
+        budget_max = int(high) if high.isdigit() else None
+    return (
+        user_id,
+        SEARCH_TYPES[search_type],
+        search_params.get("name"),
+        search_params.get("min_rating"),
+        search_params.get("max_rating"),
+        search_params.get("genre"),
+        budget_min,
+        budget_max,
+        search_params.get("count"),
+        created_at,
+    )
+
+
+def _history_entry(row):
+    """
+    Собирает запись истории в прежнем формате из колонок таблицы.
+    """
+    (
+        entry_id,
+        search_type,
+        query,
+        min_rating,
+        max_rating,
+        genre,
+        budget_min,
+        budget_max,
+        count,
+        created_at,
+    ) = row
+    search_type = SEARCH_TYPE_NAMES.get(search_type)
+    if search_type == "name":
+        search_params = {"name": query, "count": count}
+    elif search_type == "rating":
+        search_params = {
+            "min_rating": min_rating,
+            "max_rating": max_rating,
+            "genre": genre,
+            "count": count,
+        }
+    else:
+        search_params = {
+            "budget_range": f"{budget_min}-{budget_max}",
+            "genre": genre,
+            "count": count,
+        }
+    return {
+        "id": entry_id,
+        "search_type": search_type,
+        "search_params": search_params,
+        "timestamp": datetime.utcfromtimestamp(created_at).isoformat(),
+    }
 
 
 def add_search_history(user_id, search_type, search_params):
@@ -40,20 +106,20 @@ def add_search_history(user_id, search_type, search_params):
     :param search_type: Тип поиска ('name', 'rating', 'budget')
     :param search_params: Параметры поиска в виде словаря
     """
-    timestamp = datetime.utcnow().isoformat()
-    search_params_json = json.dumps(search_params)
-    with db_lock:
-        conn = sqlite3.connect(DB_PATH)
+    add_search_history_many([(user_id, search_type, search_params, int(time.time()))])
+
+
+def add_search_history_many(entries):
+    """
+    Добавляет несколько записей в историю поиска одной транзакцией.
+
+    :param entries: Список кортежей (user_id, search_type, search_params,
+        created_at), где created_at — unix-время в секундах
+    """
+    rows = [_history_row(*entry) for entry in entries]
+    with db.write() as conn:
         cursor = conn.cursor()
-        cursor.execute(
-            """
-            INSERT INTO search_history (user_id, search_type, search_params, timestamp)
-            VALUES (?, ?, ?, ?)
-        """,
-            (user_id, search_type, search_params_json, timestamp),
-        )
-        conn.commit()
-        conn.close()
+        cursor.executemany(_INSERT_HISTORY, rows)
 
 
 def get_search_history(user_id, limit=20):
@@ -64,12 +130,12 @@ def get_search_history(user_id, limit=20):
     :param limit: Максимальное количество записей
     :return: Список записей истории поиска
     """
-    with db_lock:
-        conn = sqlite3.connect(DB_PATH)
+    with db.read() as conn:
         cursor = conn.cursor()
         cursor.execute(
             """
-            SELECT search_type, search_params, timestamp
+            SELECT id, search_type, query, min_rating, max_rating, genre,
+                   budget_min, budget_max, result_count, created_at
             FROM search_history
             WHERE user_id = ?
             ORDER BY id DESC
@@ -78,20 +144,66 @@ def get_search_history(user_id, limit=20):
             (user_id, limit),
         )
         rows = cursor.fetchall()
-        conn.close()
-
-    history = []
-    for row in rows:
-        search_type, search_params_json, timestamp = row
-        search_params = json.loads(search_params_json)
-        history.append(
-            {
-                "search_type": search_type,
-                "search_params": search_params,
-                "timestamp": timestamp,
-            }
-        )
-    return history
+
+    return [_history_entry(row) for row in rows]
+
+
+def get_search_history_page(user_id, before_id=None, after_id=None, limit=10):
+    """
+    Извлекает страницу истории поиска (от новых записей к старым) с
+    keyset-пагинацией по id: стоимость любой страницы одинакова.
+
+    :param user_id: ID пользователя Telegram
+    :param before_id: Вернуть записи старше записи с этим id
+    :param after_id: Вернуть записи новее записи с этим id
+    :param limit: Количество записей на странице
+    :return: Словарь с ключами entries, has_older, has_newer
+    """
+    columns = """
+        SELECT id, search_type, query, min_rating, max_rating, genre,
+               budget_min, budget_max, result_count, created_at
+        FROM search_history
+    """
+    with db.read() as conn:
+        cursor = conn.cursor()
+        if after_id is not None:
+            cursor.execute(
+                columns + "WHERE user_id = ? AND id > ? ORDER BY id ASC LIMIT ?",
+                (user_id, after_id, limit),
+            )
+            rows = cursor.fetchall()[::-1]
+        elif before_id is not None:
+            cursor.execute(
+                columns + "WHERE user_id = ? AND id < ? ORDER BY id DESC LIMIT ?",
+                (user_id, before_id, limit),
+            )
+            rows = cursor.fetchall()
+        else:
+            cursor.execute(
+                columns + "WHERE user_id = ? ORDER BY id DESC LIMIT ?",
+                (user_id, limit),
+            )
+            rows = cursor.fetchall()
+
+        has_older = has_newer = False
+        if rows:
+            newest_id, oldest_id = rows[0][0], rows[-1][0]
+            has_older = _history_exists(cursor, user_id, "id < ?", oldest_id)
+            has_newer = _history_exists(cursor, user_id, "id > ?", newest_id)
+
+    return {
+        "entries": [_history_entry(row) for row in rows],
+        "has_older": has_older,
+        "has_newer": has_newer,
+    }
+
+
+def _history_exists(cursor, user_id, condition, entry_id):
+    cursor.execute(
+        f"SELECT EXISTS (SELECT 1 FROM search_history WHERE user_id = ? AND {condition})",
+        (user_id, entry_id),
+    )
+    return bool(cursor.fetchone()[0])
 
 
 def clear_search_history(user_id):
@@ -100,9 +212,13 @@ def clear_search_history(user_id):
 
     :param user_id: ID пользователя Telegram
     """
-    with db_lock:
-        conn = sqlite3.connect(DB_PATH)
+    with db.write() as conn:
         cursor = conn.cursor()
         cursor.execute("DELETE FROM search_history WHERE user_id = ?", (user_id,))
-        conn.commit()
-        conn.close()
+
+
+def close_database():
+    """
+    Закрывает соединения с базой данных при остановке бота.
+    """
+    db.close_all()
@@ -0,0 +1,123 @@
+# history_writer.py
+
+import queue
+import threading
+import time
+
+from database.database import add_search_history_many
+
+# Признак остановки потока записи
+_STOP = object()
+
+
+class HistoryWriter:
+    """
+    Отложенная пакетная запись истории поиска.
+
+    Обработчики только ставят записи в очередь, а отдельный поток сохраняет
+    их пачками в одной транзакции — когда набирается batch_size записей или
+    проходит flush_interval секунд с первой записи в пачке.
+    """
+
+    def __init__(self, batch_size=100, flush_interval=1.0):
+        """
+        :param batch_size: Максимальное количество записей в одной транзакции
+        :param flush_interval: Максимальная задержка записи (секунды)
+        """
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._queue = queue.Queue()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(
+            target=self._run, name="history-writer", daemon=True
+        )
+        self._thread.start()
+
+    def stop(self):
+        """
+        Записывает всё, что осталось в очереди, и останавливает поток.
+        """
+        if self._thread is None:
+            return
+        self._queue.put(_STOP)
+        self._thread.join()
+        self._thread = None
+
+    def add(self, user_id, search_type, search_params):
+        """
+        Ставит запись истории в очередь. Не блокирует вызывающий код.
+
+        :param user_id: ID пользователя Telegram
+        :param search_type: Тип поиска ('name', 'rating', 'budget')
+        :param search_params: Параметры поиска в виде словаря
+        """
+        self._queue.put((user_id, search_type, search_params, int(time.time())))
+
+    def flush(self, timeout=None):
+        """
+        Дожидается записи всех поставленных до вызова записей.
+        Используется перед чтением или очисткой истории.
+        """
+        if self._thread is None:
+            self._write(self._drain())
+            return True
+        done = threading.Event()
+        self._queue.put(done)
+        return done.wait(timeout)
+
+    def queue_depth(self):
+        return self._queue.qsize()
+
+    def _drain(self):
+        entries = []
+        while True:
+            try:
+                item = self._queue.get_nowait()
+            except queue.Empty:
+                return entries
+            if isinstance(item, tuple):
+                entries.append(item)
+            elif isinstance(item, threading.Event):
+                item.set()
+
+    def _run(self):
+        stopping = False
+        while not stopping:
+            item = self._queue.get()
+            entries, waiters = [], []
+            deadline = time.monotonic() + self.flush_interval
+            while True:
+                if item is _STOP:
+                    stopping = True
+                elif isinstance(item, threading.Event):
+                    # flush(): записываем пачку сразу, не дожидаясь таймера
+                    waiters.append(item)
+                    deadline = 0
+                else:
+                    entries.append(item)
+                if stopping or len(entries) >= self.batch_size:
+                    break
+                timeout = deadline - time.monotonic()
+                try:
+                    item = (
+                        self._queue.get(timeout=timeout)
+                        if timeout > 0
+                        else self._queue.get_nowait()
+                    )
+                except queue.Empty:
+                    break
+            if stopping:
+                entries.extend(self._drain())
+            self._write(entries)
+            for waiter in waiters:
+                waiter.set()
+
+    def _write(self, entries):
+        if not entries:
+            return
+        try:
+            add_search_history_many(entries)
+        except Exception as e:
+            print(f"Ошибка при сохранении истории поиска: {e}")
@@ -0,0 +1,217 @@
+# migrations.py
+
+import json
+from datetime import datetime, timezone
+
+# Версия схемы хранится в PRAGMA user_version. Каждая миграция выполняется
+# в отдельной транзакции вместе с увеличением версии, поэтому прерванный
+# запуск продолжит с той миграции, на которой остановился.
+
+
+def _create_base_tables(cursor):
+    # Исходные таблицы; в существующих базах они уже есть
+    cursor.execute(
+        """
+        CREATE TABLE IF NOT EXISTS search_history (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            search_type TEXT NOT NULL,
+            search_params TEXT NOT NULL,
+            timestamp TEXT NOT NULL
+        )
+    """
+    )
+    # Соответствие постеров фильмов и file_id, выданных Telegram
+    cursor.execute(
+        """
+        CREATE TABLE IF NOT EXISTS poster_file_ids (
+            cache_key TEXT PRIMARY KEY,
+            poster_url TEXT NOT NULL,
+            file_id TEXT NOT NULL,
+            updated_at REAL NOT NULL
+        )
+    """
+    )
+
+
+def _add_search_history_user_index(cursor):
+    # История пользователя читается и удаляется по user_id в порядке id
+    cursor.execute(
+        """
+        CREATE INDEX IF NOT EXISTS idx_search_history_user_id
+        ON search_history (user_id, id)
+    """
+    )
+
+
+def _add_poster_file_ids_updated_index(cursor):
+    # Загрузка последних file_id при старте сортирует по updated_at
+    cursor.execute(
+        """
+        CREATE INDEX IF NOT EXISTS idx_poster_file_ids_updated_at
+        ON poster_file_ids (updated_at)
+    """
+    )
+
+
+def _convert_search_history_to_columns(cursor):
+    # Параметры поиска переносятся из JSON-строки в отдельные типизированные
+    # колонки, тип поиска кодируется числом, время — unix-временем в секундах.
+    # Идентификаторы записей сохраняются.
+    cursor.execute(
+        """
+        CREATE TABLE search_history_new (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            search_type INTEGER NOT NULL,
+            query TEXT,
+            min_rating REAL,
+            max_rating REAL,
+            genre TEXT,
+            budget_min INTEGER,
+            budget_max INTEGER,
+            result_count INTEGER,
+            created_at INTEGER NOT NULL
+        )
+    """
+    )
+    search_types = {"name": 1, "rating": 2, "budget": 3}
+    rows = cursor.connection.execute(
+        """
+        SELECT id, user_id, search_type, search_params, timestamp
+        FROM search_history
+        ORDER BY id
+    """
+    )
+    while True:
+        batch = rows.fetchmany(1000)
+        if not batch:
+            break
+        converted = []
+        for row_id, user_id, search_type, search_params_json, timestamp in batch:
+            if search_type not in search_types:
+                continue
+            try:
+                params = json.loads(search_params_json)
+            except ValueError:
+                params = {}
+            budget_min = budget_max = None
+            budget_range = params.get("budget_range")
+            if budget_range:
+                low, _, high = str(budget_range).partition("-")
+                budget_min = int(low) if low.isdigit() else None
+                budget_max = int(high) if high.isdigit() else None
+            try:
+                # Прежние метки времени — наивное UTC-время в ISO-формате
+                created_at = int(
+                    datetime.fromisoformat(timestamp)
+                    .replace(tzinfo=timezone.utc)
+                    .timestamp()
+                )
+            except ValueError:
+                created_at = 0
+            converted.append(
+                (
+                    row_id,
+                    user_id,
+                    search_types[search_type],
+                    params.get("name"),
+                    params.get("min_rating"),
+                    params.get("max_rating"),
+                    params.get("genre"),
+                    budget_min,
+                    budget_max,
+                    params.get("count"),
+                    created_at,
+                )
+            )
+        cursor.executemany(
+            """
+            INSERT INTO search_history_new (
+                id, user_id, search_type, query, min_rating, max_rating,
+                genre, budget_min, budget_max, result_count, created_at
+            )
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        """,
+            converted,
+        )
+    cursor.execute("DROP TABLE search_history")
+    cursor.execute("ALTER TABLE search_history_new RENAME TO search_history")
+    cursor.execute(
+        """
+        CREATE INDEX IF NOT EXISTS idx_search_history_user_id
+        ON search_history (user_id, id)
+    """
+    )
+
+
+def _create_conversation_state_tables(cursor):
+    # Состояние разговоров и context.user_data, которые переживают
+    # перезапуск бота; неактивные записи удаляются по updated_at
+    cursor.execute(
+        """
+        CREATE TABLE IF NOT EXISTS user_data (
+            user_id INTEGER PRIMARY KEY,
+            data TEXT NOT NULL,
+            updated_at REAL NOT NULL
+        )
+    """
+    )
+    cursor.execute(
+        """
+        CREATE INDEX IF NOT EXISTS idx_user_data_updated_at
+        ON user_data (updated_at)
+    """
+    )
+    cursor.execute(
+        """
+        CREATE TABLE IF NOT EXISTS conversations (
+            name TEXT NOT NULL,
+            conversation_key TEXT NOT NULL,
+            state TEXT NOT NULL,
+            updated_at REAL NOT NULL,
+            PRIMARY KEY (name, conversation_key)
+        ) WITHOUT ROWID
+    """
+    )
+    cursor.execute(
+        """
+        CREATE INDEX IF NOT EXISTS idx_conversations_updated_at
+        ON conversations (updated_at)
+    """
+    )
+
+
+# Порядок менять нельзя: номер миграции — её позиция в списке, начиная с 1
+MIGRATIONS = [
+    _create_base_tables,
+    _add_search_history_user_index,
+    _add_poster_file_ids_updated_index,
+    _convert_search_history_to_columns,
+    _create_conversation_state_tables,
+]
+
+
+def get_schema_version(conn):
+    return conn.execute("PRAGMA user_version").fetchone()[0]
+
+
+def apply_migrations(conn):
+    """
+    Применяет к базе все ещё не применённые миграции.
+
+    :param conn: Соединение с базой данных
+    :return: Номер версии схемы после применения
+    """
+    version = get_schema_version(conn)
+    for number in range(version + 1, len(MIGRATIONS) + 1):
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            MIGRATIONS[number - 1](conn.cursor())
+            conn.execute(f"PRAGMA user_version = {number}")
+        except BaseException:
+            conn.rollback()
+            raise
+        conn.commit()
+        print(f"Применена миграция базы данных {number}")
+    return max(version, len(MIGRATIONS))
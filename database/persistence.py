@@ -0,0 +1,259 @@
+# persistence.py
+
+import asyncio
+import json
+import time
+
+from telegram.ext import BasePersistence, PersistenceInput
+
+from database.database import db
+
+# Через сколько секунд после первого изменения записывать накопленные:
+# все изменения одного прохода Application.update_persistence попадают в
+# одну транзакцию
+WRITE_DELAY = 0.05
+
+
+def _dumps(value):
+    return json.dumps(value, ensure_ascii=False, separators=(",", ":"))
+
+
+class SQLitePersistence(BasePersistence):
+    """
+    Состояние разговоров (ConversationHandler) и context.user_data в SQLite,
+    чтобы перезапуск бота не прерывал поиск на середине.
+
+    Application передаёт изменения раз в update_interval секунд, и они
+    записываются одной транзакцией. Записи пользователей, неактивных
+    дольше ttl секунд, удаляются из базы, а их незавершённые разговоры и
+    user_data — из памяти.
+    """
+
+    def __init__(self, update_interval=10, ttl=24 * 60 * 60, evict_interval=10 * 60):
+        """
+        :param update_interval: Как часто (в секундах) сохранять изменения
+        :param ttl: Через сколько секунд неактивности удалять состояние
+            пользователя (0 — не удалять)
+        :param evict_interval: Как часто (в секундах) удалять неактивных
+        """
+        super().__init__(
+            store_data=PersistenceInput(
+                bot_data=False, chat_data=False, user_data=True, callback_data=False
+            ),
+            update_interval=update_interval,
+        )
+        self.ttl = ttl
+        self.evict_interval = evict_interval
+        # Изменения, ещё не записанные в базу (None — удалить запись)
+        self._pending_user_data = {}
+        self._pending_conversations = {}
+        self._write_task = None
+        # Время последней активности пользователей, чьи user_data в памяти
+        self._last_seen = {}
+        # (имя разговора, ключ) -> время последнего изменения состояния
+        # для незавершённых разговоров
+        self._active_conversations = {}
+        self._last_evicted = time.time()
+        # Вызывается с user_id, чьи user_data нужно убрать из памяти
+        self.on_evict_user = None
+        # Вызывается с (имя разговора, ключ) для разговора, который нужно
+        # завершить в памяти
+        self.on_evict_conversation = None
+        self.writes = 0
+        self.evicted = 0
+
+    def _expired_before(self, now):
+        return now - self.ttl if self.ttl else None
+
+    async def get_user_data(self):
+        rows = await asyncio.to_thread(self._load_user_data, time.time())
+        user_data = {}
+        for user_id, data, updated_at in rows:
+            user_data[user_id] = json.loads(data)
+            self._last_seen[user_id] = updated_at
+        return user_data
+
+    def _load_user_data(self, now):
+        expired_before = self._expired_before(now)
+        with db.read() as conn:
+            return conn.execute(
+                "SELECT user_id, data, updated_at FROM user_data WHERE updated_at >= ?",
+                (expired_before or 0,),
+            ).fetchall()
+
+    async def get_conversations(self, name):
+        rows = await asyncio.to_thread(self._load_conversations, name, time.time())
+        conversations = {}
+        for conversation_key, state, updated_at in rows:
+            key = tuple(json.loads(conversation_key))
+            conversations[key] = json.loads(state)
+            self._active_conversations[(name, key)] = updated_at
+        return conversations
+
+    def _load_conversations(self, name, now):
+        expired_before = self._expired_before(now)
+        with db.read() as conn:
+            return conn.execute(
+                """
+                SELECT conversation_key, state, updated_at FROM conversations
+                WHERE name = ? AND updated_at >= ?
+            """,
+                (name, expired_before or 0),
+            ).fetchall()
+
+    async def update_user_data(self, user_id, data):
+        self._pending_user_data[user_id] = data
+        self._last_seen[user_id] = time.time()
+        self._schedule_write()
+
+    async def drop_user_data(self, user_id):
+        self._pending_user_data[user_id] = None
+        self._last_seen.pop(user_id, None)
+        self._schedule_write()
+
+    async def update_conversation(self, name, key, new_state):
+        self._pending_conversations[(name, key)] = new_state
+        if new_state is None:
+            self._active_conversations.pop((name, key), None)
+        else:
+            self._active_conversations[(name, key)] = time.time()
+        self._schedule_write()
+
+    # Данные чатов, бота и callback_data не хранятся
+
+    async def get_chat_data(self):
+        return {}
+
+    async def get_bot_data(self):
+        return {}
+
+    async def get_callback_data(self):
+        return None
+
+    async def update_chat_data(self, chat_id, data):
+        pass
+
+    async def update_bot_data(self, data):
+        pass
+
+    async def update_callback_data(self, data):
+        pass
+
+    async def drop_chat_data(self, chat_id):
+        pass
+
+    async def refresh_user_data(self, user_id, user_data):
+        pass
+
+    async def refresh_chat_data(self, chat_id, chat_data):
+        pass
+
+    async def refresh_bot_data(self, bot_data):
+        pass
+
+    def _schedule_write(self):
+        if self._write_task is None or self._write_task.done():
+            self._write_task = asyncio.create_task(self._write_later())
+
+    async def _write_later(self):
+        await asyncio.sleep(WRITE_DELAY)
+        await self._write_pending()
+
+    async def flush(self):
+        """
+        Записывает все накопленные изменения (при остановке бота).
+        """
+        if self._write_task is not None and not self._write_task.done():
+            self._write_task.cancel()
+            try:
+                await self._write_task
+            except asyncio.CancelledError:
+                pass
+        await self._write_pending()
+
+    async def _write_pending(self):
+        now = time.time()
+        user_data, self._pending_user_data = self._pending_user_data, {}
+        conversations, self._pending_conversations = self._pending_conversations, {}
+        evict = self.ttl and now - self._last_evicted >= self.evict_interval
+        if not (user_data or conversations or evict):
+            return
+        try:
+            await asyncio.to_thread(self._write, user_data, conversations, now, evict)
+        except Exception as e:
+            print(f"Ошибка при сохранении состояния разговоров: {e}")
+            # Повторим с новыми изменениями, не затирая более поздние
+            for user_id, data in user_data.items():
+                self._pending_user_data.setdefault(user_id, data)
+            for key, state in conversations.items():
+                self._pending_conversations.setdefault(key, state)
+            return
+        self.writes += 1
+        if evict:
+            self._last_evicted = now
+            self._evict_from_memory(now)
+
+    def _write(self, user_data, conversations, now, evict):
+        upsert_users = [
+            (user_id, _dumps(data), now)
+            for user_id, data in user_data.items()
+            if data is not None
+        ]
+        delete_users = [
+            (user_id,) for user_id, data in user_data.items() if data is None
+        ]
+        upsert_conversations = [
+            (name, _dumps(key), _dumps(state), now)
+            for (name, key), state in conversations.items()
+            if state is not None
+        ]
+        delete_conversations = [
+            (name, _dumps(key))
+            for (name, key), state in conversations.items()
+            if state is None
+        ]
+        with db.write() as conn:
+            conn.executemany(
+                "INSERT OR REPLACE INTO user_data (user_id, data, updated_at) "
+                "VALUES (?, ?, ?)",
+                upsert_users,
+            )
+            conn.executemany("DELETE FROM user_data WHERE user_id = ?", delete_users)
+            conn.executemany(
+                "INSERT OR REPLACE INTO conversations "
+                "(name, conversation_key, state, updated_at) VALUES (?, ?, ?, ?)",
+                upsert_conversations,
+            )
+            conn.executemany(
+                "DELETE FROM conversations WHERE name = ? AND conversation_key = ?",
+                delete_conversations,
+            )
+            if evict:
+                expired_before = self._expired_before(now)
+                conn.execute(
+                    "DELETE FROM user_data WHERE updated_at < ?", (expired_before,)
+                )
+                conn.execute(
+                    "DELETE FROM conversations WHERE updated_at < ?", (expired_before,)
+                )
+
+    def _evict_from_memory(self, now):
+        """
+        Завершает в памяти разговоры, не менявшиеся дольше ttl, и убирает
+        user_data неактивных пользователей. Данные пользователя с ещё живым
+        разговором остаются: обработчикам следующего шага они нужны.
+        """
+        expired_before = self._expired_before(now)
+        for (name, key), updated_at in list(self._active_conversations.items()):
+            if updated_at < expired_before:
+                del self._active_conversations[(name, key)]
+                if self.on_evict_conversation is not None:
+                    self.on_evict_conversation(name, key)
+        if self.on_evict_user is None:
+            return
+        in_conversation = {key[-1] for _, key in self._active_conversations if key}
+        for user_id, last_seen in list(self._last_seen.items()):
+            if last_seen < expired_before and user_id not in in_conversation:
+                del self._last_seen[user_id]
+                self.on_evict_user(user_id)
+                self.evicted += 1
@@ -0,0 +1,105 @@
+# poster_cache.py
+
+import threading
+import time
+from collections import OrderedDict
+
+from database.database import db
+
+
+class PosterFileIdCache:
+    """
+    Соответствие «фильм → file_id» для уже отправленных постеров.
+
+    После первой отправки постера по URL Telegram возвращает file_id, и
+    повторные отправки того же постера используют его вместо повторной
+    загрузки картинки с CDN Кинопоиска. Записи хранятся в SQLite и
+    ограничены max_entries по принципу LRU.
+    """
+
+    def __init__(self, max_entries=10000):
+        """
+        :param max_entries: Максимальное количество хранимых file_id
+        """
+        self.max_entries = max_entries
+        # cache_key -> (poster_url, file_id)
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def make_key(movie_id, poster_url):
+        if movie_id is not None:
+            return f"movie:{movie_id}"
+        return f"url:{poster_url}"
+
+    def load(self):
+        """
+        Загружает последние max_entries записей из базы данных.
+        """
+        with db.read() as conn:
+            cursor = conn.cursor()
+            cursor.execute(
+                """
+                SELECT cache_key, poster_url, file_id
+                FROM poster_file_ids
+                ORDER BY updated_at DESC
+                LIMIT ?
+            """,
+                (self.max_entries,),
+            )
+            rows = cursor.fetchall()
+        with self._lock:
+            self._entries.clear()
+            for cache_key, poster_url, file_id in reversed(rows):
+                self._entries[cache_key] = (poster_url, file_id)
+
+    def get(self, movie_id, poster_url):
+        """
+        Возвращает file_id постера или None. Если у фильма сменился постер,
+        старый file_id не используется.
+        """
+        cache_key = self.make_key(movie_id, poster_url)
+        with self._lock:
+            entry = self._entries.get(cache_key)
+            if entry is None or entry[0] != poster_url:
+                return None
+            self._entries.move_to_end(cache_key)
+            return entry[1]
+
+    def put(self, movie_id, poster_url, file_id):
+        """
+        Запоминает file_id постера в памяти и в базе данных.
+        """
+        cache_key = self.make_key(movie_id, poster_url)
+        with self._lock:
+            self._entries[cache_key] = (poster_url, file_id)
+            self._entries.move_to_end(cache_key)
+            evicted = []
+            while len(self._entries) > self.max_entries:
+                evicted.append((self._entries.popitem(last=False)[0],))
+        with db.write() as conn:
+            cursor = conn.cursor()
+            cursor.execute(
+                """
+                INSERT OR REPLACE INTO poster_file_ids
+                    (cache_key, poster_url, file_id, updated_at)
+                VALUES (?, ?, ?, ?)
+            """,
+                (cache_key, poster_url, file_id, time.time()),
+            )
+            if evicted:
+                cursor.executemany(
+                    "DELETE FROM poster_file_ids WHERE cache_key = ?", evicted
+                )
+
+    def invalidate(self, movie_id, poster_url):
+        """
+        Удаляет file_id, который Telegram отказался принимать.
+        """
+        cache_key = self.make_key(movie_id, poster_url)
+        with self._lock:
+            self._entries.pop(cache_key, None)
+        with db.write() as conn:
+            conn.execute(
+                "DELETE FROM poster_file_ids WHERE cache_key = ?", (cache_key,)
+            )
@@ -0,0 +1,424 @@
+# carousel.py
+
+import asyncio
+import itertools
+import time
+from collections import OrderedDict
+
+from telegram import InlineKeyboardButton, InlineKeyboardMarkup, InputMediaPhoto
+from telegram.error import BadRequest
+
+from handlers.prefetch import Prefetcher
+from utils.metrics import time_to_first_result
+from utils.models import Movie
+from utils.rate_limiter import INTERACTIVE
+
+# Сколько фильмов запрашивать у API за одну страницу карусели
+CAROUSEL_PAGE_SIZE = 10
+
+# Следующая страница загружается заранее, когда до конца загруженных
+# фильмов остаётся не больше PREFETCH_DISTANCE
+PREFETCH_DISTANCE = CAROUSEL_PAGE_SIZE // 2
+
+# callback_data кнопок карусели: carousel:<id сессии>:<индекс фильма>
+CAROUSEL_PATTERN = r"^carousel:\d+:\d+$"
+
+
+def docs_pager(docs, page_size=CAROUSEL_PAGE_SIZE):
+    """
+    Функция загрузки страниц карусели из готового списка фильмов.
+    """
+
+    async def fetch_page(page):
+        start = (page - 1) * page_size
+        return docs[start : start + page_size]
+
+    return fetch_page
+
+
+class CarouselSession:
+    """
+    Результаты одного поиска, которые листаются в одном сообщении.
+
+    Фильмы загружаются страницами по мере пролистывания.
+    """
+
+    __slots__ = (
+        "session_id",
+        "chat_id",
+        "user_id",
+        "fetch_page",
+        "total",
+        "page_size",
+        "movies",
+        "seen_ids",
+        "pages_loaded",
+        "exhausted",
+        "index",
+        "message_id",
+        "has_photo",
+        "expires_at",
+        "lock",
+    )
+
+    def __init__(self, session_id, chat_id, user_id, fetch_page, total, page_size):
+        self.session_id = session_id
+        self.chat_id = chat_id
+        self.user_id = user_id
+        self.fetch_page = fetch_page
+        self.total = total
+        self.page_size = page_size
+        self.movies = []
+        self.seen_ids = set()
+        self.pages_loaded = 0
+        self.exhausted = False
+        self.index = 0
+        self.message_id = None
+        self.has_photo = False
+        self.expires_at = 0.0
+        # Не даёт двум нажатиям одновременно загружать одну страницу
+        self.lock = asyncio.Lock()
+
+    def add_docs(self, docs):
+        new_docs = []
+        for doc in docs:
+            movie_id = doc.get("id")
+            if movie_id is not None:
+                if movie_id in self.seen_ids:
+                    continue
+                self.seen_ids.add(movie_id)
+            new_docs.append(doc)
+        self.movies.extend(Movie.from_api_docs(new_docs))
+        if len(docs) < self.page_size or len(self.movies) >= self.total:
+            # Результаты закончились или набрано запрошенное количество
+            self.exhausted = True
+            del self.movies[self.total :]
+
+
+class CarouselSessions:
+    """
+    Сессии карусели в памяти с вытеснением по TTL и по количеству.
+    """
+
+    def __init__(self, ttl=30 * 60, max_sessions=10000):
+        """
+        :param ttl: Сколько секунд сессия живёт после последнего действия
+        :param max_sessions: Максимальное количество сессий
+        """
+        self.ttl = ttl
+        self.max_sessions = max_sessions
+        self._sessions = OrderedDict()
+        self._ids = itertools.count(1)
+        # Вызывается для каждой удалённой сессии
+        self.on_evict = None
+
+    def __len__(self):
+        return len(self._sessions)
+
+    def _evict(self, now):
+        # Сессии упорядочены по последнему действию, просроченные — в начале
+        while self._sessions:
+            session = next(iter(self._sessions.values()))
+            if session.expires_at > now and len(self._sessions) <= self.max_sessions:
+                break
+            self.drop(session.session_id)
+
+    def create(self, chat_id, user_id, fetch_page, total, page_size=CAROUSEL_PAGE_SIZE):
+        session = CarouselSession(
+            next(self._ids), chat_id, user_id, fetch_page, total, page_size
+        )
+        now = time.monotonic()
+        session.expires_at = now + self.ttl
+        self._sessions[session.session_id] = session
+        self._evict(now)
+        return session
+
+    def get(self, session_id):
+        """
+        Возвращает сессию и продлевает её или None, если она истекла.
+        """
+        now = time.monotonic()
+        self._evict(now)
+        session = self._sessions.get(session_id)
+        if session is not None:
+            session.expires_at = now + self.ttl
+            self._sessions.move_to_end(session_id)
+        return session
+
+    def drop(self, session_id):
+        session = self._sessions.pop(session_id, None)
+        if session is not None and self.on_evict is not None:
+            self.on_evict(session)
+
+
+class Carousel:
+    """
+    Выдача результатов поиска одним сообщением с кнопками листания.
+
+    Количество исходящих сообщений не зависит от размера выборки: одно
+    сообщение на поиск, дальше оно редактируется.
+    """
+
+    def __init__(self, sender, poster_cache, renderer, sessions=None, prefetcher=None):
+        """
+        :param sender: Очередь исходящих сообщений (OutboundScheduler).
+        :param poster_cache: Кэш file_id постеров (PosterFileIdCache).
+        :param renderer: Кэш подписей к фильмам (CaptionRenderer).
+        :param sessions: Хранилище сессий (CarouselSessions).
+        :param prefetcher: Фоновая загрузка следующих страниц (Prefetcher).
+        """
+        self.sender = sender
+        self.poster_cache = poster_cache
+        self.renderer = renderer
+        self.sessions = sessions or CarouselSessions()
+        self.prefetcher = prefetcher or Prefetcher()
+        self.sessions.on_evict = self.session_closed
+
+    async def open(self, update, context, fetch_page, total, started):
+        """
+        Загружает первую страницу результатов и отправляет первый фильм.
+
+        :param fetch_page: Корутинная функция page -> список фильмов API.
+        :param total: Сколько фильмов запросил пользователь.
+        :param started: Момент получения запроса (time.monotonic()).
+        :return: Количество загруженных фильмов (0 — ничего не найдено).
+        """
+        user_id = update.effective_user.id
+        # Предыдущий поиск пользователя больше не листается
+        self.end_browsing(user_id)
+        session = self.sessions.create(
+            update.effective_chat.id, user_id, fetch_page, total
+        )
+        try:
+            await self.load(session, 0)
+        except Exception as e:
+            print(f"Ошибка при загрузке результатов карусели: {e}")
+        if not session.movies:
+            self.sessions.drop(session.session_id)
+            return 0
+        await self.show(context, session, 0)
+        time_to_first_result.since(started)
+        self.prefetch(session)
+        return len(session.movies)
+
+    def end_browsing(self, user_id):
+        """
+        Отменяет фоновые загрузки пользователя (поиск закончен или отменён).
+        """
+        self.prefetcher.cancel(user_id)
+
+    def session_closed(self, session):
+        self.prefetcher.cancel(
+            session.user_id, match=lambda key: key[0] == session.session_id
+        )
+
+    async def load(self, session, index):
+        """
+        Загружает страницы, пока фильм с номером index не станет доступен
+        или результаты не закончатся. Заранее загруженные страницы берутся
+        у prefetcher. Ошибка загрузки пробрасывается, а страница остаётся
+        незагруженной.
+        """
+        async with session.lock:
+            while index >= len(session.movies) and not session.exhausted:
+                page = session.pages_loaded + 1
+                docs = await self.prefetcher.take(
+                    session.user_id,
+                    (session.session_id, page),
+                    lambda: session.fetch_page(page),
+                )
+                session.pages_loaded = page
+                session.add_docs(docs)
+
+    def prefetch(self, session):
+        """
+        Запускает фоновую загрузку следующей страницы, если пользователь
+        приближается к концу загруженных фильмов.
+        """
+        if session.exhausted:
+            return
+        if len(session.movies) - session.index > PREFETCH_DISTANCE:
+            return
+        page = session.pages_loaded + 1
+        self.prefetcher.schedule(
+            session.user_id,
+            (session.session_id, page),
+            lambda: session.fetch_page(page),
+        )
+
+    async def handle(self, update, context):
+        """
+        Обработчик кнопок карусели.
+        """
+        query = update.callback_query
+        _, session_id, index = query.data.split(":")
+        session = self.sessions.get(int(session_id))
+        if session is None or session.chat_id != query.message.chat_id:
+            await query.answer("⌛ Результаты устарели, повторите поиск.")
+            await self.sender.send(
+                query.message.chat_id,
+                lambda: query.edit_message_reply_markup(reply_markup=None),
+            )
+            return
+        index = int(index)
+        if index == session.index:
+            await query.answer()
+            return
+        try:
+            await self.load(session, index)
+        except Exception as e:
+            # Сессия не меняется: следующее нажатие загрузит страницу заново
+            print(f"Ошибка при загрузке результатов карусели: {e}")
+            await query.answer("⚠️ Не удалось загрузить фильмы, попробуйте ещё раз.")
+            return
+        await query.answer()
+        index = min(index, len(session.movies) - 1)
+        await self.show(context, session, index)
+        self.prefetch(session)
+
+    def keyboard(self, session):
+        index = session.index
+        count = len(session.movies)
+        total = f"{count}" if session.exhausted else f"{count}+"
+        sid = session.session_id
+
+        def button(text, target):
+            return InlineKeyboardButton(text, callback_data=f"carousel:{sid}:{target}")
+
+        row = []
+        if index > 0:
+            row.append(button("⏪", max(0, index - session.page_size)))
+            row.append(button("◀️", index - 1))
+        row.append(button(f"{index + 1} / {total}", index))
+        if index + 1 < count or not session.exhausted:
+            row.append(button("▶️", index + 1))
+            row.append(button("⏩", index + session.page_size))
+        return InlineKeyboardMarkup([row])
+
+    async def show(self, context, session, index):
+        """
+        Показывает фильм с номером index: отправляет первое сообщение или
+        редактирует уже отправленное.
+        """
+        session.index = index
+        movie = session.movies[index]
+        caption = self.renderer.render(movie)
+        reply_markup = self.keyboard(session)
+        chat_id = session.chat_id
+
+        if session.message_id is not None:
+            if movie.poster_url and session.has_photo:
+                if await self.edit_photo(
+                    context, session, movie, caption, reply_markup
+                ):
+                    return
+            elif not movie.poster_url and not session.has_photo:
+                try:
+                    await self.edit(
+                        chat_id,
+                        lambda: context.bot.edit_message_text(
+                            caption,
+                            chat_id=chat_id,
+                            message_id=session.message_id,
+                            reply_markup=reply_markup,
+                        ),
+                    )
+                    return
+                except BadRequest:
+                    pass  # Например, сообщение удалено — отправляем заново
+            # Тип сообщения меняется (фото ↔ текст) — отправляем заново
+            message_id = session.message_id
+            session.message_id = None
+            try:
+                await self.sender.send(
+                    chat_id,
+                    lambda: context.bot.delete_message(chat_id, message_id),
+                )
+            except BadRequest:
+                pass  # Сообщение уже удалено
+
+        message = None
+        if movie.poster_url:
+            file_id = self.poster_cache.get(movie.movie_id, movie.poster_url)
+            for photo in filter(None, (file_id, movie.poster_url)):
+                try:
+                    message = await self.sender.send(
+                        chat_id,
+                        lambda: context.bot.send_photo(
+                            chat_id,
+                            photo,
+                            caption=caption,
+                            reply_markup=reply_markup,
+                        ),
+                    )
+                    break
+                except BadRequest:
+                    if photo == file_id:
+                        await asyncio.to_thread(
+                            self.poster_cache.invalidate,
+                            movie.movie_id,
+                            movie.poster_url,
+                        )
+        if message is None:
+            # Фильм без постера или постер недоступен
+            message = await self.sender.send(
+                chat_id,
+                lambda: context.bot.send_message(
+                    chat_id, caption, reply_markup=reply_markup
+                ),
+            )
+        session.message_id = message.message_id
+        session.has_photo = bool(message.photo)
+        await self.remember_poster(movie, message)
+
+    async def edit_photo(self, context, session, movie, caption, reply_markup):
+        """
+        Заменяет фото и подпись в сообщении карусели.
+
+        :return: False, если постер не удалось показать.
+        """
+        chat_id = session.chat_id
+        file_id = self.poster_cache.get(movie.movie_id, movie.poster_url)
+        for photo in filter(None, (file_id, movie.poster_url)):
+            try:
+                message = await self.edit(
+                    chat_id,
+                    lambda: context.bot.edit_message_media(
+                        InputMediaPhoto(photo, caption=caption),
+                        chat_id=chat_id,
+                        message_id=session.message_id,
+                        reply_markup=reply_markup,
+                    ),
+                )
+            except BadRequest:
+                if photo == file_id:
+                    await asyncio.to_thread(
+                        self.poster_cache.invalidate, movie.movie_id, movie.poster_url
+                    )
+                continue
+            if message is not None and message is not True:
+                await self.remember_poster(movie, message)
+            return True
+        return False
+
+    async def edit(self, chat_id, factory):
+        """
+        Редактирует сообщение; «сообщение не изменилось» ошибкой не считается.
+        """
+        try:
+            return await self.sender.send(chat_id, factory, priority=INTERACTIVE)
+        except BadRequest as e:
+            if "message is not modified" in str(e).lower():
+                return None
+            raise
+
+    async def remember_poster(self, movie, message):
+        """
+        Сохраняет file_id постера из отправленного сообщения.
+        """
+        if movie.poster_url and message.photo:
+            file_id = message.photo[-1].file_id
+            if file_id != self.poster_cache.get(movie.movie_id, movie.poster_url):
+                await asyncio.to_thread(
+                    self.poster_cache.put, movie.movie_id, movie.poster_url, file_id
+                )
@@ -6,22 +6,36 @@ from telegram import (
     KeyboardButton,
     InlineKeyboardButton,
     InlineKeyboardMarkup,
+    InputMediaPhoto,
 )
+from telegram.error import BadRequest, TelegramError
 from telegram.ext import (
-    CallbackContext,
+    ContextTypes,
     CommandHandler,
     ConversationHandler,
     MessageHandler,
-    Filters,
+    filters,
     CallbackQueryHandler,
 )
+from handlers.carousel import (
+    Carousel,
+    CAROUSEL_PAGE_SIZE,
+    CAROUSEL_PATTERN,
+    docs_pager,
+)
 from utils.models import Movie
+from database.catalog import title_contains
 from database.database import (
-    add_search_history,
-    get_search_history,
+    get_search_history_page,
     clear_search_history,
 )
+from utils.metrics import time_to_first_result
+from utils.rate_limiter import INTERACTIVE, BULK
+from utils.rendering import CaptionRenderer
 from datetime import datetime
+import asyncio
+import sqlite3
+import time
 import locale
 from html import escape  # Для экранирования специальных символов
 
@@ -37,21 +51,78 @@ MOVIE_NAME, MOVIE_COUNT = range(2)
 MOVIE_RATING, MOVIE_GENRE, MOVIE_RATING_COUNT = range(2, 5)
 BUDGET_TYPE, BUDGET_GENRE, BUDGET_COUNT = range(5, 8)
 
+# Максимальное количество фото в одном альбоме Telegram
+MEDIA_GROUP_SIZE = 10
+
+# Записей истории на одной странице и максимальная длина названия в ней,
+# чтобы страница гарантированно помещалась в одно сообщение
+HISTORY_PAGE_SIZE = 10
+HISTORY_NAME_LIMIT = 100
+
+
+async def iterate(items):
+    """
+    Асинхронный итератор по готовому списку (для deliver_movies).
+    """
+    for item in items:
+        yield item
+
+
+async def iterate_with_fallback(items, fallback):
+    """
+    Отдаёт элементы асинхронного итератора items, а если он ничего не
+    вернул — элементы списка fallback.
+    """
+    empty = True
+    async for item in items:
+        empty = False
+        yield item
+    if empty:
+        for item in fallback:
+            yield item
+
 
 class CommandHandlers:
     """
     Класс для обработки команд и сообщений пользователя.
     """
 
-    def __init__(self, api_client, dispatcher):
+    def __init__(
+        self,
+        api_client,
+        application,
+        sender,
+        poster_cache,
+        history_writer,
+        delivery_mode="single",
+        catalog=None,
+        renderer=None,
+        carousel=None,
+    ):
         """
         Инициализация обработчиков команд.
 
-        :param api_client: Клиент для взаимодействия с API Кинопоиска.
-        :param dispatcher: Диспетчер для регистрации обработчиков.
+        :param api_client: Асинхронный клиент для взаимодействия с API Кинопоиска.
+        :param application: Приложение для регистрации обработчиков.
+        :param sender: Очередь исходящих сообщений (OutboundScheduler).
+        :param poster_cache: Кэш file_id постеров (PosterFileIdCache).
+        :param history_writer: Отложенная запись истории (HistoryWriter).
+        :param delivery_mode: Способ отправки результатов: "single" — каждый
+            фильм отдельным сообщением, "album" — постеры альбомами,
+            "carousel" — одно сообщение с кнопками листания.
+        :param catalog: Локальный каталог фильмов (MovieCatalog) или None.
+        :param renderer: Кэш подписей к фильмам (CaptionRenderer).
+        :param carousel: Выдача результатов одним сообщением (Carousel).
         """
         self.api_client = api_client
-        self.dispatcher = dispatcher
+        self.application = application
+        self.sender = sender
+        self.poster_cache = poster_cache
+        self.history_writer = history_writer
+        self.delivery_mode = delivery_mode
+        self.catalog = catalog
+        self.renderer = renderer or CaptionRenderer()
+        self.carousel = carousel or Carousel(sender, poster_cache, self.renderer)
 
         # Создание обработчиков команд
         self.start_handler = CommandHandler("start", self.start)
@@ -60,39 +131,42 @@ class CommandHandlers:
 
         # Обработчики кнопок
         self.help_button_handler = MessageHandler(
-            Filters.regex("^Помощь$"), self.help_command
+            filters.Regex("^Помощь$"), self.help_command
         )
         self.back_to_main_handler = MessageHandler(
-            Filters.regex("^На главную$"), self.start
+            filters.Regex("^На главную$"), self.start
         )
         self.history_button_handler = MessageHandler(
-            Filters.regex("^История поиска$"), self.history
+            filters.Regex("^История поиска$"), self.history
         )
 
         # Обработчик для поиска фильмов по названию
         self.movie_search_handler = ConversationHandler(
             entry_points=[
                 CommandHandler("movie_search", self.movie_search),
-                MessageHandler(Filters.regex("^Поиск по названию$"), self.movie_search),
+                MessageHandler(filters.Regex("^Поиск по названию$"), self.movie_search),
             ],
             states={
                 MOVIE_NAME: [
-                    MessageHandler(Filters.regex("^Отмена$"), self.cancel),
+                    MessageHandler(filters.Regex("^Отмена$"), self.cancel),
                     MessageHandler(
-                        Filters.text & ~Filters.command, self.get_movie_name
+                        filters.TEXT & ~filters.COMMAND, self.get_movie_name
                     ),
                 ],
                 MOVIE_COUNT: [
-                    MessageHandler(Filters.regex("^Отмена$"), self.cancel),
+                    MessageHandler(filters.Regex("^Отмена$"), self.cancel),
                     MessageHandler(
-                        Filters.text & ~Filters.command, self.get_movie_count
+                        filters.TEXT & ~filters.COMMAND, self.get_movie_count
                     ),
                 ],
             },
             fallbacks=[
                 CommandHandler("cancel", self.cancel),
-                MessageHandler(Filters.regex("^Отмена$"), self.cancel),
+                MessageHandler(filters.Regex("^Отмена$"), self.cancel),
             ],
+            # Состояние сохраняется в SQLitePersistence и переживает перезапуск
+            name="movie_search",
+            persistent=True,
         )
 
         # Обработчик для поиска фильмов по рейтингу с учётом жанра
@@ -100,29 +174,31 @@ class CommandHandlers:
             entry_points=[
                 CommandHandler("movie_by_rating", self.movie_by_rating),
                 MessageHandler(
-                    Filters.regex("^Поиск по рейтингу$"), self.movie_by_rating
+                    filters.Regex("^Поиск по рейтингу$"), self.movie_by_rating
                 ),
             ],
             states={
                 MOVIE_RATING: [
-                    MessageHandler(Filters.regex("^Отмена$"), self.cancel),
-                    MessageHandler(Filters.text & ~Filters.command, self.get_rating),
+                    MessageHandler(filters.Regex("^Отмена$"), self.cancel),
+                    MessageHandler(filters.TEXT & ~filters.COMMAND, self.get_rating),
                 ],
                 MOVIE_GENRE: [
-                    MessageHandler(Filters.regex("^Отмена$"), self.cancel),
-                    MessageHandler(Filters.text & ~Filters.command, self.get_genre),
+                    MessageHandler(filters.Regex("^Отмена$"), self.cancel),
+                    MessageHandler(filters.TEXT & ~filters.COMMAND, self.get_genre),
                 ],
                 MOVIE_RATING_COUNT: [
-                    MessageHandler(Filters.regex("^Отмена$"), self.cancel),
+                    MessageHandler(filters.Regex("^Отмена$"), self.cancel),
                     MessageHandler(
-                        Filters.text & ~Filters.command, self.get_rating_count
+                        filters.TEXT & ~filters.COMMAND, self.get_rating_count
                     ),
                 ],
             },
             fallbacks=[
                 CommandHandler("cancel", self.cancel),
-                MessageHandler(Filters.regex("^Отмена$"), self.cancel),
+                MessageHandler(filters.Regex("^Отмена$"), self.cancel),
             ],
+            name="movie_by_rating",
+            persistent=True,
         )
 
         # Обработчик для поиска фильмов по бюджету с учётом жанра
@@ -130,45 +206,57 @@ class CommandHandlers:
             entry_points=[
                 CommandHandler("movie_by_budget", self.movie_by_budget),
                 MessageHandler(
-                    Filters.regex("^Поиск по бюджету$"), self.movie_by_budget
+                    filters.Regex("^Поиск по бюджету$"), self.movie_by_budget
                 ),
             ],
             states={
                 BUDGET_TYPE: [
-                    MessageHandler(Filters.regex("^Отмена$"), self.cancel),
+                    MessageHandler(filters.Regex("^Отмена$"), self.cancel),
                     MessageHandler(
-                        Filters.regex("^(Малобюджетные|Высокобюджетные)$"),
+                        filters.Regex("^(Малобюджетные|Высокобюджетные)$"),
                         self.get_budget_type,
                     ),
                 ],
                 BUDGET_GENRE: [
-                    MessageHandler(Filters.regex("^Отмена$"), self.cancel),
+                    MessageHandler(filters.Regex("^Отмена$"), self.cancel),
                     MessageHandler(
-                        Filters.text & ~Filters.command, self.get_budget_genre
+                        filters.TEXT & ~filters.COMMAND, self.get_budget_genre
                     ),
                 ],
                 BUDGET_COUNT: [
-                    MessageHandler(Filters.regex("^Отмена$"), self.cancel),
+                    MessageHandler(filters.Regex("^Отмена$"), self.cancel),
                     MessageHandler(
-                        Filters.text & ~Filters.command, self.get_budget_count
+                        filters.TEXT & ~filters.COMMAND, self.get_budget_count
                     ),
                 ],
             },
             fallbacks=[
                 CommandHandler("cancel", self.cancel),
-                MessageHandler(Filters.regex("^Отмена$"), self.cancel),
+                MessageHandler(filters.Regex("^Отмена$"), self.cancel),
             ],
+            name="movie_by_budget",
+            persistent=True,
         )
 
         # Обработчики кнопок для быстрого доступа
         self.search_by_name_button_handler = MessageHandler(
-            Filters.regex("^Поиск по названию$"), self.movie_search
+            filters.Regex("^Поиск по названию$"), self.movie_search
         )
         self.search_by_rating_button_handler = MessageHandler(
-            Filters.regex("^Поиск по рейтингу$"), self.movie_by_rating
+            filters.Regex("^Поиск по рейтингу$"), self.movie_by_rating
         )
         self.search_by_budget_button_handler = MessageHandler(
-            Filters.regex("^Поиск по бюджету$"), self.movie_by_budget
+            filters.Regex("^Поиск по бюджету$"), self.movie_by_budget
+        )
+
+        # Обработчик для листания истории
+        self.history_page_handler = CallbackQueryHandler(
+            self.handle_history_page, pattern=r"^history:(older|newer):\d+$"
+        )
+
+        # Кнопки листания результатов в режиме карусели
+        self.carousel_handler = CallbackQueryHandler(
+            self.carousel.handle, pattern=CAROUSEL_PATTERN
         )
 
         # Обработчик для очистки истории
@@ -179,9 +267,9 @@ class CommandHandlers:
 
     def register_handlers(self):
         """
-        Регистрация всех обработчиков в диспетчере.
+        Регистрация всех обработчиков в приложении.
         """
-        dp = self.dispatcher
+        dp = self.application
 
         dp.add_handler(self.start_handler)
         dp.add_handler(self.help_handler)
@@ -199,9 +287,80 @@ class CommandHandlers:
         dp.add_handler(self.back_to_main_handler)
         dp.add_handler(self.history_button_handler)
 
+        dp.add_handler(self.history_page_handler)
+        dp.add_handler(self.carousel_handler)
         dp.add_handler(self.clear_history_handler)
 
-    def start(self, update: Update, context: CallbackContext):
+    # --- Отправка сообщений через очередь исходящих сообщений ---
+
+    async def reply_text(self, update: Update, text, priority=INTERACTIVE, **kwargs):
+        """
+        Отвечает на сообщение пользователя с учётом лимитов Telegram.
+        """
+        return await self.sender.send(
+            update.effective_chat.id,
+            lambda: update.message.reply_text(text, **kwargs),
+            priority=priority,
+        )
+
+    async def send_photo(
+        self, update: Update, context: ContextTypes.DEFAULT_TYPE, movie: Movie, caption
+    ):
+        """
+        Отправляет постер фильма как часть выдачи результатов.
+
+        Если постер уже отправлялся, используется сохранённый file_id;
+        устаревший file_id удаляется и постер отправляется по URL.
+        """
+        chat_id = update.effective_chat.id
+        file_id = self.poster_cache.get(movie.movie_id, movie.poster_url)
+        if file_id:
+            try:
+                return await self.sender.send(
+                    chat_id,
+                    lambda: context.bot.send_photo(
+                        chat_id=chat_id, photo=file_id, caption=caption
+                    ),
+                    priority=BULK,
+                )
+            except BadRequest as e:
+                if "caption" in str(e).lower():
+                    raise
+                await asyncio.to_thread(
+                    self.poster_cache.invalidate, movie.movie_id, movie.poster_url
+                )
+
+        message = await self.sender.send(
+            chat_id,
+            lambda: context.bot.send_photo(
+                chat_id=chat_id, photo=movie.poster_url, caption=caption
+            ),
+            priority=BULK,
+        )
+        await self.remember_poster(movie, message)
+        return message
+
+    async def remember_poster(self, movie: Movie, message):
+        """
+        Сохраняет file_id постера из отправленного сообщения.
+        """
+        if message.photo:
+            file_id = message.photo[-1].file_id
+            if file_id != self.poster_cache.get(movie.movie_id, movie.poster_url):
+                await asyncio.to_thread(
+                    self.poster_cache.put, movie.movie_id, movie.poster_url, file_id
+                )
+
+    async def edit_message_text(self, query, text, **kwargs):
+        """
+        Редактирует сообщение, к которому привязана inline-кнопка.
+        """
+        return await self.sender.send(
+            query.message.chat_id,
+            lambda: query.edit_message_text(text, **kwargs),
+        )
+
+    async def start(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """
         Обработчик команды /start. Отправляет главное меню.
         """
@@ -214,15 +373,18 @@ class CommandHandlers:
             [KeyboardButton("История поиска"), KeyboardButton("Помощь")],
         ]
         reply_markup = ReplyKeyboardMarkup(keyboard, resize_keyboard=True)
-        update.message.reply_text(
+        await self.reply_text(
+            update,
             "👋 Привет! Я бот для поиска фильмов. Выберите действие:",
             reply_markup=reply_markup,
         )
 
-    def cancel(self, update: Update, context: CallbackContext):
+    async def cancel(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """
         Обработчик команды /cancel или кнопки Отмена. Отправляет главное меню.
         """
+        # Заранее загружаемые страницы результатов больше не понадобятся
+        self.carousel.end_browsing(update.effective_user.id)
         keyboard = [
             [
                 KeyboardButton("Поиск по названию"),
@@ -232,10 +394,12 @@ class CommandHandlers:
             [KeyboardButton("История поиска"), KeyboardButton("Помощь")],
         ]
         reply_markup = ReplyKeyboardMarkup(keyboard, resize_keyboard=True)
-        update.message.reply_text("❌ Действие отменено.", reply_markup=reply_markup)
+        await self.reply_text(
+            update, "❌ Действие отменено.", reply_markup=reply_markup
+        )
         return ConversationHandler.END
 
-    def help_command(self, update: Update, context: CallbackContext):
+    async def help_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """
         Обработчик команды /help. Отправляет список доступных команд.
         """
@@ -257,11 +421,11 @@ class CommandHandlers:
             "/movie_by_budget - Поиск фильмов по бюджету и жанру\n"
             "/history - Просмотр истории поиска\n"
         )
-        update.message.reply_text(help_text, reply_markup=reply_markup)
+        await self.reply_text(update, help_text, reply_markup=reply_markup)
 
     # --- Методы для поиска по названию ---
 
-    def movie_search(self, update: Update, context: CallbackContext):
+    async def movie_search(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """
         Начало поиска фильма по названию.
         """
@@ -269,70 +433,81 @@ class CommandHandlers:
         reply_markup = ReplyKeyboardMarkup(
             keyboard, resize_keyboard=True, one_time_keyboard=True
         )
-        update.message.reply_text(
+        await self.reply_text(
+            update,
             "🎬 Введите название фильма или сериала:",
             reply_markup=reply_markup,
         )
         return MOVIE_NAME
 
-    def get_movie_name(self, update: Update, context: CallbackContext):
+    async def get_movie_name(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """
         Сохранение названия фильма и запрос количества результатов.
         """
         name = update.message.text.strip()
         context.user_data["name"] = escape(name)
-        update.message.reply_text("🔢 Сколько вариантов вывести? (1-250)")
+        await self.reply_text(update, "🔢 Сколько вариантов вывести? (1-250)")
         return MOVIE_COUNT
 
-    def get_movie_count(self, update: Update, context: CallbackContext):
+    async def get_movie_count(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """
         Сохранение количества результатов, получение фильмов из API и отображение.
         """
+        started = time.monotonic()
         count_text = update.message.text.strip()
         try:
             count = int(count_text)
-            if count < 1 or count > 250:
-                update.message.reply_text("❌ Пожалуйста, введите число от 1 до 250.")
-                return MOVIE_COUNT
-
-            context.user_data["count"] = count
-
-            # Получение фильмов из API
-            movies_data = self.api_client.search_movies_by_name(
-                query=context.user_data["name"], limit=context.user_data["count"]
-            )
-
-            if not movies_data:
-                update.message.reply_text(
-                    "🔍 Фильмы не найдены. Попробуйте другой запрос."
-                )
-                return ConversationHandler.END
+        except ValueError:
+            await self.reply_text(update, "❌ Пожалуйста, введите число.")
+            return MOVIE_COUNT
+        if count < 1 or count > 250:
+            await self.reply_text(update, "❌ Пожалуйста, введите число от 1 до 250.")
+            return MOVIE_COUNT
 
-            movies = [Movie.from_api_data(movie) for movie in movies_data]
+        context.user_data["count"] = count
 
-            # Запись истории поиска
-            add_search_history(
-                user_id=update.effective_user.id,
-                search_type="name",
-                search_params={"name": context.user_data["name"], "count": count},
+        # Если в свежем локальном индексе нашлось достаточно названий,
+        # содержащих запрос целиком, API не нужен. Похожие названия (с
+        # опечаткой) могут оказаться другим фильмом, поэтому они остаются
+        # только запасным ответом, как и все локальные совпадения
+        query = context.user_data["name"]
+        local_docs, fresh = await self.catalog_docs(
+            "search_by_title", query=query, limit=count
+        )
+        exact = sum(title_contains(doc, query) for doc in local_docs)
+        found = await self.present_results(
+            update,
+            context,
+            started,
+            count,
+            local_docs,
+            use_local=fresh and exact >= count,
+            stream=lambda: self.api_client.stream_movies_by_name(query, count),
+            fetch_page=lambda page: self.api_client.fetch_movies_by_name(
+                query, page=page, limit=CAROUSEL_PAGE_SIZE
+            ),
+        )
+        if not found:
+            await self.reply_text(
+                update, "🔍 Фильмы не найдены. Попробуйте другой запрос."
             )
+            return ConversationHandler.END
 
-            # Отправка информации о фильмах пользователю
-            for movie in movies:
-                self.send_movie_info(update, context, movie)
-
-            # Отправка главного меню после всех результатов
-            self.send_main_menu(update, context)
+        # Запись истории поиска
+        self.history_writer.add(
+            user_id=update.effective_user.id,
+            search_type="name",
+            search_params={"name": context.user_data["name"], "count": count},
+        )
 
-            return ConversationHandler.END
+        # Отправка главного меню после всех результатов
+        await self.send_main_menu(update, context)
 
-        except ValueError:
-            update.message.reply_text("❌ Пожалуйста, введите число.")
-            return MOVIE_COUNT
+        return ConversationHandler.END
 
     # --- Методы для поиска по рейтингу и жанру ---
 
-    def movie_by_rating(self, update: Update, context: CallbackContext):
+    async def movie_by_rating(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """
         Начало поиска фильма по рейтингу.
         """
@@ -340,13 +515,14 @@ class CommandHandlers:
         reply_markup = ReplyKeyboardMarkup(
             keyboard, resize_keyboard=True, one_time_keyboard=True
         )
-        update.message.reply_text(
+        await self.reply_text(
+            update,
             "⭐ Введите рейтинг или диапазон рейтингов (например, 7 или 7-9.5):",
             reply_markup=reply_markup,
         )
         return MOVIE_RATING
 
-    def get_rating(self, update: Update, context: CallbackContext):
+    async def get_rating(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """
         Сохранение рейтинга и запрос жанра.
         """
@@ -364,31 +540,33 @@ class CommandHandlers:
 
             # Проверяем корректность введённых значений
             if not (1 <= min_rating <= 10) or not (1 <= max_rating <= 10):
-                update.message.reply_text(
-                    "❌ Пожалуйста, введите рейтинги в диапазоне от 1 до 10."
+                await self.reply_text(
+                    update, "❌ Пожалуйста, введите рейтинги в диапазоне от 1 до 10."
                 )
                 return MOVIE_RATING
             if min_rating > max_rating:
-                update.message.reply_text(
-                    "❌ Минимальный рейтинг не может быть больше максимального."
+                await self.reply_text(
+                    update, "❌ Минимальный рейтинг не может быть больше максимального."
                 )
                 return MOVIE_RATING
 
             context.user_data["min_rating"] = min_rating
             context.user_data["max_rating"] = max_rating
 
-            update.message.reply_text(
-                "🎨 Введите жанр фильма (например, драма, комедия) или напишите 'любой':"
+            await self.reply_text(
+                update,
+                "🎨 Введите жанр фильма (например, драма, комедия) или напишите 'любой':",
             )
             return MOVIE_GENRE
 
         except ValueError:
-            update.message.reply_text(
-                "❌ Пожалуйста, введите корректный рейтинг или диапазон рейтингов."
+            await self.reply_text(
+                update,
+                "❌ Пожалуйста, введите корректный рейтинг или диапазон рейтингов.",
             )
             return MOVIE_RATING
 
-    def get_genre(self, update: Update, context: CallbackContext):
+    async def get_genre(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """
         Сохранение жанра и запрос количества результатов.
         """
@@ -397,66 +575,79 @@ class CommandHandlers:
             context.user_data["genre"] = None
         else:
             context.user_data["genre"] = escape(genre_text)
-        update.message.reply_text("🔢 Сколько вариантов вывести? (1-250)")
+        await self.reply_text(update, "🔢 Сколько вариантов вывести? (1-250)")
         return MOVIE_RATING_COUNT
 
-    def get_rating_count(self, update: Update, context: CallbackContext):
+    async def get_rating_count(
+        self, update: Update, context: ContextTypes.DEFAULT_TYPE
+    ):
         """
         Сохранение количества результатов, получение фильмов из API и отображение.
         """
+        started = time.monotonic()
         count_text = update.message.text.strip()
         try:
             count = int(count_text)
-            if count < 1 or count > 250:
-                update.message.reply_text("❌ Пожалуйста, введите число от 1 до 250.")
-                return MOVIE_RATING_COUNT
-
-            context.user_data["count"] = count
-
-            # Получение фильмов из API с учетом жанра
-            movies_data = self.api_client.search_movies_by_rating(
-                min_rating=context.user_data["min_rating"],
-                max_rating=context.user_data["max_rating"],
-                genre=context.user_data["genre"],
-                limit=context.user_data["count"],
-            )
+        except ValueError:
+            await self.reply_text(update, "❌ Пожалуйста, введите число.")
+            return MOVIE_RATING_COUNT
+        if count < 1 or count > 250:
+            await self.reply_text(update, "❌ Пожалуйста, введите число от 1 до 250.")
+            return MOVIE_RATING_COUNT
 
-            if not movies_data:
-                update.message.reply_text(
-                    "🔍 Фильмы не найдены. Попробуйте другой запрос."
-                )
-                return ConversationHandler.END
-
-            movies = [Movie.from_api_data(movie) for movie in movies_data]
-
-            # Запись истории поиска
-            add_search_history(
-                user_id=update.effective_user.id,
-                search_type="rating",
-                search_params={
-                    "min_rating": context.user_data["min_rating"],
-                    "max_rating": context.user_data["max_rating"],
-                    "genre": context.user_data["genre"],
-                    "count": count,
-                },
+        context.user_data["count"] = count
+
+        # Фильмы берутся из локального каталога, если он свежий и в нём
+        # нашлось достаточно фильмов; иначе они загружаются из API, а
+        # локальные совпадения остаются запасным ответом
+        search = {
+            "min_rating": context.user_data["min_rating"],
+            "max_rating": context.user_data["max_rating"],
+            "genre": context.user_data["genre"],
+        }
+        local_docs, fresh = await self.catalog_docs(
+            "search_by_rating", limit=count, **search
+        )
+        found = await self.present_results(
+            update,
+            context,
+            started,
+            count,
+            local_docs,
+            use_local=fresh and len(local_docs) >= count,
+            stream=lambda: self.api_client.stream_movies_by_rating(
+                count=count, **search
+            ),
+            fetch_page=lambda page: self.api_client.fetch_movies_by_rating(
+                page=page, limit=CAROUSEL_PAGE_SIZE, **search
+            ),
+        )
+        if not found:
+            await self.reply_text(
+                update, "🔍 Фильмы не найдены. Попробуйте другой запрос."
             )
+            return ConversationHandler.END
 
-            # Отправка информации о фильмах пользователю
-            for movie in movies:
-                self.send_movie_info(update, context, movie)
-
-            # Отправка главного меню после всех результатов
-            self.send_main_menu(update, context)
+        # Запись истории поиска
+        self.history_writer.add(
+            user_id=update.effective_user.id,
+            search_type="rating",
+            search_params={
+                "min_rating": context.user_data["min_rating"],
+                "max_rating": context.user_data["max_rating"],
+                "genre": context.user_data["genre"],
+                "count": count,
+            },
+        )
 
-            return ConversationHandler.END
+        # Отправка главного меню после всех результатов
+        await self.send_main_menu(update, context)
 
-        except ValueError:
-            update.message.reply_text("❌ Пожалуйста, введите число.")
-            return MOVIE_RATING_COUNT
+        return ConversationHandler.END
 
     # --- Методы для поиска по бюджету и жанру ---
 
-    def movie_by_budget(self, update: Update, context: CallbackContext):
+    async def movie_by_budget(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """
         Начало поиска фильма по бюджету.
         """
@@ -467,7 +658,8 @@ class CommandHandlers:
         reply_markup = ReplyKeyboardMarkup(
             keyboard, resize_keyboard=True, one_time_keyboard=True
         )
-        update.message.reply_text(
+        await self.reply_text(
+            update,
             "💰 Выберите тип бюджета:\n"
             "• Малобюджетные (0-1,500,000 USD)\n"
             "• Высокобюджетные (100,000,000 USD и выше)",
@@ -475,7 +667,7 @@ class CommandHandlers:
         )
         return BUDGET_TYPE
 
-    def get_budget_type(self, update: Update, context: CallbackContext):
+    async def get_budget_type(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """
         Сохранение типа бюджета и запрос жанра.
         """
@@ -487,17 +679,21 @@ class CommandHandlers:
                 "100000000-1000000000"  # Верхний предел на 1 миллиард
             )
         else:
-            update.message.reply_text(
-                "❌ Пожалуйста, выберите корректный тип бюджета или нажмите 'Отмена'."
+            await self.reply_text(
+                update,
+                "❌ Пожалуйста, выберите корректный тип бюджета или нажмите 'Отмена'.",
             )
             return BUDGET_TYPE
 
-        update.message.reply_text(
-            "🎨 Введите жанр фильма (например, драма, комедия) или напишите 'любой':"
+        await self.reply_text(
+            update,
+            "🎨 Введите жанр фильма (например, драма, комедия) или напишите 'любой':",
         )
         return BUDGET_GENRE
 
-    def get_budget_genre(self, update: Update, context: CallbackContext):
+    async def get_budget_genre(
+        self, update: Update, context: ContextTypes.DEFAULT_TYPE
+    ):
         """
         Сохранение жанра и запрос количества результатов.
         """
@@ -506,63 +702,221 @@ class CommandHandlers:
             context.user_data["budget_genre"] = None
         else:
             context.user_data["budget_genre"] = escape(genre_text)
-        update.message.reply_text("🔢 Сколько вариантов вывести? (1-250)")
+        await self.reply_text(update, "🔢 Сколько вариантов вывести? (1-250)")
         return BUDGET_COUNT
 
-    def get_budget_count(self, update: Update, context: CallbackContext):
+    async def get_budget_count(
+        self, update: Update, context: ContextTypes.DEFAULT_TYPE
+    ):
         """
         Сохранение количества результатов, получение фильмов из API и отображение.
         """
+        started = time.monotonic()
         count_text = update.message.text.strip()
         try:
             count = int(count_text)
-            if count < 1 or count > 250:
-                update.message.reply_text("❌ Пожалуйста, введите число от 1 до 250.")
-                return BUDGET_COUNT
-
-            context.user_data["count"] = count
+        except ValueError:
+            await self.reply_text(update, "❌ Пожалуйста, введите число.")
+            return BUDGET_COUNT
+        if count < 1 or count > 250:
+            await self.reply_text(update, "❌ Пожалуйста, введите число от 1 до 250.")
+            return BUDGET_COUNT
 
-            # Получение фильмов из API с учетом жанра и бюджета
-            movies_data = self.api_client.search_movies_by_budget(
-                budget_range=context.user_data["budget_range"],
-                genre=context.user_data["budget_genre"],
-                limit=context.user_data["count"],
+        context.user_data["count"] = count
+
+        # Фильмы берутся из локального каталога, если он свежий и в нём
+        # нашлось достаточно фильмов; иначе они загружаются из API, а
+        # локальные совпадения остаются запасным ответом
+        search = {
+            "budget_range": context.user_data["budget_range"],
+            "genre": context.user_data["budget_genre"],
+        }
+        local_docs, fresh = await self.catalog_docs(
+            "search_by_budget", limit=count, **search
+        )
+        found = await self.present_results(
+            update,
+            context,
+            started,
+            count,
+            local_docs,
+            use_local=fresh and len(local_docs) >= count,
+            stream=lambda: self.api_client.stream_movies_by_budget(
+                count=count, **search
+            ),
+            fetch_page=lambda page: self.api_client.fetch_movies_by_budget(
+                page=page, limit=CAROUSEL_PAGE_SIZE, **search
+            ),
+        )
+        if not found:
+            await self.reply_text(
+                update, "🔍 Фильмы не найдены. Попробуйте другой запрос."
             )
+            return ConversationHandler.END
 
-            if not movies_data:
-                update.message.reply_text(
-                    "🔍 Фильмы не найдены. Попробуйте другой запрос."
+        # Запись истории поиска
+        self.history_writer.add(
+            user_id=update.effective_user.id,
+            search_type="budget",
+            search_params={
+                "budget_range": context.user_data["budget_range"],
+                "genre": context.user_data["budget_genre"],
+                "count": count,
+            },
+        )
+
+        # Отправка главного меню после всех результатов
+        await self.send_main_menu(update, context)
+
+        return ConversationHandler.END
+
+    # --- Поиск в локальном каталоге ---
+    async def catalog_docs(self, search, **kwargs):
+        """
+        Ищет фильмы в локальном каталоге. Запрос к SQLite и распаковка
+        фильмов выполняются в отдельном потоке, чтобы не задерживать
+        остальных пользователей.
+
+        :param search: Имя метода поиска MovieCatalog.
+        :param kwargs: Параметры поиска.
+        :return: (список фильмов, свежий ли каталог). Отвечать без API можно
+            только из свежего каталога; фильмы из устаревшего годятся как
+            запасной ответ, если API ничего не вернул.
+        """
+        if self.catalog is None:
+            return [], False
+        try:
+            return await asyncio.to_thread(self._search_catalog, search, kwargs)
+        except sqlite3.Error as e:
+            print(f"Ошибка при поиске в локальном каталоге: {e}")
+            return [], False
+
+    def _search_catalog(self, search, kwargs):
+        return getattr(self.catalog, search)(**kwargs), self.catalog.is_fresh()
+
+    # --- Выдача результатов поиска ---
+    async def present_results(
+        self,
+        update: Update,
+        context: ContextTypes.DEFAULT_TYPE,
+        started,
+        count,
+        local_docs,
+        use_local,
+        stream,
+        fetch_page,
+    ):
+        """
+        Показывает результаты поиска выбранным способом выдачи.
+
+        :param started: Момент получения запроса (time.monotonic()).
+        :param count: Сколько фильмов запросил пользователь.
+        :param local_docs: Фильмы из локального каталога.
+        :param use_local: Отвечать только из каталога; иначе фильмы
+            загружаются из API, а local_docs показываются, если API ничего
+            не вернул.
+        :param stream: Функция, возвращающая асинхронный поток фильмов API.
+        :param fetch_page: Корутинная функция page -> страница фильмов API
+            (для карусели).
+        :return: Количество показанных (для карусели — загруженных) фильмов.
+        """
+        if self.delivery_mode == "carousel":
+            if not use_local:
+                found = await self.carousel.open(
+                    update, context, fetch_page, count, started
                 )
-                return ConversationHandler.END
-
-            movies = [Movie.from_api_data(movie) for movie in movies_data]
-
-            # Запись истории поиска
-            add_search_history(
-                user_id=update.effective_user.id,
-                search_type="budget",
-                search_params={
-                    "budget_range": context.user_data["budget_range"],
-                    "genre": context.user_data["budget_genre"],
-                    "count": count,
-                },
+                if found or not local_docs:
+                    return found
+            return await self.carousel.open(
+                update, context, docs_pager(local_docs), count, started
             )
 
-            # Отправка информации о фильмах пользователю
-            for movie in movies:
-                self.send_movie_info(update, context, movie)
+        if use_local:
+            movies_data = iterate(local_docs)
+        else:
+            movies_data = iterate_with_fallback(stream(), local_docs)
+        return await self.deliver_movies(update, context, movies_data, started)
 
-            # Отправка главного меню после всех результатов
-            self.send_main_menu(update, context)
+    # --- Метод для потоковой отправки результатов поиска ---
+    async def deliver_movies(
+        self, update: Update, context: ContextTypes.DEFAULT_TYPE, movies_data, started
+    ):
+        """
+        Отправляет фильмы по мере их поступления из асинхронного итератора.
 
-            return ConversationHandler.END
+        В режиме "album" фильмы с постерами собираются в альбомы по
+        MEDIA_GROUP_SIZE штук, а фильмы без постера отправляются текстом сразу.
 
-        except ValueError:
-            update.message.reply_text("❌ Пожалуйста, введите число.")
-            return BUDGET_COUNT
+        :param movies_data: Асинхронный итератор словарей фильмов из API.
+        :param started: Момент получения запроса (time.monotonic()).
+        :return: Количество отправленных фильмов.
+        """
+        delivered = 0
+        first_sent = False
+        album = []
+        async for movie_data in movies_data:
+            movie = Movie.from_api_data(movie_data)
+            delivered += 1
+            if self.delivery_mode == "album" and movie.poster_url:
+                album.append(movie)
+                if len(album) < MEDIA_GROUP_SIZE:
+                    continue
+                await self.send_movie_album(update, context, album)
+                album = []
+            else:
+                await self.send_movie_info(update, context, movie)
+            if not first_sent:
+                time_to_first_result.since(started)
+                first_sent = True
+        if album:
+            await self.send_movie_album(update, context, album)
+            if not first_sent:
+                time_to_first_result.since(started)
+        return delivered
+
+    # --- Метод для отправки альбома постеров ---
+    async def send_movie_album(
+        self, update: Update, context: ContextTypes.DEFAULT_TYPE, movies
+    ):
+        """
+        Отправляет до MEDIA_GROUP_SIZE фильмов с постерами одним альбомом.
+        Если Telegram отклоняет альбом, фильмы отправляются по одному.
+
+        :param movies: Список объектов Movie, у каждого есть poster_url.
+        """
+        if len(movies) == 1:
+            await self.send_movie_info(update, context, movies[0])
+            return
+        # Уже отправлявшиеся постеры передаются по file_id
+        media = [
+            InputMediaPhoto(
+                media=self.poster_cache.get(movie.movie_id, movie.poster_url)
+                or movie.poster_url,
+                caption=self.renderer.render(movie),
+            )
+            for movie in movies
+        ]
+        try:
+            messages = await self.sender.send(
+                update.effective_chat.id,
+                lambda: context.bot.send_media_group(
+                    chat_id=update.effective_chat.id, media=media
+                ),
+                priority=BULK,
+                cost=len(media),
+            )
+        except TelegramError:
+            # Например, один из постеров недоступен — отправляем по отдельности
+            for movie in movies:
+                await self.send_movie_info(update, context, movie)
+            return
+        for movie, message in zip(movies, messages):
+            await self.remember_poster(movie, message)
 
     # --- Метод для отправки информации о фильме ---
-    def send_movie_info(self, update: Update, context: CallbackContext, movie: Movie):
+    async def send_movie_info(
+        self, update: Update, context: ContextTypes.DEFAULT_TYPE, movie: Movie
+    ):
         """
         Отправляет информацию о фильме пользователю.
 
@@ -570,88 +924,23 @@ class CommandHandlers:
         :param context: Контекст обратного вызова.
         :param movie: Объект Movie с информацией о фильме.
         """
-        # Ограничение длины описания
-        max_description_length = 300
-        description = movie.description
-        if len(description) > max_description_length:
-            description = description[:max_description_length].rstrip() + "..."
-
-        # Экранирование всех переменных для предотвращения ошибок
-        title = escape(movie.title)
-        description = escape(description)
-        rating = escape(str(movie.rating)) if movie.rating else "N/A"
-        year = escape(str(movie.year)) if movie.year else "Неизвестно"
-        genres = escape(", ".join(movie.genres))
-        age_rating = escape(str(movie.age_rating)) if movie.age_rating else "N/A"
-        budget = (
-            escape(f"${int(movie.budget):,}".replace(",", " "))
-            if movie.budget
-            else None
-        )
-
-        # Формирование сообщения
-        message = (
-            f"📌 Название: {title}\n"
-            f"📝 Описание: {description}\n"
-            f"⭐ Рейтинг: {rating}\n"
-            f"📅 Год: {year}\n"
-            f"🎭 Жанр: {genres}\n"
-            f"🔞 Возрастной рейтинг: {age_rating}+\n"
-        )
-
-        # Добавление бюджета, если доступно
-        if budget:
-            message += f"💸 Бюджет: {budget}\n"
-
-        # Проверка длины сообщения
-        if len(message) > 1024:
-            message = message[:1021].rstrip() + "..."
-
-        if movie.poster_url:
-            try:
-                context.bot.send_photo(
-                    chat_id=update.effective_chat.id,
-                    photo=movie.poster_url,
-                    caption=message,
-                )
-            except Exception as e:
-                # Если сообщение слишком длинное, отправляем без описания и бюджета
-                if "Message caption is too long" in str(e):
-                    message = (
-                        f"📌 Название: {title}\n"
-                        f"⭐ Рейтинг: {rating}\n"
-                        f"📅 Год: {year}\n"
-                        f"🎭 Жанр: {genres}\n"
-                        f"🔞 Возрастной рейтинг: {age_rating}+"
-                    )
-                    if budget:
-                        message += f"\n💸 Бюджет: {budget}"
-                    if len(message) > 1024:
-                        message = message[:1021].rstrip() + "..."
-                    context.bot.send_photo(
-                        chat_id=update.effective_chat.id,
-                        photo=movie.poster_url,
-                        caption=message,
-                    )
-                else:
-                    update.message.reply_text(
-                        "❌ Произошла ошибка при отправке информации о фильме. Пожалуйста, попробуйте позже."
-                    )
-        else:
-            try:
-                update.message.reply_text(message)
-            except Exception as e:
-                # Если сообщение слишком длинное, отправляем его частями или сокращаем
-                if "too long" in str(e).lower():
-                    for i in range(0, len(message), 1024):
-                        update.message.reply_text(message[i : i + 1024])
-                else:
-                    update.message.reply_text(
-                        "❌ Произошла ошибка при отправке информации о фильме. Пожалуйста, попробуйте позже."
-                    )
+        # Подпись уже укладывается в лимит Telegram, повторные попытки не нужны
+        message = self.renderer.render(movie)
+
+        try:
+            if movie.poster_url:
+                await self.send_photo(update, context, movie, message)
+            else:
+                await self.reply_text(update, message, priority=BULK)
+        except TelegramError:
+            await self.reply_text(
+                update,
+                "❌ Произошла ошибка при отправке информации о фильме. Пожалуйста, попробуйте позже.",
+                priority=BULK,
+            )
 
     # --- Метод для отправки главного меню ---
-    def send_main_menu(self, update: Update, context: CallbackContext):
+    async def send_main_menu(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """
         Отправляет главное меню пользователю.
         """
@@ -664,99 +953,166 @@ class CommandHandlers:
             [KeyboardButton("История поиска"), KeyboardButton("Помощь")],
         ]
         reply_markup = ReplyKeyboardMarkup(keyboard, resize_keyboard=True)
-        update.message.reply_text(
+        await self.reply_text(
+            update,
             "🔄 Выберите следующее действие:",
             reply_markup=reply_markup,
         )
 
-    # --- Метод для отображения истории поиска ---
-    def history(self, update: Update, context: CallbackContext):
+    # --- Методы для отображения истории поиска ---
+    async def history(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """
-        Отправляет пользователю историю поиска с возможностью очистки.
+        Отправляет пользователю первую страницу истории поиска с кнопками
+        навигации и очистки.
         """
         user_id = update.effective_user.id
-        history = get_search_history(user_id)
+        # Недописанные записи сохраняются, чтобы история была актуальной
+        await asyncio.to_thread(self.history_writer.flush)
+        page = await asyncio.to_thread(
+            get_search_history_page, user_id, limit=HISTORY_PAGE_SIZE
+        )
 
-        if not history:
-            update.message.reply_text("📭 Ваша история поиска пуста.")
+        if not page["entries"]:
+            await self.reply_text(update, "📭 Ваша история поиска пуста.")
             return
 
-        message_lines = ["📚 Ваша история поиска:"]
-        for entry in history:
-            search_type = entry["search_type"]
-            params = entry["search_params"]
-            timestamp_iso = entry["timestamp"]
+        text, reply_markup = self.render_history_page(page)
+        await self.reply_text(update, text, reply_markup=reply_markup)
 
-            # Форматирование времени
-            try:
-                timestamp = datetime.fromisoformat(timestamp_iso).strftime(
-                    "%d.%m.%Y %H:%M"
-                )
-            except ValueError:
-                timestamp = escape(
-                    timestamp_iso
-                )  # Экранирование, если формат некорректен
-
-            # Форматирование строки поиска
-            if search_type == "name":
-                name = escape(params.get("name", "N/A"))
-                count = escape(str(params.get("count", "N/A")))
-                message_lines.append(
-                    f"📖 Поиск по названию:\n"
-                    f"• Название: {name}\n"
-                    f"• Количество: {count}\n"
-                    f"• Время: {timestamp}\n"
+    async def handle_history_page(
+        self, update: Update, context: ContextTypes.DEFAULT_TYPE
+    ):
+        """
+        Переключает страницу истории кнопками «Новее»/«Старше», редактируя
+        то же сообщение.
+        """
+        query = update.callback_query
+        await query.answer()
+
+        _, direction, entry_id = query.data.split(":")
+        user_id = query.from_user.id
+        if direction == "older":
+            page_filter = {"before_id": int(entry_id)}
+        else:
+            page_filter = {"after_id": int(entry_id)}
+        page = await asyncio.to_thread(
+            get_search_history_page, user_id, limit=HISTORY_PAGE_SIZE, **page_filter
+        )
+        if not page["entries"]:
+            # История изменилась (например, была очищена) — показываем начало
+            page = await asyncio.to_thread(
+                get_search_history_page, user_id, limit=HISTORY_PAGE_SIZE
+            )
+        if not page["entries"]:
+            await self.edit_message_text(query, "📭 Ваша история поиска пуста.")
+            return
+
+        text, reply_markup = self.render_history_page(page)
+        await self.edit_message_text(query, text, reply_markup=reply_markup)
+
+    def render_history_page(self, page):
+        """
+        Формирует текст и клавиатуру страницы истории.
+
+        :param page: Результат get_search_history_page.
+        :return: Кортеж (текст, InlineKeyboardMarkup).
+        """
+        entries = page["entries"]
+        message_lines = ["📚 Ваша история поиска:"]
+        message_lines.extend(self.format_history_entry(entry) for entry in entries)
+        text = "\n".join(message_lines)
+        # Ограничение длины сообщения Telegram (4096 символов)
+        if len(text) > 4096:
+            text = text[:4093].rstrip() + "..."
+
+        keyboard = []
+        navigation = []
+        if page["has_newer"]:
+            navigation.append(
+                InlineKeyboardButton(
+                    "⬅️ Новее", callback_data=f"history:newer:{entries[0]['id']}"
                 )
-            elif search_type == "rating":
-                min_rating = escape(str(params.get("min_rating", "N/A")))
-                max_rating = escape(str(params.get("max_rating", "N/A")))
-                genre_value = params.get("genre")
-                genre = escape(genre_value) if genre_value else "любой"
-                count = escape(str(params.get("count", "N/A")))
-                message_lines.append(
-                    f"⭐ Поиск по рейтингу:\n"
-                    f"• Рейтинг: {min_rating}-{max_rating}\n"
-                    f"• Жанр: {genre}\n"
-                    f"• Количество: {count}\n"
-                    f"• Время: {timestamp}\n"
+            )
+        if page["has_older"]:
+            navigation.append(
+                InlineKeyboardButton(
+                    "Старше ➡️", callback_data=f"history:older:{entries[-1]['id']}"
                 )
-            elif search_type == "budget":
-                budget_range = escape(params.get("budget_range", "N/A"))
-                genre_value = params.get("genre")
-                genre = escape(genre_value) if genre_value else "любой"
-                count = escape(str(params.get("count", "N/A")))
-                message_lines.append(
-                    f"💰 Поиск по бюджету:\n"
-                    f"• Бюджет: {budget_range}\n"
-                    f"• Жанр: {genre}\n"
-                    f"• Количество: {count}\n"
-                    f"• Время: {timestamp}\n"
+            )
+        if navigation:
+            keyboard.append(navigation)
+        keyboard.append(
+            [
+                InlineKeyboardButton(
+                    "🗑️ Очистить историю поиска", callback_data="clear_history"
                 )
-
-        # Ограничение длины сообщения Telegram (4096 символов)
-        full_message = "\n".join(message_lines)
-        if len(full_message) > 4096:
-            for i in range(0, len(full_message), 4096):
-                update.message.reply_text(full_message[i : i + 4096])
-        else:
-            # Добавление кнопки "Очистить историю поиска"
-            keyboard = [
-                [
-                    InlineKeyboardButton(
-                        "🗑️ Очистить историю поиска", callback_data="clear_history"
-                    )
-                ]
             ]
-            reply_markup = InlineKeyboardMarkup(keyboard)
-            update.message.reply_text(full_message, reply_markup=reply_markup)
+        )
+        return text, InlineKeyboardMarkup(keyboard)
+
+    def format_history_entry(self, entry):
+        """
+        Форматирует одну запись истории поиска.
+        """
+        search_type = entry["search_type"]
+        params = entry["search_params"]
+        timestamp_iso = entry["timestamp"]
+
+        # Форматирование времени
+        try:
+            timestamp = datetime.fromisoformat(timestamp_iso).strftime("%d.%m.%Y %H:%M")
+        except ValueError:
+            timestamp = escape(timestamp_iso)  # Экранирование, если формат некорректен
+
+        # Форматирование строки поиска
+        if search_type == "name":
+            name = params.get("name") or "N/A"
+            if len(name) > HISTORY_NAME_LIMIT:
+                name = name[:HISTORY_NAME_LIMIT].rstrip() + "..."
+            name = escape(name)
+            count = escape(str(params.get("count", "N/A")))
+            return (
+                f"📖 Поиск по названию:\n"
+                f"• Название: {name}\n"
+                f"• Количество: {count}\n"
+                f"• Время: {timestamp}\n"
+            )
+        elif search_type == "rating":
+            min_rating = escape(str(params.get("min_rating", "N/A")))
+            max_rating = escape(str(params.get("max_rating", "N/A")))
+            genre_value = params.get("genre")
+            genre = escape(genre_value) if genre_value else "любой"
+            count = escape(str(params.get("count", "N/A")))
+            return (
+                f"⭐ Поиск по рейтингу:\n"
+                f"• Рейтинг: {min_rating}-{max_rating}\n"
+                f"• Жанр: {genre}\n"
+                f"• Количество: {count}\n"
+                f"• Время: {timestamp}\n"
+            )
+        elif search_type == "budget":
+            budget_range = escape(params.get("budget_range", "N/A"))
+            genre_value = params.get("genre")
+            genre = escape(genre_value) if genre_value else "любой"
+            count = escape(str(params.get("count", "N/A")))
+            return (
+                f"💰 Поиск по бюджету:\n"
+                f"• Бюджет: {budget_range}\n"
+                f"• Жанр: {genre}\n"
+                f"• Количество: {count}\n"
+                f"• Время: {timestamp}\n"
+            )
+        return ""
 
     # --- Метод для обработки очистки истории и подтверждения ---
-    def handle_clear_history(self, update: Update, context: CallbackContext):
+    async def handle_clear_history(
+        self, update: Update, context: ContextTypes.DEFAULT_TYPE
+    ):
         """
         Обрабатывает подтверждение очистки истории поиска.
         """
         query = update.callback_query
-        query.answer()
+        await query.answer()
 
         data = query.data
 
@@ -773,13 +1129,17 @@ class CommandHandlers:
                 ]
             ]
             reply_markup = InlineKeyboardMarkup(keyboard)
-            query.edit_message_text(
+            await self.edit_message_text(
+                query,
                 "❓ Вы уверены, что хотите очистить историю поиска?",
                 reply_markup=reply_markup,
             )
         elif data == "confirm_clear_history":
             user_id = query.from_user.id
-            clear_search_history(user_id)
-            query.edit_message_text("🗑️ Ваша история поиска успешно очищена.")
+            await asyncio.to_thread(self.history_writer.flush)
+            await asyncio.to_thread(clear_search_history, user_id)
+            await self.edit_message_text(
+                query, "🗑️ Ваша история поиска успешно очищена."
+            )
         elif data == "cancel_clear_history":
-            query.edit_message_text("ℹ️ Очистка истории поиска отменена.")
+            await self.edit_message_text(query, "ℹ️ Очистка истории поиска отменена.")
@@ -0,0 +1,100 @@
+# prefetch.py
+
+import asyncio
+from collections import OrderedDict
+
+
+class Prefetcher:
+    """
+    Фоновая загрузка следующих страниц результатов, пока пользователь
+    смотрит текущую.
+
+    У каждого пользователя не больше max_per_user загрузок одновременно:
+    при превышении отменяется самая старая. Загрузки пользователя
+    отменяются, когда его поиск заканчивается.
+    """
+
+    def __init__(self, max_per_user=2):
+        """
+        :param max_per_user: Сколько страниц загружать заранее для одного
+            пользователя
+        """
+        self.max_per_user = max_per_user
+        # user_id -> OrderedDict(ключ -> задача)
+        self._tasks = {}
+        self.hits = 0
+        self.misses = 0
+        self.cancelled = 0
+
+    def __len__(self):
+        return sum(len(tasks) for tasks in self._tasks.values())
+
+    def schedule(self, user_id, key, factory):
+        """
+        Запускает загрузку в фоне, если она ещё не запущена.
+
+        :param user_id: ID пользователя Telegram
+        :param key: Ключ загрузки, например (id сессии, номер страницы)
+        :param factory: Функция без аргументов, возвращающая корутину загрузки
+        """
+        if self.max_per_user <= 0:
+            return
+        tasks = self._tasks.setdefault(user_id, OrderedDict())
+        if key in tasks:
+            return
+        tasks[key] = asyncio.create_task(factory())
+        while len(tasks) > self.max_per_user:
+            _, task = tasks.popitem(last=False)
+            self._cancel(task)
+
+    def scheduled(self, user_id, key):
+        return key in self._tasks.get(user_id, ())
+
+    async def take(self, user_id, key, factory):
+        """
+        Возвращает результат заранее запущенной загрузки или, если её нет
+        или она завершилась ошибкой, выполняет загрузку сейчас.
+        """
+        tasks = self._tasks.get(user_id)
+        task = tasks.pop(key, None) if tasks else None
+        if tasks is not None and not tasks:
+            del self._tasks[user_id]
+        if task is not None:
+            try:
+                result = await task
+                self.hits += 1
+                return result
+            except asyncio.CancelledError:
+                if not task.cancelled():
+                    raise  # Отменили самого вызывающего
+            except Exception as e:
+                print(f"Ошибка при фоновой загрузке результатов: {e}")
+        self.misses += 1
+        return await factory()
+
+    def cancel(self, user_id, match=None):
+        """
+        Отменяет загрузки пользователя.
+
+        :param match: Функция ключ -> bool, чтобы отменить только часть
+            загрузок; по умолчанию отменяются все.
+        """
+        tasks = self._tasks.get(user_id)
+        if not tasks:
+            return
+        for key in [key for key in tasks if match is None or match(key)]:
+            self._cancel(tasks.pop(key))
+        if not tasks:
+            del self._tasks[user_id]
+
+    def _cancel(self, task):
+        if not task.done():
+            task.cancel()
+            self.cancelled += 1
+        elif not task.cancelled():
+            # Помечаем исключение полученным, результат уже не нужен
+            task.exception()
+
+    def cancel_all(self):
+        for user_id in list(self._tasks):
+            self.cancel(user_id)
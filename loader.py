@@ -1,28 +1,320 @@
 # loader.py
 
-from telegram.ext import Updater
+import asyncio
+import itertools
+import secrets
+import signal
+from collections.abc import MutableMapping
+from contextlib import asynccontextmanager
+
+import telegram
+from telegram import Update
+from telegram.ext import Application, ConversationHandler
 from handlers.handlers import CommandHandlers
-from api.kinopoisk_api import KinopoiskAPI
-from database.database import initialize_database  # Обновлённый путь импорта
+from handlers.carousel import Carousel, CarouselSessions
+from handlers.prefetch import Prefetcher
+from api.async_kinopoisk_api import AsyncKinopoiskAPI
+from api.cache import ResponseCache
+from api.disk_cache import PersistentResponseCache
+from api.catalog_sync import CatalogSync
+from database.database import (  # Обновлённый путь импорта
+    initialize_database,
+    close_database,
+)
+from database.catalog import MovieCatalog
+from database.persistence import SQLitePersistence
+from database.poster_cache import PosterFileIdCache
+from database.history_writer import HistoryWriter
+from config import Settings
+from utils.metrics import MetricsServer, queue_depth, register_cache, timed_handler
+from utils.rate_limiter import OutboundScheduler
+from utils.rendering import CaptionRenderer
+from utils.update_queues import UserUpdateQueues
+from utils.webhook_server import WebhookServer
+
+# Сколько обновлений на один слот concurrent_updates может ждать в очередях
+# пользователей, прежде чем приём обновлений замедлится
+PENDING_PER_SLOT = 4
+
+# Версии PTB, в которых проверено устройство ConversationHandler._conversations
+# (см. end_conversation)
+CONVERSATIONS_PTB_MAJOR = 20
+
+
+def stop_on_signals():
+    """
+    Событие, которое устанавливается по SIGINT/SIGTERM.
+    """
+    stop_event = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop_event.set)
+    return stop_event
+
+
+async def start_webhook_server(bot, handler, settings):
+    """
+    Запускает сервер webhook и регистрирует адрес webhook в Telegram.
+
+    :param bot: Бот, через которого вызывается setWebhook.
+    :param handler: Корутинная функция, принимающая обновление (dict).
+    :param settings: Настройки бота (Settings).
+    """
+    secret_token = settings.webhook_secret or secrets.token_urlsafe(32)
+    server = WebhookServer(
+        handler,
+        secret_token,
+        listen=settings.webhook_listen,
+        port=settings.webhook_port,
+        url_path=settings.webhook_path,
+        workers=settings.webhook_workers,
+        queue_size=settings.webhook_queue_size,
+    )
+    await server.start()
+    queue_depth.labels("webhook").set_function(server.queue_depth)
+    if settings.webhook_url:
+        await bot.set_webhook(
+            settings.webhook_url,
+            secret_token=secret_token,
+            allowed_updates=Update.ALL_TYPES,
+        )
+    elif not settings.webhook_secret:
+        print(
+            "Внимание: WEBHOOK_URL и WEBHOOK_SECRET не заданы, "
+            "Telegram не сможет доставлять обновления"
+        )
+    return server
+
+
+def instrument_handler(handler):
+    """
+    Оборачивает колбэк обработчика (у разговора — колбэки всех его шагов)
+    замером времени для метрик.
+    """
+    if isinstance(handler, ConversationHandler):
+        for step in itertools.chain(
+            handler.entry_points, *handler.states.values(), handler.fallbacks
+        ):
+            instrument_handler(step)
+    elif not hasattr(handler.callback, "__wrapped__"):
+        handler.callback = timed_handler(handler.callback)
+
+
+def end_conversation(handler, key):
+    """
+    Завершает разговор key обработчика handler.
+
+    Публичного способа завершить разговор извне у ConversationHandler нет,
+    а conversation_timeout требует JobQueue. Поэтому ключ удаляется из
+    внутреннего словаря _conversations: в PTB 20 это TrackingDict, и при
+    следующем обновлении persistence PTB сам запишет в неё None для этого
+    ключа. На другой мажорной версии PTB устройство словаря не проверено:
+    разговор не трогается, а в лог пишется предупреждение, чтобы поломка
+    после обновления не прошла незамеченной.
+
+    :param handler: ConversationHandler
+    :param key: Ключ разговора (chat_id, user_id)
+    :return: True, если разговор завершён
+    """
+    conversations = getattr(handler, "_conversations", None)
+    supported = telegram.__version_info__.major == CONVERSATIONS_PTB_MAJOR
+    if not supported or not isinstance(conversations, MutableMapping):
+        print(
+            f"Не удалось завершить разговор {handler.name}: "
+            f"ConversationHandler PTB {telegram.__version__} не поддерживается"
+        )
+        return False
+    conversations.pop(key, None)
+    return True
+
+
+class MovieApplication(Application):
+    """
+    Application, которое обрабатывает обновления одного пользователя по
+    очереди, а разных пользователей — параллельно (concurrent_updates).
+
+    ConversationHandler рассчитан на последовательную обработку: пока идут
+    поиск и отправка фильмов, разговор остаётся в состоянии *_COUNT, и второе
+    сообщение того же пользователя запустило бы поиск ещё раз одновременно
+    с первым.
+
+    process_update только ставит обновление в очередь его пользователя
+    (UserUpdateQueues), поэтому обновления, ждущие своей очереди, не
+    занимают слоты concurrent_updates и workers webhook.
+    """
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        concurrency = max(1, self.concurrent_updates)
+        self.user_updates = UserUpdateQueues(
+            super().process_update,
+            concurrency=concurrency,
+            max_pending=PENDING_PER_SLOT * concurrency,
+        )
+
+    async def process_update(self, update):
+        user = update.effective_user if isinstance(update, Update) else None
+        if user is None:
+            await super().process_update(update)
+            return
+        await self.user_updates.put(user.id, update)
+
+    async def wait_idle(self):
+        """
+        Ждёт, пока будут обработаны все обновления из очередей пользователей.
+        """
+        await self.user_updates.join()
+
+    async def stop(self):
+        await super().stop()
+        # Application.stop ждёт только свои задачи: дообрабатываем очереди
+        # пользователей и сохраняем изменения, сделанные при этом
+        await self.wait_idle()
+        if self.persistence:
+            await self.update_persistence()
 
 
 class MovieBot:
-    def __init__(self, telegram_token, kinopoisk_api_key):
-        self.updater = Updater(telegram_token, use_context=True)
-        self.dispatcher = self.updater.dispatcher
+    def __init__(self, telegram_token, kinopoisk_api_key, settings=None):
+        self.settings = settings or Settings()
+        # Состояние разговоров и user_data сохраняется пачками в SQLite
+        self.persistence = SQLitePersistence(
+            update_interval=self.settings.state_flush_interval,
+            ttl=self.settings.state_ttl,
+        )
+        # concurrent_updates позволяет обрабатывать разговоры разных
+        # пользователей параллельно, пока они ожидают ответа API; обновления
+        # одного пользователя MovieApplication обрабатывает по очереди
+        self.application = (
+            Application.builder()
+            .application_class(MovieApplication)
+            .token(telegram_token)
+            .concurrent_updates(self.settings.concurrent_updates)
+            .persistence(self.persistence)
+            .post_init(self._post_init)
+            .post_shutdown(self._post_shutdown)
+            .build()
+        )
+        self.persistence.on_evict_user = self.application.drop_user_data
+        self.persistence.on_evict_conversation = self._end_conversation
 
         # Инициализация базы данных
         initialize_database()
 
+        # Кэш ответов API, общий для всех пользователей
+        cache_ttls = {
+            "/v1.4/movie/search": self.settings.cache_ttl_search,
+            "/v1.4/movie": self.settings.cache_ttl_filter,
+        }
+        self.response_cache = ResponseCache(
+            max_entries=self.settings.cache_max_entries,
+            max_bytes=self.settings.cache_max_bytes,
+            ttls=cache_ttls,
+        )
+        # Дисковый кэш, чтобы после перезапуска не начинать с пустого кэша
+        self.persistent_cache = None
+        if self.settings.api_cache_db:
+            self.persistent_cache = PersistentResponseCache(
+                self.settings.api_cache_db,
+                max_bytes=self.settings.api_cache_max_bytes,
+                ttls=cache_ttls,
+            )
+
         # Инициализация API клиента
-        self.api_client = KinopoiskAPI(kinopoisk_api_key)
+        self.api_client = AsyncKinopoiskAPI(
+            kinopoisk_api_key,
+            pool_size=self.settings.api_pool_size,
+            connect_timeout=self.settings.api_connect_timeout,
+            read_timeout=self.settings.api_read_timeout,
+            page_size=self.settings.api_page_size,
+            max_concurrency=self.settings.api_max_concurrency,
+            cache=self.response_cache,
+            persistent_cache=self.persistent_cache,
+        )
+
+        # Локальный каталог фильмов для поиска по рейтингу и бюджету
+        self.catalog = None
+        self.catalog_sync = None
+        if self.settings.catalog_db:
+            self.catalog = MovieCatalog(
+                self.settings.catalog_db, max_age=self.settings.catalog_max_age
+            )
+            self.catalog.initialize()
+            self.catalog_sync = CatalogSync(
+                self.api_client,
+                self.catalog,
+                pages=self.settings.catalog_sync_pages,
+                interval=self.settings.catalog_sync_interval,
+            )
+
+        # Очередь исходящих сообщений с учётом лимитов Telegram
+        self.sender = OutboundScheduler(
+            global_rate=self.settings.send_global_rate,
+            per_chat_rate=self.settings.send_per_chat_rate,
+            per_chat_burst=self.settings.send_per_chat_burst,
+        )
+
+        # file_id уже отправленных постеров
+        self.poster_cache = PosterFileIdCache(
+            max_entries=self.settings.poster_cache_size
+        )
+        self.poster_cache.load()
+
+        # История поиска записывается пачками в фоновом потоке
+        self.history_writer = HistoryWriter(
+            batch_size=self.settings.history_batch_size,
+            flush_interval=self.settings.history_flush_interval,
+        )
+
+        # Подписи к фильмам формируются один раз и переиспользуются
+        renderer = CaptionRenderer(max_entries=self.settings.caption_cache_size)
+        prefetcher = Prefetcher(max_per_user=self.settings.prefetch_pages_per_user)
 
         # Инициализация обработчиков
-        self.handlers = CommandHandlers(self.api_client, self.dispatcher)
+        self.handlers = CommandHandlers(
+            self.api_client,
+            self.application,
+            self.sender,
+            self.poster_cache,
+            self.history_writer,
+            delivery_mode=self.settings.delivery_mode,
+            catalog=self.catalog,
+            renderer=renderer,
+            carousel=Carousel(
+                self.sender,
+                self.poster_cache,
+                renderer,
+                CarouselSessions(
+                    ttl=self.settings.carousel_ttl,
+                    max_sessions=self.settings.carousel_max_sessions,
+                ),
+                prefetcher,
+            ),
+        )
         self.register_handlers()
 
+        # Метрики, значения которых считываются при каждом запросе /metrics
+        queue_depth.labels("users").set_function(
+            self.application.user_updates.queue_depth
+        )
+        queue_depth.labels("outbound").set_function(self.sender.queue_depth)
+        queue_depth.labels("history").set_function(self.history_writer.queue_depth)
+        register_cache("api_memory", self.response_cache)
+        if self.persistent_cache is not None:
+            register_cache("api_disk", self.persistent_cache)
+        register_cache("captions", renderer)
+        register_cache("prefetch", prefetcher)
+        self.metrics_server = None
+        if self.settings.metrics_port:
+            self.metrics_server = MetricsServer(
+                listen=self.settings.metrics_listen, port=self.settings.metrics_port
+            )
+
+        # Сервер webhook создаётся при запуске в режиме webhook
+        self.webhook_server = None
+
     def register_handlers(self):
-        dp = self.dispatcher
+        dp = self.application
 
         dp.add_handler(self.handlers.start_handler)
         dp.add_handler(self.handlers.help_handler)
@@ -42,8 +334,94 @@ class MovieBot:
             self.handlers.history_button_handler
         )  # Добавлен новый обработчик
 
+        dp.add_handler(self.handlers.history_page_handler)
+        dp.add_handler(self.handlers.carousel_handler)
         dp.add_handler(self.handlers.clear_history_handler)
 
+        # Время работы каждого обработчика попадает в метрики
+        for handlers in dp.handlers.values():
+            for handler in handlers:
+                instrument_handler(handler)
+
+    def _end_conversation(self, name, key):
+        """
+        Завершает разговор, брошенный пользователем на середине.
+        """
+        for handler in (
+            self.handlers.movie_search_handler,
+            self.handlers.movie_by_rating_handler,
+            self.handlers.movie_by_budget_handler,
+        ):
+            if handler.name == name:
+                end_conversation(handler, key)
+
     def start(self):
-        self.updater.start_polling()
-        self.updater.idle()
+        if self.settings.bot_mode == "webhook":
+            asyncio.run(self.run_webhook())
+        else:
+            self.application.run_polling()
+
+    @asynccontextmanager
+    async def running(self):
+        """
+        Запускает приложение и фоновые задачи бота, не получая обновления:
+        их передаёт вызывающий код (webhook или процесс-приёмник).
+        """
+        app = self.application
+        await app.initialize()
+        await self._post_init(app)
+        await app.start()
+        try:
+            yield app
+        finally:
+            await app.stop()
+            await app.shutdown()
+            await self._post_shutdown(app)
+
+    async def run_webhook(self, stop_event=None):
+        """
+        Принимает обновления через webhook вместо long polling.
+
+        webhook_workers задач передают принятые обновления в очереди
+        пользователей MovieApplication и не ждут их обработки, поэтому
+        пользователь с долгой выдачей не занимает workers. Работает, пока не
+        придёт SIGINT/SIGTERM или не будет установлен stop_event.
+        """
+        if stop_event is None:
+            stop_event = stop_on_signals()
+        async with self.running() as app:
+            self.webhook_server = await start_webhook_server(
+                app.bot, self._process_webhook_update, self.settings
+            )
+            try:
+                await stop_event.wait()
+            finally:
+                await self.webhook_server.stop()
+
+    async def _process_webhook_update(self, data):
+        update = Update.de_json(data, self.application.bot)
+        await self.application.process_update(update)
+
+    async def _post_init(self, application):
+        if self.metrics_server is not None:
+            self.metrics_server.start()
+        self.history_writer.start()
+        await self.sender.start()
+        if self.catalog_sync is not None:
+            await self.catalog_sync.start()
+
+    async def _post_shutdown(self, application):
+        if self.catalog_sync is not None:
+            await self.catalog_sync.stop()
+        if self.catalog is not None:
+            self.catalog.close()
+        # Фоновые загрузки страниц больше не нужны
+        self.handlers.carousel.prefetcher.cancel_all()
+        await self.sender.stop()
+        # Закрытие пула соединений к API Кинопоиска
+        await self.api_client.aclose()
+        # Дописываем историю до закрытия соединений с базой
+        await asyncio.to_thread(self.history_writer.stop)
+        close_database()
+        if self.metrics_server is not None:
+            self.metrics_server.stop()
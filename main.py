@@ -3,6 +3,8 @@ import os
 from dotenv import load_dotenv
 import logging
 from loader import MovieBot
+from sharding import ShardedBot
+from config import Settings
 
 # Загрузка переменных окружения из файла .env
 load_dotenv(".env")
@@ -23,5 +25,9 @@ if __name__ == "__main__":
         print("Ошибка: Отсутствует API ключ Кинопоиска в файле .env")
         exit(1)
 
-    movie_bot = MovieBot(TELEGRAM_TOKEN, KINOPOISK_API_KEY)
+    settings = Settings.from_env()
+    if settings.shard_workers > 1:
+        movie_bot = ShardedBot(TELEGRAM_TOKEN, KINOPOISK_API_KEY, settings)
+    else:
+        movie_bot = MovieBot(TELEGRAM_TOKEN, KINOPOISK_API_KEY, settings)
     movie_bot.start()
@@ -0,0 +1,388 @@
+# sharding.py
+
+import asyncio
+import multiprocessing
+import os
+import queue
+import signal
+import time
+from dataclasses import replace
+
+from telegram import Bot, Update
+from telegram.error import NetworkError, RetryAfter, TelegramError
+
+from config import Settings
+from database.database import initialize_database
+from loader import MovieBot, start_webhook_server, stop_on_signals
+from utils.metrics import REGISTRY, MetricsServer, queue_depth
+
+# Как часто проверять, что процессы-обработчики живы
+SUPERVISE_INTERVAL = 1.0
+# Упавший обработчик перезапускается не чаще, чем раз в столько секунд
+MIN_RESTART_INTERVAL = 5.0
+# Сколько ждать завершения обработчика, прежде чем остановить его принудительно
+STOP_TIMEOUT = 30.0
+# Таймаут long polling у процесса-приёмника
+POLL_TIMEOUT = 10
+# Как часто обработчик проверяет, что процесс-приёмник ещё работает
+QUEUE_POLL_INTERVAL = 1.0
+# Сколько ждать блокировку чтения очереди упавшего обработчика
+QUEUE_DRAIN_TIMEOUT = 0.1
+
+
+def update_chat_id(update):
+    """
+    chat_id обновления Telegram; для обновлений без чата (inline-запросы
+    и т.п.) — id пользователя, для остальных — 0.
+
+    :param update: Обновление в виде словаря из Bot API.
+    """
+    for value in update.values():
+        if not isinstance(value, dict):
+            continue
+        chat = value.get("chat") or (value.get("message") or {}).get("chat")
+        if chat:
+            return chat["id"]
+        user = value.get("from") or value.get("user")
+        if user:
+            return user["id"]
+    return 0
+
+
+def _run_worker(index, telegram_token, kinopoisk_api_key, settings, updates):
+    """
+    Точка входа процесса-обработчика.
+    """
+    # Ctrl+C получает вся группа процессов, а обработчик завершается по
+    # команде процесса-приёмника, дообработав свою очередь
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    bot = MovieBot(telegram_token, kinopoisk_api_key, settings)
+    if index > 0:
+        # Каталог общий, синхронизирует его только первый обработчик
+        bot.catalog_sync = None
+    asyncio.run(_serve_updates(bot, updates))
+
+
+async def _serve_updates(bot, updates):
+    """
+    Передаёт обновления из очереди процесса в приложение, пока не придёт
+    None или не завершится процесс-приёмник.
+    """
+    ingress_pid = os.getppid()
+    async with bot.running() as app:
+        while True:
+            try:
+                data = await asyncio.to_thread(updates.get, True, QUEUE_POLL_INTERVAL)
+            except queue.Empty:
+                if os.getppid() != ingress_pid:
+                    print("Процесс-приёмник завершился, обработчик останавливается")
+                    break
+                continue
+            if data is None:
+                break
+            # Очередь приложения обрабатывает обновления с учётом
+            # concurrent_updates так же, как при long polling
+            await app.update_queue.put(Update.de_json(data, app.bot))
+
+
+class ShardedBot:
+    """
+    Бот из нескольких процессов: один принимает обновления, остальные
+    их обрабатывают.
+
+    Процесс-приёмник получает обновления (long polling или webhook) и
+    отправляет каждое в очередь одного из shard_workers процессов-обработчиков
+    по chat_id. Чат всегда попадает в один и тот же процесс, поэтому
+    состояние разговоров (ConversationHandler) и лимиты отправки в чат
+    остаются согласованными.
+    """
+
+    def __init__(self, telegram_token, kinopoisk_api_key, settings=None):
+        self.settings = settings or Settings()
+        self.telegram_token = telegram_token
+        self.kinopoisk_api_key = kinopoisk_api_key
+        self.workers = max(1, self.settings.shard_workers)
+        # Общий лимит отправки в Telegram делится между процессами
+        self.worker_settings = replace(
+            self.settings,
+            send_global_rate=self.settings.send_global_rate / self.workers,
+        )
+
+        # spawn: процессы не наследуют потоки и соединения приёмника
+        self._context = multiprocessing.get_context("spawn")
+        # Очереди живут в приёмнике и переживают плановый перезапуск
+        # обработчика, поэтому обновления в них не теряются
+        self.queues = [
+            self._context.Queue(self.settings.shard_queue_size)
+            for _ in range(self.workers)
+        ]
+        self.processes = [None] * self.workers
+        self._started_at = [0.0] * self.workers
+        # Обработчики, которые сейчас перезапускаются намеренно
+        self._restarting = set()
+        self._rolling_restart = None
+
+        self.routed = 0
+        self.restarts = 0
+        self.lost = 0
+
+        for index in range(self.workers):
+            queue_depth.labels(f"shard_{index}").set_function(
+                lambda index=index: self.queue_depths()[index]
+            )
+        REGISTRY.counter(
+            "bot_shard_updates_routed_total", "Обновления, отправленные обработчикам"
+        ).set_function(lambda: self.routed)
+        REGISTRY.counter(
+            "bot_shard_worker_restarts_total", "Аварийные перезапуски обработчиков"
+        ).set_function(lambda: self.restarts)
+        REGISTRY.counter(
+            "bot_shard_updates_lost_total",
+            "Обновления, потерянные при аварийном завершении обработчика",
+        ).set_function(lambda: self.lost)
+        self.metrics_server = None
+        if self.settings.metrics_port:
+            self.metrics_server = MetricsServer(
+                listen=self.settings.metrics_listen, port=self.settings.metrics_port
+            )
+
+    def start(self):
+        # Миграции применяются один раз, до запуска обработчиков
+        initialize_database()
+        asyncio.run(self.run())
+
+    async def run(self, stop_event=None):
+        """
+        Запускает обработчики и принимает обновления, пока не придёт
+        SIGINT/SIGTERM или не будет установлен stop_event. SIGHUP
+        перезапускает обработчики по одному.
+        """
+        if stop_event is None:
+            stop_event = stop_on_signals()
+            asyncio.get_running_loop().add_signal_handler(
+                signal.SIGHUP, self.restart_workers
+            )
+        if self.metrics_server is not None:
+            self.metrics_server.start()
+        for index in range(self.workers):
+            self.start_worker(index)
+        supervisor = asyncio.create_task(self._supervise())
+
+        bot = Bot(self.telegram_token)
+        try:
+            async with bot:
+                if self.settings.bot_mode == "webhook":
+                    server = await start_webhook_server(bot, self.route, self.settings)
+                    try:
+                        await stop_event.wait()
+                    finally:
+                        await server.stop()
+                else:
+                    polling = asyncio.create_task(self._poll(bot))
+                    try:
+                        await stop_event.wait()
+                    finally:
+                        polling.cancel()
+                        await asyncio.gather(polling, return_exceptions=True)
+        finally:
+            tasks = [supervisor]
+            if self._rolling_restart is not None:
+                tasks.append(self._rolling_restart)
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            await asyncio.gather(
+                *(self.stop_worker(index) for index in range(self.workers))
+            )
+            if self.metrics_server is not None:
+                self.metrics_server.stop()
+
+    async def _poll(self, bot):
+        """
+        Получает обновления через long polling и распределяет их.
+        """
+        await bot.delete_webhook()
+        offset = 0
+        try:
+            while True:
+                try:
+                    updates = await bot.get_updates(
+                        offset=offset,
+                        timeout=POLL_TIMEOUT,
+                        allowed_updates=Update.ALL_TYPES,
+                    )
+                except RetryAfter as e:
+                    await asyncio.sleep(e.retry_after)
+                    continue
+                except NetworkError as e:
+                    print(f"Ошибка при получении обновлений: {e}")
+                    await asyncio.sleep(1)
+                    continue
+                for update in updates:
+                    await self.route(update.to_dict())
+                    offset = update.update_id + 1
+        finally:
+            if offset:
+                # Подтверждаем Telegram уже распределённые обновления, иначе
+                # после перезапуска они придут ещё раз (так же делает Updater)
+                try:
+                    await bot.get_updates(offset=offset, timeout=0, limit=1)
+                except TelegramError as e:
+                    print(f"Не удалось подтвердить полученные обновления: {e}")
+
+    def shard_for(self, update):
+        return update_chat_id(update) % self.workers
+
+    async def route(self, update):
+        """
+        Отправляет обновление в очередь обработчика его чата.
+
+        :param update: Обновление в виде словаря из Bot API.
+        """
+        updates = self.queues[self.shard_for(update)]
+        try:
+            updates.put_nowait(update)
+        except queue.Full:
+            # Обработчик не успевает: ждём места, замедляя приём обновлений
+            await asyncio.to_thread(updates.put, update)
+        self.routed += 1
+
+    def start_worker(self, index):
+        settings = self.worker_settings
+        if settings.metrics_port:
+            # Приёмник отдаёт метрики на metrics_port, обработчики — на
+            # следующих портах по порядку
+            settings = replace(settings, metrics_port=settings.metrics_port + 1 + index)
+        process = self._context.Process(
+            target=_run_worker,
+            args=(
+                index,
+                self.telegram_token,
+                self.kinopoisk_api_key,
+                settings,
+                self.queues[index],
+            ),
+            name=f"movie-bot-worker-{index}",
+            daemon=True,
+        )
+        process.start()
+        self.processes[index] = process
+        self._started_at[index] = time.monotonic()
+
+    async def stop_worker(self, index, timeout=STOP_TIMEOUT):
+        """
+        Останавливает обработчик после того, как он обработает обновления,
+        уже стоящие в его очереди.
+        """
+        process = self.processes[index]
+        if process is None:
+            return
+        self._restarting.add(index)
+        try:
+            if process.is_alive():
+                await asyncio.to_thread(self.queues[index].put, None)
+                await asyncio.to_thread(process.join, timeout)
+            if process.is_alive():
+                print(f"Обработчик {index} не завершился за {timeout} с, остановка")
+                process.terminate()
+                await asyncio.to_thread(process.join)
+            self.processes[index] = None
+        finally:
+            self._restarting.discard(index)
+
+    async def restart_worker(self, index):
+        """
+        Перезапускает обработчик без потери обновлений: новые обновления
+        ждут в очереди, пока стартует новый процесс.
+        """
+        self._restarting.add(index)
+        try:
+            await self.stop_worker(index)
+            self.start_worker(index)
+        finally:
+            self._restarting.discard(index)
+
+    def restart_workers(self):
+        """
+        Перезапускает обработчики по одному, чтобы остальные продолжали
+        отвечать.
+        """
+        if self._rolling_restart is not None and not self._rolling_restart.done():
+            return
+
+        async def rolling_restart():
+            for index in range(self.workers):
+                await self.restart_worker(index)
+            print("Обработчики перезапущены")
+
+        self._rolling_restart = asyncio.create_task(rolling_restart())
+
+    def _replace_queue(self, index):
+        """
+        Заменяет очередь аварийно завершившегося обработчика: он мог
+        умереть, удерживая блокировку чтения, и тогда из старой очереди
+        больше никто не прочитает.
+
+        Обновления, которые ещё удаётся прочитать, переносятся в новую
+        очередь; остальные (и те, что обработчик успел забрать, но не
+        обработал) теряются и учитываются в счётчике lost.
+        """
+        old = self.queues[index]
+        new = self._context.Queue(self.settings.shard_queue_size)
+        while True:
+            try:
+                # Если блокировку держит умерший обработчик, get не дождётся её
+                new.put_nowait(old.get(True, QUEUE_DRAIN_TIMEOUT))
+            except (queue.Empty, queue.Full):
+                break
+        try:
+            lost = old.qsize()
+        except NotImplementedError:
+            lost = 0
+        if lost:
+            self.lost += lost
+            print(f"Потеряно обновлений из очереди обработчика {index}: {lost}")
+        old.cancel_join_thread()
+        old.close()
+        self.queues[index] = new
+
+    def queue_depths(self):
+        """
+        Количество обновлений в очереди каждого обработчика (None, если
+        платформа не умеет считать размер очереди).
+        """
+        depths = []
+        for updates in self.queues:
+            try:
+                depths.append(updates.qsize())
+            except NotImplementedError:
+                depths.append(None)
+        return depths
+
+    async def _supervise(self):
+        """
+        Перезапускает упавшие обработчики и выводит размер очередей.
+        """
+        last_report = time.monotonic()
+        while True:
+            await asyncio.sleep(SUPERVISE_INTERVAL)
+            now = time.monotonic()
+            for index, process in enumerate(self.processes):
+                if index in self._restarting or process is None:
+                    continue
+                if process.is_alive():
+                    continue
+                if now - self._started_at[index] < MIN_RESTART_INTERVAL:
+                    continue  # Не перезапускаем в цикле процесс, падающий сразу
+                print(
+                    f"Обработчик {index} завершился с кодом {process.exitcode}, "
+                    f"перезапуск"
+                )
+                self.restarts += 1
+                self._replace_queue(index)
+                self.start_worker(index)
+
+            interval = self.settings.shard_report_interval
+            if interval and now - last_report >= interval:
+                last_report = now
+                print(f"Очереди обработчиков: {self.queue_depths()}")
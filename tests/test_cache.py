@@ -0,0 +1,93 @@
+# test_cache.py
+
+import unittest
+from unittest import mock
+
+from api.cache import ResponseCache, make_cache_key
+
+PATH = "/v1.4/movie"
+
+
+class MakeCacheKeyTest(unittest.TestCase):
+    def test_normalizes_strings_and_order(self):
+        a = make_cache_key(PATH, {"query": " Матрица ", "limit": 5})
+        b = make_cache_key(PATH, {"limit": 5, "query": "матрица"})
+        self.assertEqual(a, b)
+
+    def test_skips_none_params(self):
+        self.assertEqual(
+            make_cache_key(PATH, {"query": "x", "page": None}),
+            make_cache_key(PATH, {"query": "x"}),
+        )
+
+
+class ResponseCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.now = 1000.0
+        patcher = mock.patch("api.cache.time.monotonic", lambda: self.now)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_entry_expires_after_ttl(self):
+        cache = ResponseCache(ttls={PATH: 10})
+        cache.set("k", PATH, [1])
+        self.now += 9
+        self.assertEqual(cache.get("k"), [1])
+        self.now += 1
+        self.assertIsNone(cache.get("k"))
+        stats = cache.stats()
+        self.assertEqual(stats["expirations"], 1)
+        self.assertEqual(stats["entries"], 0)
+        self.assertEqual(stats["bytes"], 0)
+
+    def test_ttl_argument_only_shortens(self):
+        cache = ResponseCache(ttls={PATH: 10})
+        cache.set("short", PATH, 1, ttl=5)
+        cache.set("long", PATH, 1, ttl=50)
+        self.now += 6
+        self.assertIsNone(cache.get("short"))
+        self.now += 4
+        self.assertIsNone(cache.get("long"))
+
+    def test_non_positive_ttl_is_not_stored(self):
+        cache = ResponseCache(ttls={PATH: 0})
+        cache.set("k", PATH, 1)
+        self.assertEqual(cache.stats()["entries"], 0)
+
+    def test_evicts_least_recently_used_by_count(self):
+        cache = ResponseCache(max_entries=2)
+        cache.set("a", PATH, 1)
+        cache.set("b", PATH, 2)
+        cache.get("a")  # теперь самая старая запись — b
+        cache.set("c", PATH, 3)
+        self.assertEqual(cache.get("a"), 1)
+        self.assertIsNone(cache.get("b"))
+        self.assertEqual(cache.get("c"), 3)
+        self.assertEqual(cache.stats()["evictions"], 1)
+
+    def test_evicts_by_bytes(self):
+        value = "x" * 100  # 102 байта в JSON
+        cache = ResponseCache(max_bytes=250)
+        cache.set("a", PATH, value)
+        cache.set("b", PATH, value)
+        cache.set("c", PATH, value)
+        self.assertIsNone(cache.get("a"))
+        self.assertEqual(cache.stats()["entries"], 2)
+        self.assertLessEqual(cache.stats()["bytes"], 250)
+
+    def test_value_larger_than_limit_is_not_stored(self):
+        cache = ResponseCache(max_bytes=10)
+        cache.set("a", PATH, "x" * 100)
+        self.assertIsNone(cache.get("a"))
+        self.assertEqual(cache.stats()["evictions"], 0)
+
+    def test_overwrite_keeps_byte_count(self):
+        cache = ResponseCache()
+        cache.set("a", PATH, "x" * 10)
+        cache.set("a", PATH, "x" * 10)
+        self.assertEqual(cache.stats()["bytes"], 12)
+        self.assertEqual(cache.stats()["entries"], 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,64 @@
+# test_disk_cache.py
+
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+from api.disk_cache import PersistentResponseCache
+
+PATH = "/v1.4/movie"
+
+
+class PersistentResponseCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.now = 1000.0
+        patcher = mock.patch("api.disk_cache.time.time", lambda: self.now)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, "api_cache.db")
+
+    def open(self, **kwargs):
+        cache = PersistentResponseCache(self.path, ttls={PATH: 10}, **kwargs)
+        self.addCleanup(cache.close)
+        return cache
+
+    def test_survives_reopen(self):
+        cache = self.open()
+        cache.set("k", PATH, [{"name": "Матрица"}])
+        cache.close()
+        self.assertEqual(self.open().get("k"), [{"name": "Матрица"}])
+
+    def test_entry_returns_remaining_ttl(self):
+        cache = self.open()
+        cache.set("k", PATH, [1])
+        self.now += 4
+        docs, remaining = cache.get_entry("k")
+        self.assertEqual(docs, [1])
+        self.assertAlmostEqual(remaining, 6)
+
+    def test_expired_entry_is_a_miss_and_vacuumed(self):
+        cache = self.open()
+        cache.set("k", PATH, [1])
+        self.now += 10
+        self.assertIsNone(cache.get("k"))
+        self.assertEqual(cache.misses, 1)
+        cache.vacuum()
+        self.assertEqual(cache.stats()["entries"], 0)
+
+    def test_vacuum_trims_soonest_expiring_first(self):
+        cache = self.open(max_bytes=1)
+        cache.set("old", PATH, [1])
+        self.now += 1
+        cache.set("new", PATH, [1])
+        size = cache.stats()["bytes"] // 2
+        cache.max_bytes = size
+        cache.vacuum()
+        self.assertIsNone(cache.get("old"))
+        self.assertEqual(cache.get("new"), [1])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,85 @@
+# test_history.py
+
+import os
+import tempfile
+import unittest
+from contextlib import redirect_stdout
+from io import StringIO
+from unittest import mock
+
+from database import database
+from database.connection import ConnectionManager
+
+
+class HistoryPageTest(unittest.TestCase):
+    """
+    Keyset-пагинация истории поиска.
+    """
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        db = ConnectionManager(os.path.join(directory.name, "history.db"))
+        self.addCleanup(db.close_all)
+        patcher = mock.patch.object(database, "db", db)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        with redirect_stdout(StringIO()):
+            database.initialize_database()
+        # Записи двух пользователей вперемешку: у пользователя 1 — запросы 0..24
+        entries = []
+        for i in range(25):
+            entries.append((1, "name", {"name": f"q{i}", "count": 1}, i))
+            entries.append((2, "name", {"name": f"other{i}", "count": 1}, i))
+        database.add_search_history_many(entries)
+
+    def queries(self, page):
+        return [entry["search_params"]["name"] for entry in page["entries"]]
+
+    def test_first_page_is_newest(self):
+        page = database.get_search_history_page(1, limit=10)
+        self.assertEqual(self.queries(page), [f"q{i}" for i in range(24, 14, -1)])
+        self.assertTrue(page["has_older"])
+        self.assertFalse(page["has_newer"])
+
+    def test_walk_back_and_forth(self):
+        first = database.get_search_history_page(1, limit=10)
+        second = database.get_search_history_page(
+            1, before_id=first["entries"][-1]["id"], limit=10
+        )
+        third = database.get_search_history_page(
+            1, before_id=second["entries"][-1]["id"], limit=10
+        )
+        self.assertEqual(self.queries(second), [f"q{i}" for i in range(14, 4, -1)])
+        self.assertEqual(self.queries(third), [f"q{i}" for i in range(4, -1, -1)])
+        self.assertFalse(third["has_older"])
+        self.assertTrue(third["has_newer"])
+
+        back = database.get_search_history_page(
+            1, after_id=third["entries"][0]["id"], limit=10
+        )
+        self.assertEqual(self.queries(back), self.queries(second))
+        self.assertTrue(back["has_older"])
+        self.assertTrue(back["has_newer"])
+
+    def test_pages_are_stable_when_new_searches_arrive(self):
+        first = database.get_search_history_page(1, limit=10)
+        database.add_search_history(1, "name", {"name": "new", "count": 1})
+        second = database.get_search_history_page(
+            1, before_id=first["entries"][-1]["id"], limit=10
+        )
+        self.assertEqual(self.queries(second), [f"q{i}" for i in range(14, 4, -1)])
+
+    def test_empty_history(self):
+        page = database.get_search_history_page(3, limit=10)
+        self.assertEqual(page, {"entries": [], "has_older": False, "has_newer": False})
+
+    def test_entries_keep_old_format(self):
+        entry = database.get_search_history_page(1, limit=1)["entries"][0]
+        self.assertEqual(entry["search_type"], "name")
+        self.assertEqual(entry["search_params"], {"name": "q24", "count": 1})
+        self.assertEqual(entry["timestamp"], "1970-01-01T00:00:24")
+
+
+if __name__ == "__main__":
+    unittest.main()
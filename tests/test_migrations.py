@@ -0,0 +1,154 @@
+# test_migrations.py
+
+import sqlite3
+import unittest
+from contextlib import redirect_stdout
+from io import StringIO
+from unittest import mock
+
+from database import migrations
+from database.migrations import MIGRATIONS, apply_migrations, get_schema_version
+
+
+def migrate(conn):
+    with redirect_stdout(StringIO()):
+        return apply_migrations(conn)
+
+
+def tables(conn):
+    return {
+        row[0]
+        for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")
+    }
+
+
+class ApplyMigrationsTest(unittest.TestCase):
+    def setUp(self):
+        self.conn = sqlite3.connect(":memory:")
+        self.addCleanup(self.conn.close)
+
+    def test_new_database_gets_latest_schema(self):
+        self.assertEqual(migrate(self.conn), len(MIGRATIONS))
+        self.assertEqual(get_schema_version(self.conn), len(MIGRATIONS))
+        self.assertLessEqual(
+            {"search_history", "poster_file_ids", "user_data", "conversations"},
+            tables(self.conn),
+        )
+
+    def test_second_run_applies_nothing(self):
+        migrate(self.conn)
+        output = StringIO()
+        with redirect_stdout(output):
+            apply_migrations(self.conn)
+        self.assertEqual(output.getvalue(), "")
+
+    def test_failed_migration_is_rolled_back_and_retried(self):
+        def create_a(cursor):
+            cursor.execute("CREATE TABLE a (x)")
+
+        def create_b_and_fail(cursor):
+            cursor.execute("CREATE TABLE b (x)")
+            raise RuntimeError("прерванный запуск")
+
+        def create_b(cursor):
+            cursor.execute("CREATE TABLE b (x)")
+
+        with mock.patch.object(migrations, "MIGRATIONS", [create_a, create_b_and_fail]):
+            with self.assertRaises(RuntimeError):
+                migrate(self.conn)
+        self.assertEqual(get_schema_version(self.conn), 1)
+        self.assertEqual(tables(self.conn), {"a"})
+
+        with mock.patch.object(migrations, "MIGRATIONS", [create_a, create_b]):
+            self.assertEqual(migrate(self.conn), 2)
+        self.assertEqual(tables(self.conn), {"a", "b"})
+
+
+class ConvertSearchHistoryTest(unittest.TestCase):
+    """
+    Перенос истории поиска из JSON-строки в типизированные колонки.
+    """
+
+    def setUp(self):
+        self.conn = sqlite3.connect(":memory:")
+        self.addCleanup(self.conn.close)
+        version = MIGRATIONS.index(migrations._convert_search_history_to_columns)
+        with mock.patch.object(migrations, "MIGRATIONS", MIGRATIONS[:version]):
+            migrate(self.conn)
+        self.conn.executemany(
+            "INSERT INTO search_history "
+            "(id, user_id, search_type, search_params, timestamp) "
+            "VALUES (?, ?, ?, ?, ?)",
+            [
+                (
+                    3,
+                    1,
+                    "name",
+                    '{"name": "Матрица", "count": 5}',
+                    "2024-01-02T03:04:05",
+                ),
+                (
+                    7,
+                    1,
+                    "rating",
+                    '{"min_rating": 7.5, "max_rating": 9, "genre": "драма", "count": 3}',
+                    "2024-01-02T03:04:05.123456",
+                ),
+                (
+                    8,
+                    2,
+                    "budget",
+                    '{"budget_range": "1000000-5000000", "genre": "", "count": 2}',
+                    "not a date",
+                ),
+                (9, 2, "name", "{broken json", "2024-01-02T03:04:05"),
+                (10, 2, "unknown", "{}", "2024-01-02T03:04:05"),
+            ],
+        )
+        self.conn.commit()
+        migrate(self.conn)
+
+    def row(self, row_id):
+        return self.conn.execute(
+            "SELECT user_id, search_type, query, min_rating, max_rating, genre, "
+            "budget_min, budget_max, result_count, created_at "
+            "FROM search_history WHERE id = ?",
+            (row_id,),
+        ).fetchone()
+
+    def test_name_search(self):
+        self.assertEqual(
+            self.row(3), (1, 1, "Матрица", None, None, None, None, None, 5, 1704164645)
+        )
+
+    def test_rating_search_keeps_fractional_timestamp_seconds(self):
+        self.assertEqual(
+            self.row(7), (1, 2, None, 7.5, 9.0, "драма", None, None, 3, 1704164645)
+        )
+
+    def test_budget_range_is_split(self):
+        self.assertEqual(
+            self.row(8), (2, 3, None, None, None, "", 1000000, 5000000, 2, 0)
+        )
+
+    def test_broken_json_keeps_row_without_params(self):
+        self.assertEqual(
+            self.row(9), (2, 1, None, None, None, None, None, None, None, 1704164645)
+        )
+
+    def test_unknown_search_type_is_dropped(self):
+        self.assertIsNone(self.row(10))
+
+    def test_new_rows_continue_after_old_ids(self):
+        self.conn.execute(
+            "INSERT INTO search_history (user_id, search_type, created_at) "
+            "VALUES (1, 1, 0)"
+        )
+        # перенесённые записи сохраняют id, новые идут после них
+        self.assertEqual(
+            self.conn.execute("SELECT MAX(id) FROM search_history").fetchone()[0], 10
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
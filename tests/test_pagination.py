@@ -0,0 +1,56 @@
+# test_pagination.py
+
+import unittest
+
+from api.pagination import merge_pages, plan_pages
+
+
+def docs(first, count):
+    return [{"id": i} for i in range(first, first + count)]
+
+
+class PlanPagesTest(unittest.TestCase):
+    def test_single_api_page(self):
+        self.assertEqual(plan_pages(1, 10, 50), [1])
+
+    def test_limit_spans_several_api_pages(self):
+        self.assertEqual(plan_pages(1, 120, 50), [1, 2, 3])
+
+    def test_later_page_crosses_api_page_boundary(self):
+        # позиции 40..59 лежат на 1-й и 2-й страницах API
+        self.assertEqual(plan_pages(3, 20, 50), [1, 2])
+
+    def test_exact_boundary(self):
+        self.assertEqual(plan_pages(2, 50, 50), [2])
+
+
+class MergePagesTest(unittest.TestCase):
+    def test_cuts_logical_page_out_of_api_pages(self):
+        merged = merge_pages([1, 2], [docs(0, 50), docs(50, 50)], 3, 20, 50)
+        self.assertEqual([doc["id"] for doc in merged], list(range(40, 60)))
+
+    def test_skips_failed_pages(self):
+        results = [docs(0, 50), RuntimeError("503"), docs(100, 50)]
+        merged = merge_pages([1, 2, 3], results, 1, 150, 50)
+        self.assertEqual(len(merged), 100)
+        self.assertEqual(merged[50]["id"], 100)
+
+    def test_drops_duplicate_ids_keeping_order(self):
+        # выдача сдвинулась между запросами страниц: фильм 49 пришёл дважды
+        results = [docs(0, 50), docs(49, 50)]
+        merged = merge_pages([1, 2], results, 1, 100, 50)
+        ids = [doc["id"] for doc in merged]
+        self.assertEqual(ids, sorted(set(ids)))
+        self.assertEqual(ids.count(49), 1)
+
+    def test_keeps_docs_without_id(self):
+        merged = merge_pages([1], [[{"name": "a"}, {"name": "b"}]], 1, 10, 50)
+        self.assertEqual(len(merged), 2)
+
+    def test_short_last_page(self):
+        merged = merge_pages([1, 2], [docs(0, 50), docs(50, 5)], 1, 100, 50)
+        self.assertEqual(len(merged), 55)
+
+
+if __name__ == "__main__":
+    unittest.main()
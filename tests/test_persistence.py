@@ -0,0 +1,155 @@
+# test_persistence.py
+
+import os
+import tempfile
+import unittest
+from contextlib import redirect_stdout
+from io import StringIO
+from unittest import mock
+
+from telegram.ext import CommandHandler, ConversationHandler
+
+import loader
+from database import persistence
+from database.connection import ConnectionManager
+from database.migrations import apply_migrations
+from database.persistence import SQLitePersistence
+
+
+class SQLitePersistenceTest(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.db = ConnectionManager(os.path.join(directory.name, "history.db"))
+        self.addCleanup(self.db.close_all)
+        with self.db.write() as conn, redirect_stdout(StringIO()):
+            apply_migrations(conn)
+        self.now = 1000.0
+        for patcher in (
+            mock.patch.object(persistence, "db", self.db),
+            mock.patch.object(persistence.time, "time", lambda: self.now),
+        ):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def count(self, table):
+        with self.db.read() as conn:
+            return conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+
+    async def test_changes_are_flushed_in_one_write(self):
+        p = SQLitePersistence(ttl=0)
+        await p.update_user_data(1, {"name": "Матрица"})
+        await p.update_user_data(1, {"name": "Матрица", "count": 3})
+        await p.update_user_data(2, {"min_rating": 7.0})
+        await p.update_conversation("movie_search", (1, 1), 2)
+        await p.flush()
+        self.assertEqual(p.writes, 1)
+
+        restored = SQLitePersistence(ttl=0)
+        self.assertEqual(
+            await restored.get_user_data(),
+            {1: {"name": "Матрица", "count": 3}, 2: {"min_rating": 7.0}},
+        )
+        self.assertEqual(await restored.get_conversations("movie_search"), {(1, 1): 2})
+        self.assertEqual(await restored.get_conversations("movie_by_rating"), {})
+
+    async def test_flush_without_changes_does_not_write(self):
+        p = SQLitePersistence(ttl=0)
+        await p.flush()
+        self.assertEqual(p.writes, 0)
+
+    async def test_none_state_and_dropped_user_are_deleted(self):
+        p = SQLitePersistence(ttl=0)
+        await p.update_user_data(1, {"k": 1})
+        await p.update_conversation("movie_search", (1, 1), 2)
+        await p.flush()
+        await p.update_conversation("movie_search", (1, 1), None)
+        await p.drop_user_data(1)
+        await p.flush()
+        self.assertEqual(self.count("user_data"), 0)
+        self.assertEqual(self.count("conversations"), 0)
+
+    async def test_expired_rows_are_not_loaded(self):
+        p = SQLitePersistence(ttl=100)
+        await p.update_user_data(1, {"k": 1})
+        await p.update_conversation("movie_search", (1, 1), 2)
+        await p.flush()
+        self.now += 101
+        restored = SQLitePersistence(ttl=100)
+        self.assertEqual(await restored.get_user_data(), {})
+        self.assertEqual(await restored.get_conversations("movie_search"), {})
+
+    async def test_eviction(self):
+        p = SQLitePersistence(ttl=100, evict_interval=0)
+        evicted_users, ended = [], []
+        p.on_evict_user = evicted_users.append
+        p.on_evict_conversation = lambda name, key: ended.append((name, key))
+
+        await p.update_user_data(1, {"k": 1})  # неактивен, разговор брошен
+        await p.update_conversation("movie_search", (1, 1), 2)
+        await p.update_user_data(2, {"k": 2})  # неактивен, без разговора
+        await p.update_user_data(3, {"k": 3})  # неактивен, но разговор живой
+        await p.flush()
+
+        self.now += 60
+        await p.update_conversation("movie_by_rating", (3, 3), 1)
+        await p.update_user_data(4, {"k": 4})  # активен
+        await p.flush()
+
+        self.now += 60
+        await p.update_user_data(4, {"k": 4})
+        await p.flush()
+
+        self.assertEqual(ended, [("movie_search", (1, 1))])
+        self.assertEqual(sorted(evicted_users), [1, 2])
+        self.assertEqual(p.evicted, 2)
+        with self.db.read() as conn:
+            self.assertEqual(
+                conn.execute(
+                    "SELECT user_id FROM user_data ORDER BY user_id"
+                ).fetchall(),
+                [(4,)],
+            )
+            self.assertEqual(
+                conn.execute("SELECT name FROM conversations").fetchall(),
+                [("movie_by_rating",)],
+            )
+
+    async def test_failed_write_is_retried(self):
+        p = SQLitePersistence(ttl=0)
+        await p.update_user_data(1, {"k": 1})
+        with mock.patch.object(p, "_write", side_effect=RuntimeError("disk full")):
+            with redirect_stdout(StringIO()):
+                await p.flush()
+        self.assertEqual(p.writes, 0)
+        await p.flush()
+        self.assertEqual(p.writes, 1)
+        self.assertEqual(self.count("user_data"), 1)
+
+
+class EndConversationTest(unittest.TestCase):
+    def setUp(self):
+        self.handler = ConversationHandler(
+            entry_points=[CommandHandler("start", lambda update, context: None)],
+            states={},
+            fallbacks=[],
+            name="movie_search",
+        )
+        self.handler._conversations[(1, 1)] = 2
+
+    def test_ends_conversation(self):
+        self.assertTrue(loader.end_conversation(self.handler, (1, 1)))
+        self.assertTrue(loader.end_conversation(self.handler, (1, 1)))
+        self.assertNotIn((1, 1), self.handler._conversations)
+
+    def test_unchecked_ptb_version_leaves_conversation(self):
+        output = StringIO()
+        with mock.patch.object(loader, "CONVERSATIONS_PTB_MAJOR", 0):
+            with redirect_stdout(output):
+                self.assertFalse(loader.end_conversation(self.handler, (1, 1)))
+        self.assertIn((1, 1), self.handler._conversations)
+        self.assertIn("movie_search", output.getvalue())
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,110 @@
+# test_rate_limiter.py
+
+import asyncio
+import unittest
+
+from utils.rate_limiter import BULK, INTERACTIVE, OutboundScheduler, TokenBucket
+
+
+def bucket(rate, capacity, now=0.0):
+    result = TokenBucket(rate, capacity)
+    result.updated = now
+    return result
+
+
+class TokenBucketTest(unittest.TestCase):
+    def test_burst_then_wait_for_refill(self):
+        b = bucket(rate=1, capacity=3)
+        for _ in range(3):
+            self.assertEqual(b.delay(0.0), 0.0)
+            b.consume(0.0)
+        self.assertAlmostEqual(b.delay(0.0), 1.0)
+        self.assertAlmostEqual(b.delay(0.5), 0.5)
+        self.assertEqual(b.delay(1.0), 0.0)
+
+    def test_refill_is_capped_by_capacity(self):
+        b = bucket(rate=1, capacity=3)
+        b.consume(0.0, 3)
+        b.delay(100.0)
+        self.assertEqual(b.tokens, 3)
+
+    def test_cost_above_capacity_goes_into_debt(self):
+        b = bucket(rate=1, capacity=3)
+        # альбом из 10 фото разрешён при полной корзине...
+        self.assertEqual(b.delay(0.0, cost=10), 0.0)
+        b.consume(0.0, 10)
+        self.assertEqual(b.tokens, -7)
+        # ...но следующее сообщение ждёт, пока долг не восполнится
+        self.assertAlmostEqual(b.delay(0.0), 8.0)
+
+    def test_block_after_retry_after(self):
+        b = bucket(rate=1, capacity=3)
+        b.block(5.0)
+        self.assertAlmostEqual(b.delay(2.0), 3.0)
+        self.assertFalse(b.is_idle(2.0))
+        self.assertTrue(b.is_idle(5.0))
+
+
+class OutboundSchedulerTest(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.scheduler = OutboundScheduler(
+            global_rate=1000, per_chat_rate=1000, per_chat_burst=1000
+        )
+        await self.scheduler.start()
+        self.addAsyncCleanup(self.scheduler.stop, 1.0)
+        self.sent = []
+
+    def factory(self, name, delay=0.0):
+        async def send():
+            await asyncio.sleep(delay)
+            self.sent.append(name)
+            return name
+
+        return lambda: send()
+
+    async def test_returns_send_result(self):
+        self.assertEqual(await self.scheduler.send(1, self.factory("a")), "a")
+
+    async def test_keeps_order_within_chat(self):
+        results = await asyncio.gather(
+            *(self.scheduler.send(1, self.factory(i, 0.01), BULK) for i in range(5))
+        )
+        self.assertEqual(results, list(range(5)))
+        self.assertEqual(self.sent, list(range(5)))
+
+    async def test_interactive_overtakes_bulk(self):
+        # первое сообщение занимает чат, остальные копятся в очереди
+        first = asyncio.ensure_future(
+            self.scheduler.send(1, self.factory("first", 0.05))
+        )
+        await asyncio.sleep(0.01)
+        bulk = asyncio.ensure_future(self.scheduler.send(1, self.factory("bulk"), BULK))
+        await asyncio.sleep(0)
+        interactive = self.scheduler.send(1, self.factory("menu"), INTERACTIVE)
+        await asyncio.gather(first, bulk, interactive)
+        self.assertEqual(self.sent, ["first", "menu", "bulk"])
+
+    async def test_send_error_reaches_caller(self):
+        async def fail():
+            raise ValueError("boom")
+
+        with self.assertRaises(ValueError):
+            await self.scheduler.send(1, fail)
+
+    async def test_stop_cancels_unsent(self):
+        scheduler = OutboundScheduler(global_rate=1, per_chat_rate=1, per_chat_burst=1)
+        await scheduler.start()
+        sends = [
+            asyncio.ensure_future(scheduler.send(1, self.factory(i))) for i in range(3)
+        ]
+        await asyncio.sleep(0.05)
+        await scheduler.stop(timeout=0.1)
+        results = await asyncio.gather(*sends, return_exceptions=True)
+        self.assertEqual(results[0], 0)
+        self.assertTrue(
+            all(isinstance(r, asyncio.CancelledError) for r in results[1:]), results
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,120 @@
+# test_singleflight.py
+
+import asyncio
+import threading
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+
+from api.singleflight import AsyncSingleFlight, SingleFlight
+
+
+class SingleFlightTest(unittest.TestCase):
+    def setUp(self):
+        self.flight = SingleFlight()
+        self.calls = 0
+        self.release = threading.Event()
+
+    def slow(self, result=None, error=None):
+        def fn():
+            self.calls += 1
+            self.release.wait(5)
+            if error is not None:
+                raise error
+            return result
+
+        return fn
+
+    def run_concurrently(self, fn, count=5):
+        with ThreadPoolExecutor(count) as pool:
+            futures = [pool.submit(self.flight.do, "k", fn) for _ in range(count)]
+            # ждём, пока все потоки присоединятся к первому вызову
+            while self.flight.saved < count - 1:
+                threading.Event().wait(0.001)
+            self.release.set()
+            return futures
+
+    def test_concurrent_calls_are_coalesced(self):
+        futures = self.run_concurrently(self.slow(result=[1]))
+        self.assertEqual([f.result() for f in futures], [[1]] * 5)
+        self.assertEqual(self.calls, 1)
+        self.assertEqual(self.flight.saved, 4)
+
+    def test_error_reaches_every_caller(self):
+        futures = self.run_concurrently(self.slow(error=ValueError("503")))
+        for future in futures:
+            self.assertIsInstance(future.exception(), ValueError)
+        self.assertEqual(self.calls, 1)
+
+    def test_sequential_calls_are_not_coalesced(self):
+        self.release.set()
+        self.flight.do("k", self.slow(result=1))
+        self.flight.do("k", self.slow(result=2))
+        self.assertEqual(self.calls, 2)
+        self.assertEqual(self.flight.saved, 0)
+
+
+class AsyncSingleFlightTest(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.flight = AsyncSingleFlight()
+        self.calls = 0
+        self.release = asyncio.Event()
+
+    def factory(self, result=None, error=None):
+        async def fetch():
+            self.calls += 1
+            await self.release.wait()
+            if error is not None:
+                raise error
+            return result
+
+        return fetch
+
+    async def test_concurrent_calls_are_coalesced(self):
+        waiters = [
+            asyncio.ensure_future(self.flight.do("k", self.factory([1])))
+            for _ in range(5)
+        ]
+        await asyncio.sleep(0)
+        self.release.set()
+        self.assertEqual(await asyncio.gather(*waiters), [[1]] * 5)
+        self.assertEqual(self.calls, 1)
+        self.assertEqual(self.flight.saved, 4)
+
+    async def test_different_keys_run_separately(self):
+        self.release.set()
+        results = await asyncio.gather(
+            self.flight.do("a", self.factory(1)), self.flight.do("b", self.factory(2))
+        )
+        self.assertEqual(results, [1, 2])
+        self.assertEqual(self.calls, 2)
+
+    async def test_error_reaches_every_caller(self):
+        waiters = [
+            asyncio.ensure_future(self.flight.do("k", self.factory(error=ValueError())))
+            for _ in range(3)
+        ]
+        await asyncio.sleep(0)
+        self.release.set()
+        results = await asyncio.gather(*waiters, return_exceptions=True)
+        self.assertTrue(all(isinstance(r, ValueError) for r in results))
+        self.assertEqual(self.calls, 1)
+
+    async def test_cancelled_waiter_does_not_cancel_shared_call(self):
+        first = asyncio.ensure_future(self.flight.do("k", self.factory(1)))
+        second = asyncio.ensure_future(self.flight.do("k", self.factory(1)))
+        await asyncio.sleep(0)
+        first.cancel()
+        await asyncio.sleep(0)
+        self.release.set()
+        self.assertEqual(await second, 1)
+        self.assertTrue(first.cancelled())
+
+    async def test_key_is_released_after_call(self):
+        self.release.set()
+        await self.flight.do("k", self.factory(1))
+        await self.flight.do("k", self.factory(2))
+        self.assertEqual(self.calls, 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,88 @@
+# test_update_queues.py
+
+import asyncio
+import unittest
+from contextlib import redirect_stdout
+from io import StringIO
+
+from utils.update_queues import UserUpdateQueues
+
+
+class UserUpdateQueuesTest(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.log = []
+        self.running = 0
+        self.max_running = 0
+
+    async def process(self, update):
+        key, name, delay = update
+        self.running += 1
+        self.max_running = max(self.max_running, self.running)
+        self.log.append(("start", name))
+        await asyncio.sleep(delay)
+        self.log.append(("end", name))
+        self.running -= 1
+        if name == "fail":
+            raise ValueError("boom")
+
+    async def test_one_user_is_processed_in_order(self):
+        queues = UserUpdateQueues(self.process, concurrency=4)
+        for i in range(3):
+            await queues.put(1, (1, i, 0.01))
+        await queues.join()
+        self.assertEqual(
+            self.log,
+            [
+                ("start", 0),
+                ("end", 0),
+                ("start", 1),
+                ("end", 1),
+                ("start", 2),
+                ("end", 2),
+            ],
+        )
+        self.assertEqual(queues.processed, 3)
+
+    async def test_waiting_user_does_not_block_others(self):
+        queues = UserUpdateQueues(self.process, concurrency=2)
+        for i in range(3):
+            await queues.put(1, (1, f"slow{i}", 0.05))
+        await queues.put(2, (2, "fast", 0))
+        await asyncio.sleep(0.02)
+        self.assertIn(("end", "fast"), self.log)
+        self.assertEqual(queues.queue_depth(), 2)
+        await queues.join()
+
+    async def test_concurrency_limit(self):
+        queues = UserUpdateQueues(self.process, concurrency=2)
+        for key in range(5):
+            await queues.put(key, (key, key, 0.01))
+        await queues.join()
+        self.assertEqual(self.max_running, 2)
+        self.assertEqual(queues.processed, 5)
+
+    async def test_error_does_not_stop_user_queue(self):
+        queues = UserUpdateQueues(self.process)
+        await queues.put(1, (1, "fail", 0))
+        await queues.put(1, (1, "next", 0))
+        with redirect_stdout(StringIO()):
+            await queues.join()
+        self.assertEqual(queues.errors, 1)
+        self.assertEqual(queues.processed, 1)
+        self.assertEqual(queues.queue_depth(), 0)
+
+    async def test_put_waits_when_too_many_pending(self):
+        queues = UserUpdateQueues(self.process, max_pending=2)
+        await queues.put(1, (1, "a", 0.05))
+        await queues.put(1, (1, "b", 0))
+        third = asyncio.ensure_future(queues.put(2, (2, "c", 0)))
+        await asyncio.sleep(0.01)
+        self.assertFalse(third.done())
+        await queues.join()
+        await third
+        await queues.join()
+        self.assertEqual(queues.processed, 3)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,118 @@
+# test_webhook_server.py
+
+import asyncio
+import json
+import unittest
+
+from utils.webhook_server import MAX_BODY_SIZE, SECRET_HEADER, WebhookServer
+
+SECRET = "s3cret"
+UPDATE = json.dumps({"update_id": 1}).encode("utf-8")
+
+
+class WebhookServerTest(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.handled = []
+        self.release = asyncio.Event()
+        self.release.set()
+        self.server = await self.start_server()
+
+    async def start_server(self, **kwargs):
+        async def handler(update):
+            await self.release.wait()
+            self.handled.append(update)
+
+        server = WebhookServer(handler, SECRET, port=0, **kwargs)
+        await server.start()
+        self.addAsyncCleanup(server.stop, 1.0)
+        return server
+
+    async def request(
+        self, body=UPDATE, method="POST", path="/telegram", secret=SECRET, server=None
+    ):
+        server = server or self.server
+        headers = [f"{method} {path} HTTP/1.1", "Host: localhost", "Connection: close"]
+        if secret is not None:
+            headers.append(f"{SECRET_HEADER}: {secret}")
+        if body is not None:
+            headers.append(f"Content-Length: {len(body)}")
+        reader, writer = await asyncio.open_connection(server.listen, server.port)
+        writer.write(
+            ("\r\n".join(headers) + "\r\n\r\n").encode("ascii") + (body or b"")
+        )
+        await writer.drain()
+        status_line = await reader.readline()
+        writer.close()
+        await writer.wait_closed()
+        return int(status_line.split()[1])
+
+    async def test_accepts_update(self):
+        self.assertEqual(await self.request(), 200)
+        await self.server._queue.join()
+        self.assertEqual(self.handled, [{"update_id": 1}])
+        self.assertEqual(self.server.received, 1)
+
+    async def test_wrong_secret(self):
+        self.assertEqual(await self.request(secret="wrong"), 403)
+        self.assertEqual(await self.request(secret=None), 403)
+        self.assertEqual(self.server.rejected, 2)
+
+    async def test_wrong_path_and_method(self):
+        self.assertEqual(await self.request(path="/other"), 404)
+        self.assertEqual(await self.request(method="GET", body=None), 405)
+
+    async def test_bad_body(self):
+        self.assertEqual(await self.request(body=b"{not json"), 400)
+        self.assertEqual(await self.request(body=b"[1, 2]"), 400)
+        self.assertEqual(await self.request(body=b'{"message": {}}'), 400)
+
+    async def test_post_without_length(self):
+        self.assertEqual(await self.request(body=None), 411)
+
+    async def test_body_too_large(self):
+        reader, writer = await asyncio.open_connection(
+            self.server.listen, self.server.port
+        )
+        writer.write(
+            f"POST /telegram HTTP/1.1\r\nContent-Length: {MAX_BODY_SIZE + 1}\r\n\r\n".encode(
+                "ascii"
+            )
+        )
+        await writer.drain()
+        status_line = await reader.readline()
+        writer.close()
+        self.assertEqual(int(status_line.split()[1]), 413)
+
+    async def test_full_queue_answers_503(self):
+        self.release.clear()
+        server = await self.start_server(workers=1, queue_size=1)
+        # первое обновление забирает worker, второе ждёт в очереди
+        self.assertEqual(await self.request(server=server), 200)
+        await asyncio.sleep(0.01)
+        self.assertEqual(await self.request(server=server), 200)
+        self.assertEqual(await self.request(server=server), 503)
+        self.release.set()
+        await server._queue.join()
+        self.assertEqual(len(self.handled), 2)
+
+    async def test_keep_alive_serves_several_requests(self):
+        reader, writer = await asyncio.open_connection(
+            self.server.listen, self.server.port
+        )
+        request = (
+            f"POST /telegram HTTP/1.1\r\n{SECRET_HEADER}: {SECRET}\r\n"
+            f"Content-Length: {len(UPDATE)}\r\n\r\n"
+        ).encode("ascii") + UPDATE
+        statuses = []
+        for _ in range(3):
+            writer.write(request)
+            await writer.drain()
+            statuses.append(int((await reader.readline()).split()[1]))
+            while (await reader.readline()) != b"\r\n":
+                pass
+        writer.close()
+        self.assertEqual(statuses, [200, 200, 200])
+
+
+if __name__ == "__main__":
+    unittest.main()
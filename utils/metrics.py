@@ -0,0 +1,440 @@
+# metrics.py
+
+import functools
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Границы корзин гистограмм задержек по умолчанию (в секундах)
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+class _ThreadShards:
+    """
+    Значения метрики, разложенные по потокам.
+
+    Каждый поток пишет только в свой список, поэтому запись не требует
+    блокировки; блокировка берётся лишь при первой записи из нового потока
+    и при чтении, когда списки складываются.
+    """
+
+    __slots__ = ("_local", "_shards", "_lock", "_size")
+
+    def __init__(self, size):
+        self._local = threading.local()
+        self._shards = []
+        self._lock = threading.Lock()
+        self._size = size
+
+    def get(self):
+        shard = getattr(self._local, "shard", None)
+        if shard is None:
+            shard = [0] * self._size
+            with self._lock:
+                self._shards.append(shard)
+            self._local.shard = shard
+        return shard
+
+    def total(self):
+        with self._lock:
+            shards = list(self._shards)
+        totals = [0] * self._size
+        for shard in shards:
+            for index, value in enumerate(shard):
+                totals[index] += value
+        return totals
+
+
+class _ValueChild:
+    """
+    Значение метрики с конкретными метками. Вместо записи значение может
+    вычисляться функцией при каждом чтении (set_function).
+    """
+
+    __slots__ = ("_shards", "_function")
+
+    def __init__(self):
+        self._shards = _ThreadShards(1)
+        self._function = None
+
+    def set_function(self, function):
+        """
+        :param function: Функция без аргументов, возвращающая текущее значение
+        """
+        self._function = function
+
+    def value(self):
+        if self._function is not None:
+            return self._function()
+        return self._shards.total()[0]
+
+
+class _CounterChild(_ValueChild):
+    __slots__ = ()
+
+    def inc(self, amount=1):
+        self._shards.get()[0] += amount
+
+
+class _GaugeChild(_ValueChild):
+    __slots__ = ("_value",)
+
+    def __init__(self):
+        super().__init__()
+        self._value = 0
+
+    def set(self, value):
+        self._value = value
+
+    def value(self):
+        if self._function is not None:
+            return self._function()
+        return self._value
+
+
+class _HistogramChild:
+    __slots__ = ("bounds", "_shards")
+
+    def __init__(self, bounds):
+        self.bounds = bounds
+        # Счётчики корзин (последняя — +Inf) и сумма наблюдений
+        self._shards = _ThreadShards(len(bounds) + 2)
+
+    def observe(self, seconds):
+        shard = self._shards.get()
+        shard[bisect_left(self.bounds, seconds)] += 1
+        shard[-1] += seconds
+
+    def since(self, started):
+        """
+        Записывает время, прошедшее с момента started (time.monotonic()).
+        """
+        self.observe(time.monotonic() - started)
+
+    @contextmanager
+    def time(self):
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            self.observe(time.monotonic() - started)
+
+    def snapshot(self):
+        """
+        :return: (накопленные счётчики корзин, количество, сумма)
+        """
+        totals = self._shards.total()
+        cumulative = []
+        running = 0
+        for count in totals[:-1]:
+            running += count
+            cumulative.append(running)
+        return cumulative, running, totals[-1]
+
+
+class _Metric:
+    type = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children = {}
+        self._lock = threading.Lock()
+
+    def _new_child(self):
+        raise NotImplementedError
+
+    def labels(self, *values):
+        """
+        Возвращает значение метрики для конкретных меток. Его стоит
+        сохранить и переиспользовать, чтобы не искать при каждой записи.
+        """
+        if len(values) != len(self.labelnames):
+            raise ValueError(f"{self.name}: ожидаются метки {self.labelnames}")
+        values = tuple(str(value) for value in values)
+        child = self._children.get(values)
+        if child is None:
+            with self._lock:
+                child = self._children.setdefault(values, self._new_child())
+        return child
+
+    def _labels_text(self, values, extra=()):
+        pairs = list(zip(self.labelnames, values)) + list(extra)
+        if not pairs:
+            return ""
+        return (
+            "{"
+            + ",".join(f'{name}="{_escape_label(value)}"' for name, value in pairs)
+            + "}"
+        )
+
+    def render(self):
+        lines = [
+            f"# HELP {self.name} {self.documentation}",
+            f"# TYPE {self.name} {self.type}",
+        ]
+        for values, child in list(self._children.items()):
+            try:
+                lines.extend(self._render_child(values, child))
+            except Exception as e:
+                print(f"Ошибка при чтении метрики {self.name}: {e}")
+        return lines
+
+    def _render_child(self, values, child):
+        return [f"{self.name}{self._labels_text(values)} {_format(child.value())}"]
+
+
+class Counter(_Metric):
+    type = "counter"
+
+    def _new_child(self):
+        return _CounterChild()
+
+    def inc(self, amount=1):
+        self.labels().inc(amount)
+
+    def set_function(self, function):
+        self.labels().set_function(function)
+
+
+class Gauge(_Metric):
+    type = "gauge"
+
+    def _new_child(self):
+        return _GaugeChild()
+
+    def set(self, value):
+        self.labels().set(value)
+
+    def set_function(self, function):
+        self.labels().set_function(function)
+
+
+class Histogram(_Metric):
+    type = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.bounds = tuple(sorted(buckets))
+
+    def _new_child(self):
+        return _HistogramChild(self.bounds)
+
+    def observe(self, seconds):
+        self.labels().observe(seconds)
+
+    def since(self, started):
+        self.labels().since(started)
+
+    def time(self):
+        return self.labels().time()
+
+    def _render_child(self, values, child):
+        cumulative, count, total = child.snapshot()
+        lines = []
+        bounds = [_format(bound) for bound in self.bounds] + ["+Inf"]
+        for bound, running in zip(bounds, cumulative):
+            labels = self._labels_text(values, [("le", bound)])
+            lines.append(f"{self.name}_bucket{labels} {running}")
+        labels = self._labels_text(values)
+        lines.append(f"{self.name}_sum{labels} {_format(total)}")
+        lines.append(f"{self.name}_count{labels} {count}")
+        return lines
+
+
+def _escape_label(value):
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format(value):
+    if isinstance(value, float):
+        return repr(value)
+    return str(int(value))
+
+
+class MetricsRegistry:
+    """
+    Набор метрик процесса и их вывод в текстовом формате Prometheus.
+    """
+
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def _register(self, metric):
+        # Повторная регистрация возвращает уже существующую метрику
+        with self._lock:
+            return self._metrics.setdefault(metric.name, metric)
+
+    def counter(self, name, documentation, labelnames=()):
+        return self._register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name, documentation, labelnames=()):
+        return self._register(Gauge(name, documentation, labelnames))
+
+    def histogram(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        return self._register(Histogram(name, documentation, labelnames, buckets))
+
+    def render(self):
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = MetricsRegistry()
+
+# Время от получения запроса пользователя до отправки первого фильма
+time_to_first_result = REGISTRY.histogram(
+    "bot_time_to_first_result_seconds",
+    "Время от запроса пользователя до отправки первого фильма",
+)
+
+handler_latency = REGISTRY.histogram(
+    "bot_handler_duration_seconds",
+    "Время работы обработчика обновления",
+    ["handler"],
+)
+handler_errors = REGISTRY.counter(
+    "bot_handler_errors_total",
+    "Исключения в обработчиках обновлений",
+    ["handler"],
+)
+
+api_latency = REGISTRY.histogram(
+    "kinopoisk_request_duration_seconds",
+    "Время запроса к API Кинопоиска",
+    ["endpoint"],
+)
+api_errors = REGISTRY.counter(
+    "kinopoisk_request_errors_total",
+    "Неудачные запросы к API Кинопоиска",
+    ["endpoint"],
+)
+
+telegram_send_latency = REGISTRY.histogram(
+    "telegram_send_duration_seconds",
+    "Время вызова Bot API при отправке или редактировании сообщения",
+    ["priority"],
+)
+telegram_send_wait = REGISTRY.histogram(
+    "telegram_send_queue_wait_seconds",
+    "Время ожидания сообщения в очереди отправки",
+    ["priority"],
+)
+telegram_send_errors = REGISTRY.counter(
+    "telegram_send_errors_total",
+    "Ошибки отправки в Telegram по типу исключения",
+    ["error"],
+)
+
+cache_hits = REGISTRY.counter("bot_cache_hits_total", "Попадания в кэш", ["cache"])
+cache_misses = REGISTRY.counter("bot_cache_misses_total", "Промахи кэша", ["cache"])
+cache_hit_ratio = REGISTRY.gauge(
+    "bot_cache_hit_ratio", "Доля попаданий в кэш с момента запуска", ["cache"]
+)
+queue_depth = REGISTRY.gauge(
+    "bot_queue_depth", "Количество элементов, ожидающих в очереди", ["queue"]
+)
+
+
+def register_cache(name, cache):
+    """
+    Публикует счётчики hits/misses объекта кэша как метрики.
+
+    :param name: Значение метки cache
+    :param cache: Объект с атрибутами hits и misses
+    """
+    cache_hits.labels(name).set_function(lambda: cache.hits)
+    cache_misses.labels(name).set_function(lambda: cache.misses)
+
+    def ratio():
+        total = cache.hits + cache.misses
+        return cache.hits / total if total else 0.0
+
+    cache_hit_ratio.labels(name).set_function(ratio)
+
+
+def timed_handler(callback, name=None):
+    """
+    Оборачивает колбэк обработчика Telegram замером времени и подсчётом
+    исключений (метка handler — имя колбэка).
+    """
+    name = name or callback.__name__
+    latency = handler_latency.labels(name)
+    failures = handler_errors.labels(name)
+
+    @functools.wraps(callback)
+    async def wrapper(update, context):
+        started = time.monotonic()
+        try:
+            return await callback(update, context)
+        except Exception:
+            failures.inc()
+            raise
+        finally:
+            latency.since(started)
+
+    return wrapper
+
+
+class MetricsServer:
+    """
+    HTTP-сервер, отдающий метрики по адресу /metrics в формате Prometheus.
+
+    Работает в отдельном потоке и не мешает циклу событий бота.
+    """
+
+    def __init__(self, registry=REGISTRY, listen="127.0.0.1", port=9100):
+        """
+        :param registry: Набор метрик (MetricsRegistry)
+        :param listen: Адрес, на котором слушает сервер
+        :param port: Порт (0 — выбрать свободный)
+        """
+        self.registry = registry
+        self.listen = listen
+        self.port = port
+        self._server = None
+        self._thread = None
+
+    def start(self):
+        registry = self.registry
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split("?", 1)[0] != "/metrics":
+                    self.send_error(404)
+                    return
+                body = registry.render().encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", CONTENT_TYPE)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass  # Не засоряем вывод каждым запросом Prometheus
+
+        self._server = ThreadingHTTPServer((self.listen, self.port), Handler)
+        self._server.daemon_threads = True
+        # Настоящий порт, если был запрошен 0
+        self.port = self._server.server_address[1]
+        self._thread = threading.Thread(
+            target=self._server.serve_forever, name="metrics-server", daemon=True
+        )
+        self._thread.start()
+
+    def stop(self):
+        if self._server is None:
+            return
+        self._server.shutdown()
+        self._server.server_close()
+        self._thread.join()
+        self._server = None
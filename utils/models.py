@@ -1,32 +1,109 @@
 # models.py
 
-from dataclasses import dataclass
-from typing import List, Optional
+import sys
+from typing import Iterable, Optional
 
 
-@dataclass
 class Movie:
-    title: str
-    description: str
-    rating: Optional[float]
-    year: Optional[int]
-    genres: List[str]
-    age_rating: Optional[int]
-    poster_url: Optional[str]
-    budget: Optional[int]  # Новое поле для бюджета
+    """
+    Фильм из ответа API Кинопоиска.
+
+    Хранится в слотах без __dict__ и не ссылается на словарь из ответа API,
+    поэтому большие выборки и кэши фильмов занимают меньше памяти. Жанры
+    хранятся кортежем интернированных строк: названий жанров немного, и
+    все фильмы ссылаются на одни и те же объекты.
+
+    Все поля разбираются сразу. Ленивый разбор описания и жанров пришлось
+    убрать: для него фильм держал ссылку на список жанров из ответа API и
+    после освобождения ответа занимал больше памяти, чем без него, а
+    описание и так было той же строкой из ответа.
+    """
+
+    __slots__ = (
+        "title",
+        "description",
+        "rating",
+        "year",
+        "genres",
+        "age_rating",
+        "poster_url",
+        "budget",
+        "movie_id",
+    )
+
+    def __init__(
+        self,
+        title: str,
+        description: str,
+        rating: Optional[float],
+        year: Optional[int],
+        genres: Iterable[str],
+        age_rating: Optional[int],
+        poster_url: Optional[str],
+        budget: Optional[int],  # Новое поле для бюджета
+        movie_id: Optional[int] = None,  # ID фильма на Кинопоиске
+    ):
+        self.title = title
+        self.description = description
+        self.rating = rating
+        self.year = year
+        self.genres = tuple(genres)
+        self.age_rating = age_rating
+        self.poster_url = poster_url
+        self.budget = budget
+        self.movie_id = movie_id
+
+    def _fields(self):
+        return (
+            self.title,
+            self.description,
+            self.rating,
+            self.year,
+            self.genres,
+            self.age_rating,
+            self.poster_url,
+            self.budget,
+            self.movie_id,
+        )
+
+    def __eq__(self, other):
+        if other.__class__ is not self.__class__:
+            return NotImplemented
+        return self._fields() == other._fields()
+
+    def __repr__(self):
+        return (
+            f"Movie(title={self.title!r}, rating={self.rating!r}, "
+            f"year={self.year!r}, movie_id={self.movie_id!r})"
+        )
 
     @classmethod
     def from_api_data(cls, data):
         title = data.get("name") or data.get("alternativeName") or "Без названия"
-        description = data.get("description") or "Описание отсутствует."
-        rating = data.get("rating", {}).get("kp") or data.get("rating", {}).get("imdb")
-        year = data.get("year") or "Неизвестно"
-        genres = [
-            genre.get("name") for genre in data.get("genres", []) if genre.get("name")
-        ]
-        age_rating = data.get("ageRating")
-        poster_url = data.get("poster", {}).get("url")
-        budget = data.get("budget", {}).get("value")  # Получение значения бюджета
+        rating = data.get("rating") or {}
         return cls(
-            title, description, rating, year, genres, age_rating, poster_url, budget
+            title,
+            data.get("description") or "Описание отсутствует.",
+            rating.get("kp") or rating.get("imdb"),
+            data.get("year") or "Неизвестно",
+            [
+                sys.intern(genre["name"])
+                for genre in data.get("genres") or []
+                if genre.get("name")
+            ],
+            data.get("ageRating"),
+            (data.get("poster") or {}).get("url"),
+            (data.get("budget") or {}).get("value"),  # Получение значения бюджета
+            data.get("id"),
         )
+
+    @classmethod
+    def from_api_docs(cls, docs):
+        """
+        Преобразует весь список docs из ответа API за один проход.
+
+        :param docs: Список словарей фильмов
+        :return: Список объектов Movie
+        """
+        from_api_data = cls.from_api_data
+        return [from_api_data(data) for data in docs]
@@ -0,0 +1,281 @@
+# rate_limiter.py
+
+import asyncio
+import time
+from collections import deque
+
+from telegram.error import RetryAfter
+
+from utils.metrics import (
+    telegram_send_errors,
+    telegram_send_latency,
+    telegram_send_wait,
+)
+
+# Приоритеты исходящих сообщений: ответы на действия пользователя (меню,
+# подсказки) обгоняют массовую отправку результатов поиска
+INTERACTIVE = 0
+BULK = 1
+
+_PRIORITY_NAMES = {INTERACTIVE: "interactive", BULK: "bulk"}
+
+
+class TokenBucket:
+    """
+    Корзина токенов: rate токенов в секунду, не более capacity за раз.
+
+    Отправка дороже capacity (альбом) разрешается при полной корзине и
+    уводит её в долг, поэтому следующая ждёт, пока долг не восполнится.
+    """
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0
+
+    def _refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def delay(self, now, cost=1):
+        """
+        Возвращает, через сколько секунд можно будет потратить cost токенов.
+        """
+        self._refill(now)
+        cost = min(cost, self.capacity)
+        wait = max(0.0, (cost - self.tokens) / self.rate)
+        return max(wait, self.blocked_until - now)
+
+    def consume(self, now, cost=1):
+        self._refill(now)
+        self.tokens -= cost
+
+    def block(self, until):
+        """
+        Запрещает отправку до момента until (после ответа 429 от Telegram).
+        """
+        self.blocked_until = max(self.blocked_until, until)
+
+    def is_idle(self, now):
+        self._refill(now)
+        return self.tokens >= self.capacity and self.blocked_until <= now
+
+
+class _Job:
+    __slots__ = (
+        "chat_id",
+        "factory",
+        "priority",
+        "cost",
+        "future",
+        "attempts",
+        "queued_at",
+    )
+
+    def __init__(self, chat_id, factory, priority, cost, future):
+        self.chat_id = chat_id
+        self.factory = factory
+        self.priority = priority
+        self.cost = cost
+        self.future = future
+        self.attempts = 0
+        self.queued_at = time.monotonic()
+
+
+class OutboundScheduler:
+    """
+    Центральная очередь исходящих сообщений Telegram.
+
+    Соблюдает общий лимит бота и лимит на каждый чат (корзины токенов),
+    учитывает retry_after из ответов 429 и отправляет интерактивные ответы
+    раньше массовой выдачи результатов. Сообщения в один чат уходят строго
+    по очереди, поэтому их порядок сохраняется.
+    """
+
+    # Когда корзин становится больше, простаивающие удаляются
+    MAX_IDLE_BUCKETS = 10000
+
+    def __init__(
+        self, global_rate=30, per_chat_rate=1, per_chat_burst=3, max_retries=3
+    ):
+        """
+        :param global_rate: Сообщений в секунду для бота в целом
+        :param per_chat_rate: Сообщений в секунду в один чат
+        :param per_chat_burst: Сколько сообщений в чат можно отправить подряд
+        :param max_retries: Сколько раз повторять отправку после ответа 429
+        """
+        self.per_chat_rate = per_chat_rate
+        self.per_chat_burst = per_chat_burst
+        self.max_retries = max_retries
+
+        self._global = TokenBucket(global_rate, global_rate)
+        self._chats = {}
+        self._busy = set()
+        self._queues = {INTERACTIVE: deque(), BULK: deque()}
+        self._wakeup = asyncio.Event()
+        self._task = None
+        # Выполняющиеся отправки (ссылки нужны, чтобы задачи не собрал GC)
+        self._sending = set()
+        self._latency = {
+            priority: telegram_send_latency.labels(name)
+            for priority, name in _PRIORITY_NAMES.items()
+        }
+        self._wait = {
+            priority: telegram_send_wait.labels(name)
+            for priority, name in _PRIORITY_NAMES.items()
+        }
+
+    async def start(self):
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self, timeout=5.0):
+        """
+        Даёт очереди до timeout секунд на отправку оставшихся сообщений,
+        затем останавливает планировщик.
+        """
+        if self._task is None:
+            return
+        deadline = time.monotonic() + timeout
+        while (self.queue_depth() or self._busy) and time.monotonic() < deadline:
+            await asyncio.sleep(0.05)
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+        if self._sending:
+            await asyncio.wait(
+                self._sending, timeout=max(0.0, deadline - time.monotonic())
+            )
+            for task in self._sending:
+                task.cancel()
+            await asyncio.gather(*self._sending, return_exceptions=True)
+        for queue in self._queues.values():
+            while queue:
+                job = queue.popleft()
+                if not job.future.done():
+                    job.future.cancel()
+
+    def queue_depth(self):
+        return sum(len(queue) for queue in self._queues.values())
+
+    async def send(self, chat_id, factory, priority=INTERACTIVE, cost=1):
+        """
+        Ставит отправку в очередь и ждёт её результата.
+
+        :param chat_id: ID чата-получателя
+        :param factory: Функция без аргументов, возвращающая корутину отправки
+        :param priority: INTERACTIVE или BULK
+        :param cost: Сколько сообщений расходует отправка (для альбомов)
+        :return: Результат корутины отправки
+        """
+        if self._task is None:
+            # Планировщик не запущен — отправляем напрямую
+            return await self._call(factory, priority)
+        future = asyncio.get_running_loop().create_future()
+        self._queues[priority].append(_Job(chat_id, factory, priority, cost, future))
+        self._wakeup.set()
+        return await future
+
+    def _chat_bucket(self, chat_id):
+        bucket = self._chats.get(chat_id)
+        if bucket is None:
+            if len(self._chats) >= self.MAX_IDLE_BUCKETS:
+                self._prune_buckets()
+            bucket = TokenBucket(self.per_chat_rate, self.per_chat_burst)
+            self._chats[chat_id] = bucket
+        return bucket
+
+    def _prune_buckets(self):
+        now = time.monotonic()
+        for chat_id, bucket in list(self._chats.items()):
+            if chat_id not in self._busy and bucket.is_idle(now):
+                del self._chats[chat_id]
+
+    def _next_job(self):
+        """
+        Выбирает следующее сообщение, которое можно отправить прямо сейчас.
+
+        :return: (задание, None) или (None, через сколько секунд проверить снова)
+        """
+        now = time.monotonic()
+        retry_in = None
+        for priority in (INTERACTIVE, BULK):
+            queue = self._queues[priority]
+            skipped_chats = set()
+            for index, job in enumerate(queue):
+                if job.chat_id in skipped_chats:
+                    continue
+                # Пока в чат уходит предыдущее сообщение, следующее ждёт
+                skipped_chats.add(job.chat_id)
+                if job.chat_id in self._busy:
+                    continue
+                wait = max(
+                    self._chat_bucket(job.chat_id).delay(now, job.cost),
+                    self._global.delay(now, job.cost),
+                )
+                if wait > 0:
+                    retry_in = wait if retry_in is None else min(retry_in, wait)
+                    continue
+                del queue[index]
+                return job, None
+        return None, retry_in
+
+    async def _run(self):
+        while True:
+            job, retry_in = self._next_job()
+            if job is None:
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), retry_in)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            now = time.monotonic()
+            self._global.consume(now, job.cost)
+            self._chat_bucket(job.chat_id).consume(now, job.cost)
+            self._busy.add(job.chat_id)
+            task = asyncio.create_task(self._execute(job))
+            self._sending.add(task)
+            task.add_done_callback(self._sending.discard)
+
+    async def _call(self, factory, priority):
+        started = time.monotonic()
+        try:
+            return await factory()
+        except Exception as e:
+            telegram_send_errors.labels(type(e).__name__).inc()
+            raise
+        finally:
+            self._latency[priority].since(started)
+
+    async def _execute(self, job):
+        try:
+            if job.future.done():
+                return  # Отправитель уже отменил ожидание
+            self._wait[job.priority].since(job.queued_at)
+            result = await self._call(job.factory, job.priority)
+        except RetryAfter as e:
+            job.attempts += 1
+            if job.attempts > self.max_retries:
+                if not job.future.done():
+                    job.future.set_exception(e)
+            else:
+                until = time.monotonic() + e.retry_after
+                self._chat_bucket(job.chat_id).block(until)
+                self._queues[job.priority].appendleft(job)
+        except asyncio.CancelledError:
+            job.future.cancel()
+            raise
+        except Exception as e:
+            if not job.future.done():
+                job.future.set_exception(e)
+        else:
+            if not job.future.done():
+                job.future.set_result(result)
+        finally:
+            self._busy.discard(job.chat_id)
+            self._wakeup.set()
@@ -0,0 +1,134 @@
+# rendering.py
+
+from collections import OrderedDict
+from html import escape  # Для экранирования специальных символов
+
+# Telegram ограничивает подпись к фото 1024 символами, считая их в единицах
+# UTF-16: эмодзи в подписи занимает две единицы
+CAPTION_LIMIT = 1024
+DESCRIPTION_LIMIT = 300
+# Если на описание остаётся меньше места, подпись выводится без него
+MIN_DESCRIPTION_LENGTH = 20
+ELLIPSIS = "..."
+
+
+def utf16_len(text):
+    """
+    Длина строки так, как её считает Telegram.
+    """
+    return len(text.encode("utf-16-le")) // 2
+
+
+def truncate(text, limit):
+    """
+    Обрезает text до limit единиц UTF-16, добавляя многоточие, и не
+    разрывает HTML-сущности вроде &amp;.
+    """
+    if utf16_len(text) <= limit:
+        return text
+    limit = max(0, limit - len(ELLIPSIS))
+    # errors="ignore" отбрасывает половину разрезанной суррогатной пары
+    text = text.encode("utf-16-le")[: limit * 2].decode("utf-16-le", errors="ignore")
+    amp = text.rfind("&")
+    if amp != -1 and ";" not in text[amp:]:
+        text = text[:amp]
+    return text.rstrip() + ELLIPSIS
+
+
+def render_caption(movie, limit=CAPTION_LIMIT):
+    """
+    Формирует подпись к фильму, которая гарантированно укладывается в limit.
+
+    Сначала считается длина всех строк, кроме описания; описание получает
+    оставшееся место. Если места почти нет, подпись выводится без описания
+    и обрезается целиком.
+
+    :param movie: Объект Movie с информацией о фильме.
+    :param limit: Максимальная длина подписи (в единицах UTF-16).
+    """
+    # Экранирование всех переменных для предотвращения ошибок
+    title = escape(movie.title)
+    rating = escape(str(movie.rating)) if movie.rating else "N/A"
+    year = escape(str(movie.year)) if movie.year else "Неизвестно"
+    genres = escape(", ".join(movie.genres))
+    age_rating = escape(str(movie.age_rating)) if movie.age_rating else "N/A"
+    budget = (
+        escape(f"${int(movie.budget):,}".replace(",", " ")) if movie.budget else None
+    )
+
+    head = f"📌 Название: {title}\n"
+    details = (
+        f"⭐ Рейтинг: {rating}\n"
+        f"📅 Год: {year}\n"
+        f"🎭 Жанр: {genres}\n"
+        f"🔞 Возрастной рейтинг: {age_rating}+"
+    )
+    if budget:
+        details += f"\n💸 Бюджет: {budget}"
+
+    description_label = "📝 Описание: "
+    room = limit - utf16_len(head + description_label + "\n" + details + "\n")
+    if room >= MIN_DESCRIPTION_LENGTH:
+        description = movie.description
+        if len(description) > DESCRIPTION_LIMIT:
+            description = description[:DESCRIPTION_LIMIT].rstrip() + ELLIPSIS
+        description = truncate(escape(description), room)
+        return f"{head}{description_label}{description}\n{details}\n"
+    return truncate(head + details, limit)
+
+
+class CaptionRenderer:
+    """
+    Кэш готовых подписей к фильмам.
+
+    Популярный фильм попадает в выдачу многим пользователям, поэтому его
+    подпись формируется один раз и хранится по id фильма (LRU, не более
+    max_entries). Если рейтинг, бюджет или название фильма изменились,
+    подпись формируется заново.
+    """
+
+    def __init__(self, max_entries=10000, limit=CAPTION_LIMIT):
+        """
+        :param max_entries: Сколько подписей хранить
+        :param limit: Максимальная длина подписи (в единицах UTF-16)
+        """
+        self.max_entries = max_entries
+        self.limit = limit
+        # movie_id -> (отпечаток полей фильма, подпись)
+        self._captions = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def _fingerprint(movie):
+        return (movie.title, movie.rating, movie.year, movie.age_rating, movie.budget)
+
+    def render(self, movie):
+        """
+        Возвращает подпись к фильму, по возможности из кэша.
+
+        :param movie: Объект Movie с информацией о фильме.
+        """
+        if movie.movie_id is None:
+            return render_caption(movie, self.limit)
+        fingerprint = self._fingerprint(movie)
+        entry = self._captions.get(movie.movie_id)
+        if entry is not None and entry[0] == fingerprint:
+            self._captions.move_to_end(movie.movie_id)
+            self.hits += 1
+            return entry[1]
+
+        self.misses += 1
+        caption = render_caption(movie, self.limit)
+        self._captions[movie.movie_id] = (fingerprint, caption)
+        self._captions.move_to_end(movie.movie_id)
+        while len(self._captions) > self.max_entries:
+            self._captions.popitem(last=False)
+        return caption
+
+    def stats(self):
+        return {
+            "entries": len(self._captions),
+            "hits": self.hits,
+            "misses": self.misses,
+        }
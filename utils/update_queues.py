@@ -0,0 +1,80 @@
+# update_queues.py
+
+import asyncio
+from collections import deque
+
+
+class UserUpdateQueues:
+    """
+    Очереди обновлений по пользователям.
+
+    Обновления одного пользователя обрабатываются строго по очереди, разных
+    пользователей — параллельно, но не больше concurrency одновременно.
+    Обновление, ждущее завершения предыдущего обновления своего
+    пользователя, не занимает ни слот concurrency, ни вызывающую задачу
+    (цикл приёма обновлений или worker webhook): put только ставит его в
+    очередь пользователя.
+    """
+
+    def __init__(self, process, concurrency=256, max_pending=1024):
+        """
+        :param process: Корутинная функция, обрабатывающая одно обновление
+        :param concurrency: Сколько обновлений обрабатывать одновременно
+        :param max_pending: Максимум принятых, но ещё не обработанных
+            обновлений; дальше put ждёт, замедляя приём
+        """
+        self.process = process
+        self.concurrency = concurrency
+        self.max_pending = max_pending
+        self._slots = asyncio.Semaphore(concurrency)
+        self._pending = asyncio.Semaphore(max_pending)
+        # ключ пользователя -> обновления, ожидающие обработки
+        self._queues = {}
+        self._tasks = set()
+        self.processed = 0
+        self.errors = 0
+
+    async def put(self, key, update):
+        """
+        Ставит обновление в очередь пользователя key.
+        """
+        await self._pending.acquire()
+        queue = self._queues.get(key)
+        if queue is None:
+            queue = self._queues[key] = deque()
+            task = asyncio.create_task(self._drain(key, queue))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+        queue.append(update)
+
+    async def _drain(self, key, queue):
+        """
+        Обрабатывает очередь одного пользователя, пока она не опустеет.
+        """
+        try:
+            while queue:
+                update = queue.popleft()
+                try:
+                    async with self._slots:
+                        await self.process(update)
+                    self.processed += 1
+                except Exception as e:
+                    self.errors += 1
+                    print(f"Ошибка при обработке обновления: {e}")
+                finally:
+                    self._pending.release()
+        finally:
+            del self._queues[key]
+
+    async def join(self):
+        """
+        Ждёт, пока будут обработаны все принятые обновления.
+        """
+        while self._tasks:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+
+    def queue_depth(self):
+        """
+        Количество обновлений, ожидающих своей очереди.
+        """
+        return sum(len(queue) for queue in self._queues.values())
@@ -0,0 +1,186 @@
+# webhook_server.py
+
+import asyncio
+import hmac
+import json
+
+# Заголовок, в котором Telegram передаёт secret_token из setWebhook
+SECRET_HEADER = "x-telegram-bot-api-secret-token"
+# Обновление Telegram заметно меньше; всё крупнее отклоняется
+MAX_BODY_SIZE = 1024 * 1024
+# Сколько секунд держать простаивающее keep-alive соединение
+IDLE_TIMEOUT = 75
+
+_REASONS = {
+    200: "OK",
+    400: "Bad Request",
+    403: "Forbidden",
+    404: "Not Found",
+    405: "Method Not Allowed",
+    411: "Length Required",
+    413: "Payload Too Large",
+    503: "Service Unavailable",
+}
+
+
+class WebhookServer:
+    """
+    Минимальный HTTP-сервер для приёма обновлений Telegram через webhook.
+
+    Проверяет секретный токен, сразу отвечает Telegram и ставит обновление
+    в очередь, которую разбирают workers обработчиков. Если очередь
+    заполнена, отвечает 503, и Telegram повторит доставку позже.
+    """
+
+    def __init__(
+        self,
+        handler,
+        secret_token,
+        listen="127.0.0.1",
+        port=8443,
+        url_path="/telegram",
+        workers=8,
+        queue_size=1000,
+    ):
+        """
+        :param handler: Корутинная функция, принимающая обновление (dict)
+        :param secret_token: Ожидаемое значение заголовка секретного токена
+        :param listen: Адрес, на котором слушает сервер
+        :param port: Порт (0 — выбрать свободный)
+        :param url_path: Путь, на который Telegram отправляет обновления
+        :param workers: Сколько обновлений обрабатывать одновременно
+        :param queue_size: Максимум принятых, но ещё не обработанных обновлений
+        """
+        self.handler = handler
+        self.secret_token = secret_token.encode("utf-8")
+        self.listen = listen
+        self.port = port
+        self.url_path = url_path
+        self.workers = workers
+        self.queue_size = queue_size
+
+        self.received = 0
+        self.rejected = 0
+        self.errors = 0
+
+        self._queue = None
+        self._server = None
+        self._worker_tasks = []
+        self._connections = set()
+
+    async def start(self):
+        self._queue = asyncio.Queue(self.queue_size)
+        self._worker_tasks = [
+            asyncio.create_task(self._worker()) for _ in range(self.workers)
+        ]
+        self._server = await asyncio.start_server(
+            self._handle_connection, self.listen, self.port
+        )
+        # Настоящий порт, если был запрошен 0
+        self.port = self._server.sockets[0].getsockname()[1]
+
+    async def stop(self, timeout=5.0):
+        """
+        Перестаёт принимать запросы, даёт workers до timeout секунд на
+        обработку принятых обновлений и останавливает их.
+        """
+        if self._server is None:
+            return
+        self._server.close()
+        for writer in list(self._connections):
+            writer.close()
+        await self._server.wait_closed()
+        self._server = None
+        try:
+            await asyncio.wait_for(self._queue.join(), timeout)
+        except asyncio.TimeoutError:
+            pass
+        for task in self._worker_tasks:
+            task.cancel()
+        await asyncio.gather(*self._worker_tasks, return_exceptions=True)
+        self._worker_tasks = []
+
+    def queue_depth(self):
+        return self._queue.qsize() if self._queue is not None else 0
+
+    async def _worker(self):
+        while True:
+            update = await self._queue.get()
+            try:
+                await self.handler(update)
+            except Exception as e:
+                self.errors += 1
+                print(f"Ошибка при обработке обновления из webhook: {e}")
+            finally:
+                self._queue.task_done()
+
+    async def _handle_connection(self, reader, writer):
+        self._connections.add(writer)
+        try:
+            keep_alive = True
+            while keep_alive:
+                try:
+                    request_line = await asyncio.wait_for(
+                        reader.readline(), IDLE_TIMEOUT
+                    )
+                except asyncio.TimeoutError:
+                    break
+                if not request_line:
+                    break
+                status, keep_alive = await self._handle_request(request_line, reader)
+                writer.write(
+                    f"HTTP/1.1 {status} {_REASONS[status]}\r\n"
+                    f"Content-Length: 0\r\n"
+                    f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n"
+                    f"\r\n".encode("ascii")
+                )
+                await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError, ValueError):
+            pass  # Клиент отключился или прислал некорректный запрос
+        finally:
+            self._connections.discard(writer)
+            writer.close()
+
+    async def _handle_request(self, request_line, reader):
+        """
+        Читает один запрос и возвращает (HTTP-статус, оставить ли соединение).
+        """
+        method, path, version = request_line.decode("latin-1").split()
+        headers = {}
+        while True:
+            line = await reader.readline()
+            if line in (b"\r\n", b"\n", b""):
+                break
+            name, _, value = line.decode("latin-1").partition(":")
+            headers[name.strip().lower()] = value.strip()
+
+        keep_alive = version == "HTTP/1.1" and headers.get("connection") != "close"
+        length = headers.get("content-length", "0" if method != "POST" else None)
+        if length is None or not length.isdigit():
+            # Без длины тело запроса не отделить от следующего запроса
+            return 411, False
+        length = int(length)
+        if length > MAX_BODY_SIZE:
+            return 413, False
+        body = await reader.readexactly(length)
+
+        if path.split("?", 1)[0] != self.url_path:
+            return 404, keep_alive
+        if method != "POST":
+            return 405, keep_alive
+        secret = headers.get(SECRET_HEADER, "").encode("utf-8")
+        if not hmac.compare_digest(secret, self.secret_token):
+            self.rejected += 1
+            return 403, keep_alive
+        try:
+            update = json.loads(body)
+        except ValueError:
+            return 400, keep_alive
+        if not isinstance(update, dict) or "update_id" not in update:
+            return 400, keep_alive
+        try:
+            self._queue.put_nowait(update)
+        except asyncio.QueueFull:
+            return 503, keep_alive
+        self.received += 1
+        return 200, keep_alive